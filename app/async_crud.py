@@ -0,0 +1,75 @@
+"""Async variants of the functions in crud.
+
+Each one runs the sync implementation through AsyncSession.run_sync, which
+drives it on the asyncio connection (asyncpg/aiosqlite) without a thread, so
+query logic, caching and search indexing stay defined in one place.
+"""
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import counts, crud, sales
+
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+
+    return wrapper
+
+
+get_authors = _async(crud.get_authors)
+get_author_versions = _async(crud.get_author_versions)
+get_author = _async(crud.get_author)
+get_authors_batch = _async(crud.get_authors_batch)
+create_author = _async(crud.create_author)
+update_author = _async(crud.update_author)
+delete_author = _async(crud.delete_author)
+
+get_categories = _async(crud.get_categories)
+get_category_versions = _async(crud.get_category_versions)
+get_category = _async(crud.get_category)
+create_category = _async(crud.create_category)
+update_category = _async(crud.update_category)
+delete_category = _async(crud.delete_category)
+
+find_books = _async(crud.find_books)
+find_book_versions = _async(crud.find_book_versions)
+book_facets = _async(crud.book_facets)
+search_books = _async(crud.search_books)
+get_book = _async(crud.get_book)
+get_books_batch = _async(crud.get_books_batch)
+count_books = _async(crud.count_books)
+create_book = _async(crud.create_book)
+update_book = _async(crud.update_book)
+delete_book = _async(crud.delete_book)
+get_book_image = _async(crud.get_book_image)
+set_book_image = _async(crud.set_book_image)
+
+get_customers = _async(crud.get_customers)
+get_customer = _async(crud.get_customer)
+get_customers_batch = _async(crud.get_customers_batch)
+create_customer = _async(crud.create_customer)
+update_customer = _async(crud.update_customer)
+delete_customer = _async(crud.delete_customer)
+
+get_orders = _async(crud.get_orders)
+get_order = _async(crud.get_order)
+create_order = _async(crud.create_order)
+update_order = _async(crud.update_order)
+delete_order = _async(crud.delete_order)
+authenticate_customer = _async(crud.authenticate_customer)
+get_customer_by_user = _async(crud.get_customer_by_user)
+set_customer_password = _async(crud.set_customer_password)
+get_customer_orders = _async(crud.get_customer_orders)
+
+get_orderings = _async(crud.get_orderings)
+create_ordering = _async(crud.create_ordering)
+delete_ordering = _async(crud.delete_ordering)
+
+sync_changes = _async(crud.sync_changes)
+count_rows = _async(counts.total)
+
+top_sales = _async(sales.top)
+sales_by_day = _async(sales.by_day)
@@ -0,0 +1,63 @@
+"""Async engine and session dependency used by app.main_async.
+
+The URL is derived from DATABASE_URL by swapping in an asyncio driver
+(asyncpg for Postgres, aiosqlite for SQLite) unless ASYNC_DATABASE_URL is set.
+Replica URLs (DATABASE_REPLICA_URLS, see app.replicas) are converted the same way.
+"""
+import os
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from . import replicas
+from .database import DATABASE_URL
+from .pool import engine_kwargs
+
+_ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_kwargs(ASYNC_DATABASE_URL, "async", use_asyncio=True))
+# objects stay usable after commit; routes serialize them once the session is gone
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+async_read_replicas = replicas.ReplicaSet([
+    replicas.Replica(
+        f"async_replica{i}",
+        create_async_engine(to_async_url(url), **engine_kwargs(to_async_url(url), f"async_replica{i}", use_asyncio=True)),
+    )
+    for i, url in enumerate(replicas.URLS)
+])
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    """Session for routes that only read: a healthy replica if there is one, else the primary."""
+    for replica in async_read_replicas.candidates(request):
+        conn = await replica.connect_async()
+        if conn is None:
+            continue
+        db = AsyncSessionLocal(bind=conn, info={"replica": replica.name})
+        try:
+            yield db
+        finally:
+            await db.close()
+            await conn.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,172 @@
+"""Password hashing and login sessions.
+
+Passwords are stored as scrypt hashes ("scrypt$n$r$p$salt$hash"). Hashing is
+deliberately slow, so it runs in a small dedicated thread pool: a login storm
+queues up on that pool instead of tying up the event loop or the threadpool
+that serves every other route. Rows still holding a plaintext password (from
+before hashing was introduced) are accepted once and re-hashed on login.
+
+A successful login issues an opaque bearer token kept in an in-process store
+with expiry, so authenticated requests are checked without a database round
+trip. Like the entity cache, the store is per process: with several workers a
+token is only known to the worker that issued it unless requests are sticky.
+
+Settings (all optional):
+
+- AUTH_HASH_WORKERS   threads used for password hashing (default: CPU count, at most 4)
+- AUTH_TOKEN_TTL      token lifetime in seconds (default 3600)
+"""
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Header, HTTPException
+
+# ~50 ms and 16 MiB per hash on current hardware
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+_PREFIX = "scrypt$"
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AUTH_HASH_WORKERS", "0")) or min(4, os.cpu_count() or 1),
+    thread_name_prefix="password-hash",
+)
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.b64decode(s + "=" * (-len(s) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=2 * 128 * r * n, dklen=32)
+
+
+def is_hashed(stored: str | None) -> bool:
+    return bool(stored) and stored.startswith(_PREFIX)
+
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{_PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+@functools.lru_cache(maxsize=None)
+def _dummy_hash() -> str:
+    # verified against when the user does not exist, so unknown users take as long as wrong passwords;
+    # built on first use to keep hashing out of import time
+    return hash_password(secrets.token_hex(8))
+
+
+def verify_password(password: str, stored: str | None) -> tuple:
+    """Check `password` against a stored value.
+
+    Returns (ok, new_hash): new_hash is set when the stored value should be
+    replaced, i.e. it was plaintext or uses outdated scrypt parameters.
+    """
+    if not is_hashed(stored):
+        _verify_hash(password, _dummy_hash())
+        ok = stored is not None and hmac.compare_digest(password.encode(), stored.encode())
+        return ok, (hash_password(password) if ok else None)
+    ok = _verify_hash(password, stored)
+    outdated = not stored.startswith(f"{_PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return ok, (hash_password(password) if ok and outdated else None)
+
+
+def _verify_hash(password: str, stored: str) -> bool:
+    try:
+        n, r, p, salt, digest = stored[len(_PREFIX):].split("$")
+        expected = _unb64(digest)
+        actual = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password, password)
+
+
+async def verify_password_async(password: str, stored: str | None) -> tuple:
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_password, password, stored)
+
+
+class TokenStore:
+    """Opaque bearer tokens mapped to a customer id, each with an expiry."""
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._tokens = {}  # token -> (expires_at, customer_id)
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def issue(self, customer_id: int) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            self._tokens[token] = (now + self.ttl, customer_id)
+            if now >= self._next_purge:
+                # expired tokens are otherwise only dropped when presented again
+                self._tokens = {t: e for t, e in self._tokens.items() if e[0] > now}
+                self._next_purge = now + self.ttl / 10
+        return token
+
+    def resolve(self, token: str):
+        """Return the customer id of a live token, or None."""
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._tokens[token]
+                return None
+            return entry[1]
+
+    def revoke(self, token: str):
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def revoke_customer(self, customer_id: int):
+        with self._lock:
+            self._tokens = {t: e for t, e in self._tokens.items() if e[1] != customer_id}
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+tokens = TokenStore(ttl=float(os.getenv("AUTH_TOKEN_TTL", "3600")))
+
+
+def bearer_token(authorization: str | None = Header(None)) -> str:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return token
+
+
+def current_customer_id(authorization: str | None = Header(None)) -> int:
+    """Dependency: the customer id behind the request's bearer token (no database access)."""
+    customer_id = tokens.resolve(bearer_token(authorization))
+    if customer_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return customer_id
+
+
+def optional_customer_id(authorization: str | None = Header(None)) -> int | None:
+    """Like current_customer_id, but None for anonymous requests (a bad token is still a 401)."""
+    if authorization is None:
+        return None
+    return current_customer_id(authorization)
+
@@ -0,0 +1,137 @@
+"""In-process, size-bounded LRU cache with per-entry TTL and tag invalidation.
+
+Entries can carry tags (e.g. a cached book is tagged with its author and
+category) so a write can drop every entry that depends on the changed row
+without scanning the cache. The cache is per process: with several workers a
+write only invalidates the worker that handled it, and the TTL bounds how long
+the others may serve the old value.
+
+A read-through fill races with writes: a reader may query the row, a writer
+commit and invalidate, and the reader then cache what it read before the
+write. Readers take `generation()` before querying and pass it to `set`,
+which drops the value if its key or one of its tags was invalidated since.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUTTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated_at = float("-inf")
+        self._generation = 0  # bumped by every invalidation
+        self._invalidated = {}  # key or tag -> generation it was last invalidated at
+        self._floor = 0  # fills older than this are refused (set by clear and pruning)
+
+    def get(self, key):
+        """Return the cached value for `key`, or MISSING."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        """Token for `set(..., since=)`; take it before reading the value to be cached."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, tags=(), since=None):
+        """Cache `value`; unless `key` or one of `tags` was invalidated after `since`."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if since is not None and (
+                since < self._floor or any(self._invalidated.get(k, -1) >= since for k in (key, *tags))
+            ):
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        self.invalidated_at = time.monotonic()
+        with self._lock:
+            self._bump(key)
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        """Drop every entry that was stored with `tag`."""
+        self.invalidated_at = time.monotonic()
+        with self._lock:
+            self._bump(tag)
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        self.invalidated_at = time.monotonic()
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self._generation += 1
+            self._invalidated.clear()
+            self._floor = self._generation
+
+    def invalidated_within(self, seconds: float) -> bool:
+        """True if anything was invalidated in the last `seconds`."""
+        return time.monotonic() - self.invalidated_at < seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _bump(self, name):
+        # caller holds the lock
+        self._invalidated[name] = self._generation
+        self._generation += 1
+        if len(self._invalidated) > max(self.maxsize, 1024):
+            # forget old invalidations; fills that started before now are refused instead
+            self._invalidated.clear()
+            self._floor = self._generation
+
+    def _remove(self, key):
+        # caller holds the lock
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# shared cache for single-entity reads in crud (authors, categories, books)
+entity_cache = LRUTTLCache(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("CACHE_TTL", "60")),
+)
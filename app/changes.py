@@ -0,0 +1,104 @@
+"""Change log behind GET /sync (delta sync for offline clients).
+
+crud records every insert, update and delete of authors, categories, books,
+orders and order lines in `change_log`, in the same transaction as the
+change itself, under an increasing `seq`. A sync token is the last seq a
+client has seen, so a sync reads the entries after it with a range scan
+of the primary key: the cost depends on how much changed, not on the size
+of the catalog. Deletes are ordinary entries (op "delete"), i.e. tombstones.
+
+Sequence values are handed out when a transaction writes its entries, but
+become visible when it commits, so a later seq can be visible before an
+earlier one. `read` therefore stops at the first entry younger than
+SYNC_SETTLE_S seconds: every transaction that got an earlier seq has
+committed by then, provided it commits within that time of writing its
+entries (crud records them just before committing).
+
+Entries carry the owning customer for orders and order lines, so a client
+only receives its own orders.
+
+Settings (all optional):
+
+- SYNC_SETTLE_S   age an entry must reach before it is handed out (default 2)
+"""
+import os
+from datetime import timedelta
+
+from sqlalchemy import insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+SETTLE_S = float(os.getenv("SYNC_SETTLE_S", "2"))
+
+UPSERT, DELETE = "upsert", "delete"
+# entity names used in the log and in the /sync response
+ENTITIES = ("author", "category", "book", "order", "ordering")
+
+
+def record(db: Session, entity: str, ids, op: str = UPSERT, customer_id: int | None = None):
+    """Log a change of the rows of `entity` (not "ordering") with these ids. Does not commit."""
+    ids = list(dict.fromkeys(ids))
+    if ids:
+        now = models.utcnow()
+        db.execute(
+            insert(models.change_log),
+            [{"entity": entity, "entity_id": i, "op": op, "customer_id": customer_id, "recorded_at": now} for i in ids],
+        )
+
+
+def record_orderings(db: Session, lines, op: str = UPSERT):
+    """Log a change of order lines, given as (bookID, orderID, customer_id) triples. Does not commit."""
+    lines = list(dict.fromkeys(lines))
+    if lines:
+        now = models.utcnow()
+        db.execute(
+            insert(models.change_log),
+            [
+                {"entity": "ordering", "entity_id": b, "order_id": o, "customer_id": c, "op": op, "recorded_at": now}
+                for b, o, c in lines
+            ],
+        )
+
+
+def record_select(db: Session, entity: str, ids_select):
+    """Log upserts of `entity` for the ids a SELECT returns (many rows, one statement). Does not commit."""
+    t = models.change_log
+    rows = select(
+        literal(entity), ids_select.subquery().c[0], literal(UPSERT), literal(models.utcnow())
+    )
+    db.execute(insert(t).from_select([t.c.entity, t.c.entity_id, t.c.op, t.c.recorded_at], rows))
+
+
+def read(db: Session, since: int, customer_id: int | None, limit: int):
+    """Settled entries after `since`, oldest first, and whether more may follow.
+
+    Returns (entries, last_seq, more). Order entries are limited to
+    `customer_id`'s (none when it is None).
+    """
+    t = models.change_log
+    owner = t.c.customer_id.is_(None)
+    if customer_id is not None:
+        owner = or_(owner, t.c.customer_id == customer_id)
+    rows = db.execute(select(t).where(t.c.seq > since, owner).order_by(t.c.seq).limit(limit + 1)).all()
+    cutoff = models.utcnow() - timedelta(seconds=SETTLE_S)
+    entries = []
+    for row in rows[:limit]:
+        if row.recorded_at > cutoff:
+            # an earlier seq may still be uncommitted; hand this one out on a later sync
+            return entries, entries[-1].seq if entries else since, False
+        entries.append(row)
+    last = entries[-1].seq if entries else since
+    if len(rows) > limit:
+        return entries, last, True
+    # caught up: skip past other customers' entries too, so the next sync does not scan them again
+    return entries, max(last, latest(db)), False
+
+
+def latest(db: Session) -> int:
+    """The newest settled seq: a new client takes it, downloads everything, then syncs from it."""
+    t = models.change_log
+    cutoff = models.utcnow() - timedelta(seconds=SETTLE_S)
+    # walks back from the end of the primary key over the few unsettled entries
+    q = select(t.c.seq).where(t.c.recorded_at <= cutoff).order_by(t.c.seq.desc()).limit(1)
+    return db.execute(q).scalar() or 0
@@ -0,0 +1,145 @@
+"""Total counts for list routes (?count=exact or ?count=estimate).
+
+The total goes out in the X-Total-Count header, and X-Total-Count-Kind says
+what it is:
+
+- exact      the number of matching rows
+- at-least   there are more than COUNT_EXACT_MAX; counting stopped there
+- estimate   an approximation
+
+`exact` counts the matching rows, but never more than COUNT_EXACT_MAX + 1 of
+them, so a count costs at most that many index entries however large the
+table is.
+
+`estimate` on an unfiltered listing reads `row_counts`, one row per table,
+plus the changes still pending in `row_count_delta`. crud records its inserts
+and deletes there (`add`) in the same transaction; appending rather than
+updating the table's row keeps concurrent checkouts from queueing on the
+"order" row. app.rollup folds the pending changes into `row_counts` every few
+seconds (`fold`), so the sum stays short. Rows written around crud are not
+counted until `rebuild` (`python -m app.migrations --rebuild-counts`, and
+after datagen). With filters, on Postgres, it takes the planner's row estimate for the query (EXPLAIN, no
+execution); below COUNT_ESTIMATE_EXACT_BELOW rows planner estimates are least
+reliable and counting is cheap, so those are counted exactly. Other databases
+have no planner estimate to ask and count exactly, within the same bound.
+
+Settings (all optional):
+
+- COUNT_EXACT_MAX              most rows an exact count looks at (default 100000)
+- COUNT_ESTIMATE_EXACT_BELOW   filtered estimates smaller than this are counted exactly (default 1000)
+"""
+import json
+import os
+from collections import defaultdict
+
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+EXACT_MAX = int(os.getenv("COUNT_EXACT_MAX", "100000"))
+ESTIMATE_EXACT_BELOW = int(os.getenv("COUNT_ESTIMATE_EXACT_BELOW", "1000"))
+
+MODES = ("exact", "estimate")
+EXACT, AT_LEAST, ESTIMATE = "exact", "at-least", "estimate"
+
+# entity -> table whose rows are counted
+TABLES = {
+    "author": models.Author.__table__,
+    "category": models.Category.__table__,
+    "book": models.Book.__table__,
+    "customer": models.Customer.__table__,
+    "order": models.BookOrder.__table__,
+}
+
+
+def add(db: Session, entity: str, delta: int):
+    """Add `delta` (negative for deletes) to the row count of `entity`. Does not commit."""
+    if delta:
+        db.execute(insert(models.row_count_delta).values(entity=entity, delta=delta))
+
+
+def fold(conn) -> int:
+    """Add the pending deltas to `row_counts` and delete them; returns how many were folded.
+
+    Safe to run concurrently on Postgres and SQLite, like app.sales.fold.
+    """
+    d = models.row_count_delta
+    if conn.dialect.delete_returning:
+        pending = conn.execute(d.delete().returning(d.c.entity, d.c.delta)).all()
+    else:
+        last = conn.execute(select(func.max(d.c.id))).scalar()
+        if last is None:
+            return 0
+        pending = conn.execute(select(d.c.entity, d.c.delta).where(d.c.id <= last)).all()
+        conn.execute(d.delete().where(d.c.id <= last))
+    deltas = defaultdict(int)
+    for entity, delta in pending:
+        deltas[entity] += delta
+    t = models.row_counts
+    dialect = conn.dialect.name
+    # sorted: concurrent folds lock the same rows in the same order
+    for entity, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if dialect in ("postgresql", "sqlite"):
+            stmt = (postgresql if dialect == "postgresql" else sqlite).insert(t).values(entity=entity, n=delta)
+            conn.execute(stmt.on_conflict_do_update(index_elements=[t.c.entity], set_={"n": t.c.n + stmt.excluded.n}))
+        elif not conn.execute(t.update().where(t.c.entity == entity).values(n=t.c.n + delta)).rowcount:
+            conn.execute(insert(t).values(entity=entity, n=delta))
+    return len(pending)
+
+
+def rebuild(conn):
+    """Recount every table from scratch."""
+    t = models.row_counts
+    # the recount already includes whatever is pending
+    conn.execute(models.row_count_delta.delete())
+    conn.execute(t.delete())
+    for entity, table in TABLES.items():
+        conn.execute(insert(t).values(entity=entity, n=select(func.count()).select_from(table).scalar_subquery()))
+
+
+def total(db: Session, entity: str, mode: str, query=None) -> tuple:
+    """(count, kind) of the rows of `entity`, or of the rows `query` (a Query or Select) returns."""
+    if mode == ESTIMATE:
+        if query is None:
+            t, d = models.row_counts, models.row_count_delta
+            n, pending = db.execute(
+                select(
+                    select(t.c.n).where(t.c.entity == entity).scalar_subquery(),
+                    select(func.sum(d.c.delta)).where(d.c.entity == entity).scalar_subquery(),
+                )
+            ).one()
+            if n is not None:
+                return max(n + (pending or 0), 0), ESTIMATE
+        elif db.get_bind().dialect.name == "postgresql":
+            n = _planner_rows(db, query)
+            if n >= ESTIMATE_EXACT_BELOW:
+                return n, ESTIMATE
+    return _bounded_count(db, query if query is not None else select(TABLES[entity]))
+
+
+def _statement(query):
+    # ORM Query -> Select; the count does not depend on the page, the sort or the columns
+    stmt = getattr(query, "statement", query)
+    return stmt.order_by(None).limit(None).offset(None)
+
+
+def _bounded_count(db: Session, query) -> tuple:
+    rows = _statement(query).with_only_columns(literal(1), maintain_column_froms=True).limit(EXACT_MAX + 1)
+    n = db.execute(select(func.count()).select_from(rows.subquery())).scalar()
+    return (EXACT_MAX, AT_LEAST) if n > EXACT_MAX else (n, EXACT)
+
+
+def _planner_rows(db: Session, query) -> int:
+    # compiled for the session's own driver: pyformat binds on psycopg2, positional on asyncpg
+    compiled = _statement(query).compile(dialect=db.get_bind().dialect)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+    if isinstance(plan, str):  # asyncpg returns json as text
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
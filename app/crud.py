@@ -1,84 +1,302 @@
-from sqlalchemy.orm import Session
+from datetime import date
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 from typing import List
-from . import models, schemas
-from sqlalchemy import select
+from . import auth, changes, counts, models, replicas, sales, schemas, search, snapshot
+from .cache import MISSING, entity_cache
+from .pagination import encode_cursor, keyset
+from sqlalchemy import Integer, String, cast, case, func, insert, literal, select, tuple_, union_all
+
+
+def _cache_fill(db: Session, key, value, tags=(), since=None):
+    # `since` is entity_cache.generation() taken before the read, so a write
+    # that invalidates the entry while it is being read keeps it out
+    #
+    # a lagging replica may still return rows a write in this process has just invalidated
+    if db.info.get("replica") and entity_cache.invalidated_within(replicas.READ_YOUR_WRITES_S):
+        return
+    entity_cache.set(key, value, tags, since)
+
+
+# most ids a batch lookup (GET /books/batch etc.) accepts
+BATCH_MAX_IDS = 500
+
+
+def _cached_batch(db: Session, kind: str, ids: list, load) -> dict:
+    """{"items": [...], "missing": [...]} for `ids`, in request order.
+
+    Cached entries are used as is; `load(db, ids)` fetches the rest with one
+    query and returns (id, data, tags) triples, which are cached in turn.
+    """
+    ids = list(dict.fromkeys(ids))
+    found, misses = {}, []
+    for id_ in ids:
+        cached = entity_cache.get((kind, id_))
+        if cached is MISSING:
+            misses.append(id_)
+        else:
+            found[id_] = cached
+    if misses:
+        since = entity_cache.generation()
+        for id_, data, tags in load(db, misses):
+            _cache_fill(db, (kind, id_), data, tags, since)
+            found[id_] = data
+    return {
+        "items": [dict(found[id_]) for id_ in ids if id_ in found],
+        "missing": [id_ for id_ in ids if id_ not in found],
+    }
 
 
 # Authors
-def get_authors(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Author).offset(skip).limit(limit).all()
+def get_authors(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(db.query(models.Author), [models.Author.authorID], after)
+    return q.offset(skip).limit(limit).all()
+
+
+def get_author_versions(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    """(authorID, updatedAt) of the page get_authors would return."""
+    q = keyset(db.query(models.Author.authorID, models.Author.updatedAt), [models.Author.authorID], after)
+    return q.offset(skip).limit(limit).all()
 
 
 def get_author(db: Session, author_id: int):
+    # read-through cache; returns a plain dict shaped like schemas.Author
+    key = ("author", author_id)
+    cached = entity_cache.get(key)
+    if cached is not MISSING:
+        return dict(cached)
+    since = entity_cache.generation()
+    db_obj = _get_author_row(db, author_id)
+    if not db_obj:
+        return None
+    data = {"authorID": db_obj.authorID, "authorName": db_obj.authorName, "updatedAt": db_obj.updatedAt}
+    _cache_fill(db, key, data, since=since)
+    return dict(data)
+
+
+def _get_author_row(db: Session, author_id: int):
     return db.query(models.Author).filter(models.Author.authorID == author_id).first()
 
 
+def get_authors_batch(db: Session, ids: list) -> dict:
+    return _cached_batch(db, "author", ids, _load_authors)
+
+
+def _load_authors(db: Session, ids: list):
+    q = db.query(models.Author.authorID, models.Author.authorName, models.Author.updatedAt)
+    for r in q.filter(models.Author.authorID.in_(ids)):
+        yield r.authorID, {"authorID": r.authorID, "authorName": r.authorName, "updatedAt": r.updatedAt}, ()
+
+
 def create_author(db: Session, author: schemas.AuthorCreate):
     db_obj = models.Author(authorName=author.authorName)
     db.add(db_obj)
+    db.flush()
+    changes.record(db, "author", [db_obj.authorID])
+    counts.add(db, "author", 1)
     db.commit()
     db.refresh(db_obj)
+    _invalidate_author(db_obj.authorID)
     return db_obj
 
 
 def update_author(db: Session, author_id: int, author: schemas.AuthorCreate):
-    db_obj = get_author(db, author_id)
+    db_obj = _get_author_row(db, author_id)
     if not db_obj:
         return None
     db_obj.authorName = author.authorName
+    db.flush()
+    book_ids = _author_book_ids(db, author_id)
+    _touch_books(db, book_ids)
+    search.backend_for(db).reindex(db, book_ids)
+    changes.record(db, "author", [author_id])
     db.commit()
+    _invalidate_author(author_id)
     db.refresh(db_obj)
     return db_obj
 
 
 def delete_author(db: Session, author_id: int):
-    db_obj = get_author(db, author_id)
+    db_obj = _get_author_row(db, author_id)
     if not db_obj:
         return False
+    book_ids = _author_book_ids(db, author_id)
     db.delete(db_obj)
+    db.flush()
+    _touch_books(db, book_ids)
+    search.backend_for(db).reindex(db, book_ids)
+    changes.record(db, "author", [author_id], changes.DELETE)
+    counts.add(db, "author", -1)
     db.commit()
+    _invalidate_author(author_id)
     return True
 
 
+def _invalidate_author(author_id: int):
+    # cached books embed author names, so they go too
+    entity_cache.invalidate(("author", author_id))
+    entity_cache.invalidate_tag(("author", author_id))
+    invalidate_book_facets()
+    snapshot.catalog.invalidate("/authors/", "/books/")
+
+
+def _author_book_ids(db: Session, author_id: int) -> list:
+    rows = db.query(models.author_book.c.bookid).filter(models.author_book.c.authorid == author_id)
+    return [r[0] for r in rows]
+
+
 # Category
-def get_categories(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Category).offset(skip).limit(limit).all()
+def get_categories(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(db.query(models.Category), [models.Category.categoryID], after)
+    return q.offset(skip).limit(limit).all()
+
+
+def get_category_versions(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    """(categoryID, updatedAt) of the page get_categories would return."""
+    q = keyset(db.query(models.Category.categoryID, models.Category.updatedAt), [models.Category.categoryID], after)
+    return q.offset(skip).limit(limit).all()
 
 
 def get_category(db: Session, category_id: int):
+    # read-through cache; returns a plain dict shaped like schemas.Category
+    key = ("category", category_id)
+    cached = entity_cache.get(key)
+    if cached is not MISSING:
+        return dict(cached)
+    since = entity_cache.generation()
+    db_obj = _get_category_row(db, category_id)
+    if not db_obj:
+        return None
+    data = {
+        "categoryID": db_obj.categoryID,
+        "categoryDescription": db_obj.categoryDescription,
+        "updatedAt": db_obj.updatedAt,
+    }
+    _cache_fill(db, key, data, since=since)
+    return dict(data)
+
+
+def _get_category_row(db: Session, category_id: int):
     return db.query(models.Category).filter(models.Category.categoryID == category_id).first()
 
 
 def create_category(db: Session, category: schemas.CategoryCreate):
     db_obj = models.Category(categoryDescription=category.categoryDescription)
     db.add(db_obj)
+    db.flush()
+    changes.record(db, "category", [db_obj.categoryID])
+    counts.add(db, "category", 1)
     db.commit()
     db.refresh(db_obj)
+    _invalidate_category(db_obj.categoryID)
     return db_obj
 
 
 def update_category(db: Session, category_id: int, category: schemas.CategoryCreate):
-    db_obj = get_category(db, category_id)
+    db_obj = _get_category_row(db, category_id)
     if not db_obj:
         return None
     db_obj.categoryDescription = category.categoryDescription
+    # books embed the description
+    db.query(models.Book).filter(models.Book.categoryID == category_id).update(
+        {models.Book.updatedAt: models.utcnow()}, synchronize_session=False
+    )
+    changes.record(db, "category", [category_id])
+    changes.record_select(db, "book", select(models.Book.bookID).where(models.Book.categoryID == category_id))
     db.commit()
+    _invalidate_category(category_id)
     db.refresh(db_obj)
     return db_obj
 
 
 def delete_category(db: Session, category_id: int):
-    db_obj = get_category(db, category_id)
+    db_obj = _get_category_row(db, category_id)
     if not db_obj:
         return False
     db.delete(db_obj)
+    changes.record(db, "category", [category_id], changes.DELETE)
+    counts.add(db, "category", -1)
     db.commit()
+    _invalidate_category(category_id)
     return True
 
 
+def _invalidate_category(category_id: int):
+    # cached books embed the category description
+    entity_cache.invalidate(("category", category_id))
+    entity_cache.invalidate_tag(("category", category_id))
+    invalidate_book_facets()
+    snapshot.catalog.invalidate("/categories/", "/books/")
+
+
 # Books
-def get_books(db: Session, skip: int = 0, limit: int = 100):
-    books = db.query(models.Book).offset(skip).limit(limit).all()
+def _touch_books(db: Session, book_ids):
+    # new row version for books whose embedded author or category data changed
+    if book_ids:
+        db.query(models.Book).filter(models.Book.bookID.in_(book_ids)).update(
+            {models.Book.updatedAt: models.utcnow()}, synchronize_session=False
+        )
+        changes.record(db, "book", book_ids)
+
+
+# schemas.Book fields that are plain book columns; "author" and "category" come from relationships
+BOOK_COLUMNS = ("bookID", "categoryID", "title", "isbn", "year", "price", "noPages", "bookDescription")
+
+
+def _book_query(db: Session, fields=None):
+    # authors and category are loaded up front (one extra IN query for authors,
+    # category joined) so _book_to_dict never lazy-loads per row
+    if fields is None:
+        return db.query(models.Book).options(
+            selectinload(models.Book.authors),
+            joinedload(models.Book.category),
+        )
+    # sparse fieldset: select only the requested columns and relationships
+    columns = {"bookID", "updatedAt", *(f for f in fields if f in BOOK_COLUMNS)}
+    options = [load_only(*(getattr(models.Book, c) for c in sorted(columns)))]
+    if "author" in fields:
+        options.append(selectinload(models.Book.authors))
+    if "category" in fields:
+        options.append(joinedload(models.Book.category))
+    return db.query(models.Book).options(*options)
+
+
+def _with_sort_field(fields, sort: str):
+    # the next-page cursor is built from the sort column, so it is loaded even if not requested
+    if fields is None:
+        return None
+    return [*fields, sort.lstrip("-")]
+
+
+# sortable /books/ keys; the primary key is always appended as tie-breaker
+BOOK_SORTS = {
+    "bookID": models.Book.bookID,
+    "title": models.Book.title,
+    "price": models.Book.price,
+}
+
+
+def _book_sort_columns(sort: str):
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in BOOK_SORTS:
+        raise ValueError(f"Unknown sort key: {name}")
+    columns = [BOOK_SORTS[name]]
+    if name != "bookID":
+        columns.append(models.Book.bookID)
+    return columns, descending
+
+
+def book_sort_key(sort: str, book: dict) -> list:
+    """Keyset values of a book dict under `sort`, as expected by find_books(after=...)."""
+    name = sort.lstrip("-")
+    if name == "bookID":
+        return [book["bookID"]]
+    return [book[name], book["bookID"]]
+
+
+def get_books(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(_book_query(db), [models.Book.bookID], after)
+    books = q.offset(skip).limit(limit).all()
     return [_book_to_dict(b) for b in books]
 
 
@@ -92,8 +310,55 @@ def find_books(
     year: int | None = None,
     min_price: int | None = None,
     max_price: int | None = None,
+    sort: str = "bookID",
+    after: list | None = None,
+    fields: list | None = None,
+):
+    """Books matching the filters; with `fields` (schemas.Book names) only those are loaded and returned."""
+    fields = _with_sort_field(fields, sort)
+    q = _filter_books(_book_query(db, fields), author_id, category_id, title, year, min_price, max_price, sort, after)
+    books = q.offset(skip).limit(limit).all()
+    return [_book_to_dict(b, fields) for b in books]
+
+
+def find_book_versions(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    sort: str = "bookID",
+    after: list | None = None,
 ):
-    q = db.query(models.Book)
+    """(bookID, updatedAt) of the page find_books would return, without loading authors or categories."""
+    q = db.query(models.Book.bookID, models.Book.updatedAt)
+    q = _filter_books(q, author_id, category_id, title, year, min_price, max_price, sort, after)
+    return q.offset(skip).limit(limit).all()
+
+
+def count_books(
+    db: Session,
+    mode: str,
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+):
+    """(total, kind) of the books find_books pages through with these filters; see app.counts."""
+    query = None
+    if title or any(v is not None for v in (author_id, category_id, year, min_price, max_price)):
+        query = _filter_books(db.query(models.Book.bookID), author_id, category_id, title, year, min_price, max_price, "bookID", None)
+    return counts.total(db, "book", mode, query)
+
+
+def _filter_books(q, author_id, category_id, title, year, min_price, max_price, sort, after):
+    columns, descending = _book_sort_columns(sort)
     if author_id is not None:
         q = q.join(models.Book.authors).filter(models.Author.authorID == author_id)
     if category_id is not None:
@@ -106,15 +371,121 @@ def find_books(
         q = q.filter(models.Book.price >= min_price)
     if max_price is not None:
         q = q.filter(models.Book.price <= max_price)
-    books = q.offset(skip).limit(limit).all()
-    return [_book_to_dict(b) for b in books]
+    return keyset(q, columns, after, descending)
+
+
+# lower bounds of the price facet bands; the last band is open-ended
+PRICE_BANDS = (0, 500, 1000, 2000, 5000, 10000)
+FACETS_TAG = "book_facets"
+
+
+def _price_band_label(low: int) -> str:
+    i = PRICE_BANDS.index(low)
+    return f"{low}+" if i == len(PRICE_BANDS) - 1 else f"{low}-{PRICE_BANDS[i + 1] - 1}"
+
+
+def book_facets(
+    db: Session,
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    top: int = 20,
+):
+    """Result count plus counts by category, author, year and price band for a /books/ filter set.
+
+    All facets come from one UNION ALL of grouped aggregates over the filtered
+    books; category and author list their `top` largest values. Results are
+    kept in the entity cache until a book, author or category changes, so the
+    unfiltered catalog and popular filter sets (category pages) are computed
+    once rather than on every request.
+    """
+    key = ("book_facets", author_id, category_id, title or None, year, min_price, max_price, top)
+    cached = entity_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    since = entity_cache.generation()
+
+    q = db.query(models.Book.bookID, models.Book.categoryID, models.Book.year, models.Book.price)
+    q = _filter_books(q, author_id, category_id, title, year, min_price, max_price, "bookID", None).order_by(None)
+    # a substring match scans the table, so it is evaluated once rather than once per facet;
+    # otherwise the filter is inlined into each branch where it can use the book indexes
+    base = q.cte("filtered") if title else q.subquery()
+    n = func.count().label("n")
+    no_value, no_label = cast(None, Integer).label("value"), cast(None, String).label("label")
+    band = case(*[(base.c.price >= low, low) for low in reversed(PRICE_BANDS[1:])], else_=PRICE_BANDS[0])
+    bands = select(band.label("band")).subquery()
+    ab = models.author_book
+    parts = [
+        select(literal("total").label("facet"), no_value, no_label, n).select_from(base),
+        select(literal("category").label("facet"), base.c.categoryID.label("value"),
+               models.Category.categoryDescription.label("label"), n)
+        .join_from(base, models.Category, models.Category.categoryID == base.c.categoryID)
+        .group_by(base.c.categoryID, models.Category.categoryDescription)
+        .order_by(n.desc(), base.c.categoryID)
+        .limit(top),
+        select(literal("author").label("facet"), ab.c.authorid.label("value"), models.Author.authorName.label("label"), n)
+        .join_from(base, ab, ab.c.bookid == base.c.bookID)
+        .join(models.Author, models.Author.authorID == ab.c.authorid)
+        .group_by(ab.c.authorid, models.Author.authorName)
+        .order_by(n.desc(), ab.c.authorid)
+        .limit(top),
+        select(literal("year").label("facet"), base.c.year.label("value"), no_label, n)
+        .where(base.c.year.is_not(None))
+        .group_by(base.c.year),
+        select(literal("price").label("facet"), bands.c.band.label("value"), no_label, n).group_by(bands.c.band),
+    ]
+    # per-branch ORDER BY / LIMIT need their own subquery inside a UNION
+    rows = db.execute(union_all(*[select(*part.subquery().c) for part in parts])).all()
+
+    facets = {"total": 0, "category": [], "author": [], "year": [], "price": []}
+    for facet, value, label, count in rows:
+        if facet == "total":
+            facets["total"] = count
+        else:
+            if facet == "price":
+                label = _price_band_label(value)
+            facets[facet].append({"value": value, "label": label, "count": count})
+    # the database does not keep branch order through the union
+    for name in ("category", "author"):
+        facets[name].sort(key=lambda f: (-f["count"], f["value"]))
+    facets["year"].sort(key=lambda f: -f["value"])
+    facets["price"].sort(key=lambda f: f["value"])
+    _cache_fill(db, key, facets, [FACETS_TAG], since)
+    return facets
+
+
+def invalidate_book_facets():
+    entity_cache.invalidate_tag(FACETS_TAG)
 
 
 def get_book(db: Session, book_id: int):
-    b = db.query(models.Book).filter(models.Book.bookID == book_id).first()
+    key = ("book", book_id)
+    cached = entity_cache.get(key)
+    if cached is not MISSING:
+        return dict(cached)
+    since = entity_cache.generation()
+    b = _book_query(db).filter(models.Book.bookID == book_id).first()
     if not b:
         return None
-    return _book_to_dict(b)
+    data = _book_to_dict(b)
+    # tagged so author renames and category edits drop this entry
+    tags = [("author", a.authorID) for a in b.authors] + [("category", b.categoryID)]
+    _cache_fill(db, key, data, tags, since)
+    return dict(data)
+
+
+def get_books_batch(db: Session, ids: list) -> dict:
+    # cached books are reused; the rest come from one IN query (plus the authors' IN query)
+    return _cached_batch(db, "book", ids, _load_books)
+
+
+def _load_books(db: Session, ids: list):
+    for b in _book_query(db).filter(models.Book.bookID.in_(ids)):
+        tags = [("author", a.authorID) for a in b.authors] + [("category", b.categoryID)]
+        yield b.bookID, _book_to_dict(b), tags
 
 
 def create_book(db: Session, book: schemas.BookCreate):
@@ -131,9 +502,13 @@ def create_book(db: Session, book: schemas.BookCreate):
         authors = db.query(models.Author).filter(models.Author.authorID.in_(book.authorIDs)).all()
         db_obj.authors = authors
     db.add(db_obj)
+    db.flush()
+    search.backend_for(db).reindex(db, [db_obj.bookID])
+    changes.record(db, "book", [db_obj.bookID])
+    counts.add(db, "book", 1)
     db.commit()
-    db.refresh(db_obj)
-    return _book_to_dict(db_obj)
+    _invalidate_book(db_obj.bookID)
+    return get_book(db, db_obj.bookID)
 
 
 def update_book(db: Session, book_id: int, book: schemas.BookCreate):
@@ -141,6 +516,7 @@ def update_book(db: Session, book_id: int, book: schemas.BookCreate):
     real = db.query(models.Book).filter(models.Book.bookID == book_id).first()
     if not real:
         return None
+    old_category, old_authors = real.categoryID, [a.authorID for a in real.authors]
     real.categoryID = book.categoryID
     real.title = book.title
     real.isbn = book.isbn
@@ -151,9 +527,15 @@ def update_book(db: Session, book_id: int, book: schemas.BookCreate):
     if book.authorIDs is not None:
         authors = db.query(models.Author).filter(models.Author.authorID.in_(book.authorIDs)).all()
         real.authors = authors
+    # set explicitly: onupdate does not fire when only the author links change
+    real.updatedAt = models.utcnow()
+    sales.move_book(db, book_id, old_category, real.categoryID, old_authors, [a.authorID for a in real.authors])
+    db.flush()
+    search.backend_for(db).reindex(db, [book_id])
+    changes.record(db, "book", [book_id])
     db.commit()
-    db.refresh(real)
-    return _book_to_dict(real)
+    _invalidate_book(book_id)
+    return get_book(db, book_id)
 
 
 def delete_book(db: Session, book_id: int):
@@ -161,33 +543,84 @@ def delete_book(db: Session, book_id: int):
     if not real:
         return False
     db.delete(real)
+    search.backend_for(db).remove(db, [book_id])
+    changes.record(db, "book", [book_id], changes.DELETE)
+    counts.add(db, "book", -1)
     db.commit()
+    _invalidate_book(book_id)
     return True
 
 
-# Image retrieval helper (returns raw bytes or None)
+def _invalidate_book(book_id: int):
+    entity_cache.invalidate(("book", book_id))
+    entity_cache.invalidate(("book_image", book_id))
+    invalidate_book_facets()
+    snapshot.catalog.invalidate("/books/")
+
+
+def search_books(db: Session, q: str, skip: int = 0, limit: int = 100, fields: list | None = None):
+    """Books matching `q` in title, description or author names, best match first."""
+    ids = search.backend_for(db).search(db, q, skip, limit)
+    if not ids:
+        return []
+    books = {b.bookID: b for b in _book_query(db, fields).filter(models.Book.bookID.in_(ids))}
+    return [_book_to_dict(books[i], fields) for i in ids if i in books]
+
+
 def get_book_image(db: Session, book_id: int):
-    # image column is now a string; this helper is deprecated
+    """Book.image: a name in app.images' store, a legacy URL or None. Cached, so usually no query."""
+    key = ("book_image", book_id)
+    cached = entity_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    since = entity_cache.generation()
+    row = db.query(models.Book.image).filter(models.Book.bookID == book_id).first()
+    if row is None:
+        return None
+    _cache_fill(db, key, row.image, since=since)
+    return row.image
+
+
+def set_book_image(db: Session, book_id: int, image: str | None) -> bool:
     real = db.query(models.Book).filter(models.Book.bookID == book_id).first()
     if not real:
-        return None
-    return real.image
+        return False
+    real.image = image
+    changes.record(db, "book", [book_id])
+    db.commit()
+    _invalidate_book(book_id)
+    return True
 
 
-def _book_to_dict(b: models.Book) -> dict:
-    # Convert Book model into dict with single author string, category name and base64 image
+def _author_string(b: models.Book):
     # author names joined by ', '
     author_names = [a.authorName for a in (b.authors or [])]
-    author_str = None
-    if author_names:
-        author_str = ", ".join(author_names)
+    return ", ".join(author_names) if author_names else None
+
 
-    category_desc = None
+def _category_description(b: models.Book):
     if getattr(b, "category", None):
         try:
-            category_desc = b.category.categoryDescription
+            return b.category.categoryDescription
         except Exception:
-            category_desc = None
+            return None
+    return None
+
+
+def _book_to_dict(b: models.Book, fields=None) -> dict:
+    # Convert Book model into dict with single author string, category name and base64 image
+    if fields is not None:
+        # sparse fieldset: only touch what _book_query(db, fields) loaded
+        data = {name: getattr(b, name) for name in fields if name in BOOK_COLUMNS}
+        if "author" in fields:
+            data["author"] = _author_string(b)
+        if "category" in fields:
+            data["category"] = _category_description(b)
+        data.update(bookID=b.bookID, updatedAt=b.updatedAt)
+        return data
+
+    author_str = _author_string(b)
+    category_desc = _category_description(b)
 
     # image_url points to the existing image endpoint for this book
     image_url = f"/books/{b.bookID}/image"
@@ -203,23 +636,34 @@ def _book_to_dict(b: models.Book) -> dict:
         "bookDescription": b.bookDescription,
         "author": author_str,
         "category": category_desc,
+        # row version for ETags; not part of schemas.Book
+        "updatedAt": b.updatedAt,
         # images are now represented as a string column on Book (e.g. URL or filename)
     }
 
 
 
 # Customer
-def get_customers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Customer).offset(skip).limit(limit).all()
+def get_customers(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(db.query(models.Customer), [models.Customer.customerID], after)
+    return q.offset(skip).limit(limit).all()
 
 
 def get_customer(db: Session, customer_id: int):
     return db.query(models.Customer).filter(models.Customer.customerID == customer_id).first()
 
 
+def get_customers_batch(db: Session, ids: list) -> dict:
+    # customers are not cached: one IN query
+    ids = list(dict.fromkeys(ids))
+    found = {c.customerID: c for c in db.query(models.Customer).filter(models.Customer.customerID.in_(ids))}
+    return {"items": [found[i] for i in ids if i in found], "missing": [i for i in ids if i not in found]}
+
+
 def create_customer(db: Session, customer: schemas.CustomerCreate):
-    db_obj = models.Customer(**customer.dict())
+    db_obj = models.Customer(**_with_password_hash(customer.dict()))
     db.add(db_obj)
+    counts.add(db, "customer", 1)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -229,10 +673,11 @@ def update_customer(db: Session, customer_id: int, customer: schemas.CustomerCre
     db_obj = get_customer(db, customer_id)
     if not db_obj:
         return None
-    for k, v in customer.dict().items():
+    for k, v in _with_password_hash(customer.dict()).items():
         setattr(db_obj, k, v)
     db.commit()
     db.refresh(db_obj)
+    auth.tokens.revoke_customer(customer_id)
     return db_obj
 
 
@@ -241,13 +686,40 @@ def delete_customer(db: Session, customer_id: int):
     if not db_obj:
         return False
     db.delete(db_obj)
+    counts.add(db, "customer", -1)
     db.commit()
+    auth.tokens.revoke_customer(customer_id)
     return True
 
 
+def _with_password_hash(data: dict) -> dict:
+    # routes hash off the event loop beforehand (auth.hash_password_async); this covers other callers
+    if data.get("password") and not auth.is_hashed(data["password"]):
+        data["password"] = auth.hash_password(data["password"])
+    return data
+
+
+def get_customer_by_user(db: Session, user: str):
+    # the oldest account wins if a user name was registered twice
+    return (
+        db.query(models.Customer)
+        .filter(models.Customer.user == user)
+        .order_by(models.Customer.customerID)
+        .first()
+    )
+
+
+def set_customer_password(db: Session, customer_id: int, password_hash: str):
+    db.query(models.Customer).filter(models.Customer.customerID == customer_id).update(
+        {models.Customer.password: password_hash}, synchronize_session=False
+    )
+    db.commit()
+
+
 # Orders (book_order)
-def get_orders(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.BookOrder).offset(skip).limit(limit).all()
+def get_orders(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(db.query(models.BookOrder), [models.BookOrder.orderID], after)
+    return q.offset(skip).limit(limit).all()
 
 
 def get_order(db: Session, order_id: int):
@@ -255,52 +727,142 @@ def get_order(db: Session, order_id: int):
 
 
 def authenticate_customer(db: Session, user: str, password: str):
-    """Return customer model if credentials match, else None."""
-    return db.query(models.Customer).filter(models.Customer.user == user, models.Customer.password == password).first()
+    """Return customer model if credentials match, else None.
+
+    Hashes in the calling thread; the /login route uses auth.verify_password_async instead.
+    """
+    cust = get_customer_by_user(db, user)
+    ok, new_hash = auth.verify_password(password, cust.password if cust else None)
+    if not ok:
+        return None
+    if new_hash:
+        set_customer_password(db, cust.customerID, new_hash)
+    return cust
 
 
-def get_customer_orders(db: Session, customer_id: int):
-    """Return a list of orders for a customer. Each order contains items with title and price.
+# sort value for orders without a date, so they go after every dated one
+_NO_DATE = date.min
 
-    This uses ORM relationships to avoid manual join errors.
+
+def get_customer_orders(
+    db: Session,
+    customer_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    after: list | None = None,
+):
+    """Return a page of a customer's orders, newest first, each with its items and total.
+
+    One query: the page of orders is a subquery joined to its lines and books,
+    and the per-order total is a window sum. Orders without a date sort last.
+    `after` is a key from customer_order_key.
     """
-    orders = db.query(models.BookOrder).filter(models.BookOrder.customerID == customer_id).all()
+    o = models.BookOrder
+    sort_date = func.coalesce(o.orderDate, _NO_DATE)
+    page = db.query(o.orderID, o.orderDate, sort_date.label("sort_date")).filter(o.customerID == customer_id)
+    if date_from is not None:
+        page = page.filter(o.orderDate >= date_from)
+    if date_to is not None:
+        page = page.filter(o.orderDate <= date_to)
+    if after is not None:
+        try:
+            after = [date.fromisoformat(after[0]), int(after[1])]
+        except (TypeError, ValueError) as exc:
+            raise ValueError("invalid cursor") from exc
+    page = keyset(page, [sort_date, o.orderID], after, descending=True).offset(skip).limit(limit).subquery()
+
+    rows = (
+        db.query(
+            page.c.orderID,
+            page.c.orderDate,
+            models.Book.title,
+            models.Book.price,
+            func.sum(models.Book.price).over(partition_by=page.c.orderID).label("total"),
+        )
+        .select_from(page)
+        .outerjoin(models.Ordering, models.Ordering.orderID == page.c.orderID)
+        .outerjoin(models.Book, models.Book.bookID == models.Ordering.bookID)
+        .order_by(page.c.sort_date.desc(), page.c.orderID.desc(), models.Book.bookID)
+    )
     result = []
-    for o in orders:
-        items = []
-        # `order_items` relationship on BookOrder points to Ordering objects
-        for ord_row in getattr(o, "order_items", []) or []:
-            # ord_row.book is the related Book (via relationship)
-            try:
-                book = ord_row.book
-                if not book:
-                    continue
-                items.append({"title": book.title, "price": book.price})
-            except Exception:
-                # skip malformed rows but continue processing
-                continue
-        result.append({"orderID": o.orderID, "items": items})
+    for r in rows:
+        if not result or result[-1]["orderID"] != r.orderID:
+            result.append({"orderID": r.orderID, "orderDate": r.orderDate, "total": r.total or 0, "items": []})
+        # lines pointing at a deleted book come back without a title; skip them
+        if r.title is not None:
+            result[-1]["items"].append({"title": r.title, "price": r.price})
     return result
 
 
+def customer_order_key(order: dict) -> list:
+    """Keyset values of a get_customer_orders row, as expected by its `after`."""
+    return [(order["orderDate"] or _NO_DATE).isoformat(), order["orderID"]]
+
+
 def create_order(db: Session, order: schemas.BookOrderCreate):
-    db_obj = models.BookOrder(customerID=order.customerID, orderDate=order.orderDate)
-    db.add(db_obj)
-    db.commit()
-    db.refresh(db_obj)
-    # if bookIDs provided, create ordering rows
-    if order.bookIDs:
-        for b in order.bookIDs:
-            ord_row = models.Ordering(bookID=b, orderID=db_obj.orderID, customer_id=order.customerID)
-            db.add(ord_row)
+    """Place an order and its lines in one transaction.
+
+    Raises ValueError (nothing is written) if the customer or any book does not exist.
+    Returns a dict shaped like schemas.BookOrderDetail.
+    """
+    # duplicate ids would collide on the ordering primary key; keep the first occurrence
+    book_ids = list(dict.fromkeys(order.bookIDs or []))
+    if not db.query(models.Customer.customerID).filter(models.Customer.customerID == order.customerID).first():
+        raise ValueError(f"Unknown customerID: {order.customerID}")
+    books = {}
+    if book_ids:
+        rows = db.query(models.Book.bookID, models.Book.title, models.Book.price).filter(models.Book.bookID.in_(book_ids))
+        books = {r.bookID: r for r in rows}
+        missing = [b for b in book_ids if b not in books]
+        if missing:
+            raise ValueError(f"Unknown bookIDs: {missing}")
+    try:
+        db_obj = models.BookOrder(customerID=order.customerID, orderDate=order.orderDate)
+        db.add(db_obj)
+        db.flush()
+        if book_ids:
+            db.execute(
+                insert(models.Ordering.__table__),
+                [
+                    {"bookid": b, "orderid": db_obj.orderID, "customer_id": order.customerID, "price": books[b].price}
+                    for b in book_ids
+                ],
+            )
+            sales.apply(db, [(b, order.orderDate, 1, books[b].price) for b in book_ids])
+            changes.record_orderings(db, [(b, db_obj.orderID, order.customerID) for b in book_ids])
+        changes.record(db, "order", [db_obj.orderID], customer_id=order.customerID)
+        counts.add(db, "order", 1)
         db.commit()
-    return db_obj
+    except Exception:
+        db.rollback()
+        raise
+    items = [{"bookID": b, "title": books[b].title, "price": books[b].price} for b in book_ids]
+    return {
+        "orderID": db_obj.orderID,
+        "customerID": db_obj.customerID,
+        "orderDate": db_obj.orderDate,
+        "items": items,
+        "total": sum(i["price"] for i in items),
+    }
 
 
 def update_order(db: Session, order_id: int, order: schemas.BookOrderCreate):
     db_obj = get_order(db, order_id)
     if not db_obj:
         return None
+    if db_obj.orderDate != order.orderDate:
+        # the lines move to another day in the per-day sales
+        lines = _order_lines(db, order_id)
+        sales.apply(
+            db,
+            [(b, db_obj.orderDate, -1, price) for b, price in lines] + [(b, order.orderDate, 1, price) for b, price in lines],
+        )
+    if db_obj.customerID != order.customerID:
+        # the order leaves the previous customer's synced data
+        changes.record(db, "order", [order_id], changes.DELETE, customer_id=db_obj.customerID)
+    changes.record(db, "order", [order_id], customer_id=order.customerID)
     db_obj.customerID = order.customerID
     db_obj.orderDate = order.orderDate
     db.commit()
@@ -312,21 +874,47 @@ def delete_order(db: Session, order_id: int):
     db_obj = get_order(db, order_id)
     if not db_obj:
         return False
+    lines = [tuple(line) for line in db.query(*ORDERING_KEY).filter(models.Ordering.orderID == order_id)]
+    sales.apply(db, [(b, db_obj.orderDate, -1, price) for b, price in _order_lines(db, order_id)])
+    changes.record_orderings(db, lines, changes.DELETE)
+    changes.record(db, "order", [order_id], changes.DELETE, customer_id=db_obj.customerID)
     # delete ordering rows referencing this order
     db.query(models.Ordering).filter(models.Ordering.orderID == order_id).delete()
     db.delete(db_obj)
+    counts.add(db, "order", -1)
     db.commit()
     return True
 
 
+def _order_lines(db: Session, order_id: int) -> list:
+    """(bookID, price sold at) of an order's lines."""
+    q = db.query(models.Ordering.bookID, models.Ordering.price).filter(models.Ordering.orderID == order_id)
+    return [tuple(r) for r in q]
+
+
+def _order_date(db: Session, order_id: int):
+    row = db.query(models.BookOrder.orderDate).filter(models.BookOrder.orderID == order_id).first()
+    return row[0] if row else None
+
+
 # Ordering (association)
-def get_orderings(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Ordering).offset(skip).limit(limit).all()
+ORDERING_KEY = [models.Ordering.bookID, models.Ordering.orderID, models.Ordering.customer_id]
+
+
+def get_orderings(db: Session, skip: int = 0, limit: int = 100, after: list | None = None):
+    q = keyset(db.query(models.Ordering), ORDERING_KEY, after)
+    return q.offset(skip).limit(limit).all()
 
 
 def create_ordering(db: Session, ordering: schemas.OrderingCreate):
-    db_obj = models.Ordering(bookID=ordering.bookID, orderID=ordering.orderID, customer_id=ordering.customerid)
+    price = db.query(models.Book.price).filter(models.Book.bookID == ordering.bookID).scalar()
+    db_obj = models.Ordering(
+        bookID=ordering.bookID, orderID=ordering.orderID, customer_id=ordering.customerid, price=price
+    )
     db.add(db_obj)
+    db.flush()
+    sales.apply(db, [(ordering.bookID, _order_date(db, ordering.orderID), 1, price)])
+    changes.record_orderings(db, [(ordering.bookID, ordering.orderID, ordering.customerid)])
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -340,6 +928,63 @@ def delete_ordering(db: Session, book_id: int, order_id: int, customer_id: int):
     ).first()
     if not db_obj:
         return False
+    sales.apply(db, [(book_id, _order_date(db, order_id), -1, db_obj.price)])
+    changes.record_orderings(db, [(book_id, order_id, customer_id)], changes.DELETE)
     db.delete(db_obj)
     db.commit()
     return True
+
+
+# Delta sync (GET /sync)
+_SYNC_NAMES = {"author": "authors", "category": "categories", "book": "books", "order": "orders", "ordering": "orderings"}
+
+
+def sync_changes(db: Session, since: int | None, customer_id: int | None, limit: int = 1000) -> dict:
+    """Current state of the rows changed after change-log seq `since`, shaped like schemas.SyncResult.
+
+    Without `since` only a starting token is returned (see app.changes.latest).
+    Order and order-line changes are only included for `customer_id`.
+    """
+    if since is None:
+        empty = {name: [] for name in _SYNC_NAMES.values()}
+        return {"token": encode_cursor([changes.latest(db)]), "more": False, **empty, "deleted": empty}
+    entries, last, more = changes.read(db, since, customer_id, limit)
+    # the newest entry of each row decides
+    ops = {}
+    for e in entries:
+        ops[(e.entity, e.entity_id, e.order_id, e.customer_id if e.entity == "ordering" else None)] = e
+    wanted = {entity: [] for entity in changes.ENTITIES}
+    deleted = {entity: [] for entity in changes.ENTITIES}
+    for (entity, entity_id, order_id, line_customer), e in ops.items():
+        key = (entity_id, order_id, line_customer) if entity == "ordering" else entity_id
+        (deleted if e.op == changes.DELETE else wanted)[entity].append(key)
+
+    found = {entity: {} for entity in changes.ENTITIES}
+    if wanted["author"]:
+        q = db.query(models.Author).filter(models.Author.authorID.in_(wanted["author"]))
+        found["author"] = {a.authorID: a for a in q}
+    if wanted["category"]:
+        q = db.query(models.Category).filter(models.Category.categoryID.in_(wanted["category"]))
+        found["category"] = {c.categoryID: c for c in q}
+    if wanted["book"]:
+        q = _book_query(db).filter(models.Book.bookID.in_(wanted["book"]))
+        found["book"] = {b.bookID: _book_to_dict(b) for b in q}
+    if wanted["order"]:
+        q = db.query(models.BookOrder).filter(
+            models.BookOrder.orderID.in_(wanted["order"]), models.BookOrder.customerID == customer_id
+        )
+        found["order"] = {o.orderID: o for o in q}
+    if wanted["ordering"]:
+        q = db.query(*ORDERING_KEY).filter(tuple_(*ORDERING_KEY).in_(wanted["ordering"]))
+        found["ordering"] = {tuple(r): {"bookID": r[0], "orderID": r[1], "customerid": r[2]} for r in q}
+    for entity, keys in wanted.items():
+        # gone since (its delete entry is past this page) or, for orders, moved to another customer
+        deleted[entity].extend(k for k in keys if k not in found[entity])
+
+    deleted["ordering"] = [{"bookID": b, "orderID": o, "customerid": c} for b, o, c in deleted["ordering"]]
+    result = {"token": encode_cursor([last]), "more": more, "deleted": {}}
+    for entity, name in _SYNC_NAMES.items():
+        result[name] = [found[entity][k] for k in wanted[entity] if k in found[entity]]
+        result["deleted"][name] = deleted[entity]
+    return result
+
@@ -0,0 +1,33 @@
+"""Strong ETags for catalog responses, derived from row versions.
+
+A response's ETag is a digest of the (id, updated_at) pairs of the rows it
+contains, in response order. Those pairs can be read with a narrow
+query (or from the entity cache) without loading the full rows.
+Conditional requests are then answered with 304 before anything is
+fetched or serialized.
+"""
+import hashlib
+
+
+def compute(versions, variant: str = "") -> str:
+    """ETag for a sequence of (id, updated_at) pairs.
+
+    `variant` tells apart representations of the same rows (e.g. different
+    sparse fieldsets), which must not share an ETag.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if variant:
+        digest.update(f"{variant}|".encode())
+    for row_id, updated_at in versions:
+        digest.update(f"{row_id}@{updated_at.isoformat() if updated_at else ''};".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: str | None, tag: str) -> bool:
+    """True if an If-None-Match header value covers `tag` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (c.strip() for c in if_none_match.split(","))
+    return tag in (c[2:] if c.startswith("W/") else c for c in candidates)
@@ -0,0 +1,196 @@
+"""Streaming catalog export (GET /export/books, /export/customers, /export/orders).
+
+Rows are read through a server-side cursor (`yield_per`, which turns on
+`stream_results`) and written to the response one partition at a time as
+NDJSON or CSV, so memory use depends on the batch size and not on the table.
+Related data of a partition (author names, order lines) is loaded with one IN
+query per partition. Book rows use the same fields as POST /books/bulk, so an
+export can be imported elsewhere as is.
+
+The book export is the public catalog. Customers and orders are personal
+data: those exports need `Authorization: Bearer <EXPORT_TOKEN>` and are
+refused altogether while EXPORT_TOKEN is unset.
+
+Settings (all optional):
+
+- EXPORT_TOKEN   shared secret for /export/customers and /export/orders (default unset: refused)
+"""
+import csv
+import io
+import json
+import os
+import secrets
+import threading
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models, pool
+from .database import SessionLocal
+
+BATCH_SIZE = 1000
+TOKEN = os.getenv("EXPORT_TOKEN", "")
+# exports of personal data
+PRIVATE = {"customers", "orders"}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _partitions(db: Session, stmt, batch_size: int):
+    yield from db.execute(stmt.execution_options(yield_per=batch_size)).partitions()
+
+
+def _group(rows) -> dict:
+    out = {}
+    for key, value in rows:
+        out.setdefault(key, []).append(value)
+    return out
+
+
+def export_books(db: Session, batch_size: int):
+    b, c = models.Book, models.Category
+    stmt = (
+        select(
+            b.bookID,
+            b.categoryID,
+            c.categoryDescription.label("category"),
+            b.title,
+            b.isbn,
+            b.year,
+            b.price,
+            b.noPages,
+            b.bookDescription,
+            b.image,
+        )
+        .outerjoin(c, c.categoryID == b.categoryID)
+        .order_by(b.bookID)
+    )
+    ab = models.author_book.c
+    for part in _partitions(db, stmt, batch_size):
+        authors = _group(
+            db.execute(
+                select(ab.bookid, models.Author.authorName)
+                .join(models.Author, models.Author.authorID == ab.authorid)
+                .where(ab.bookid.in_([r.bookID for r in part]))
+                .order_by(ab.bookid, models.Author.authorID)
+            )
+        )
+        yield [dict(r._mapping, authors=authors.get(r.bookID, [])) for r in part]
+
+
+def export_customers(db: Session, batch_size: int):
+    cu = models.Customer
+    # never the password column
+    stmt = select(
+        cu.customerID, cu.firstName, cu.lastName, cu.zipCode, cu.city, cu.state, cu.address, cu.user
+    ).order_by(cu.customerID)
+    for part in _partitions(db, stmt, batch_size):
+        yield [dict(r._mapping) for r in part]
+
+
+def export_orders(db: Session, batch_size: int):
+    o, ol = models.BookOrder, models.Ordering
+    stmt = select(o.orderID, o.customerID, o.orderDate).order_by(o.orderID)
+    for part in _partitions(db, stmt, batch_size):
+        ids = [r.orderID for r in part]
+        lines = _group(
+            db.execute(select(ol.orderID, ol.bookID).where(ol.orderID.in_(ids)).order_by(ol.orderID, ol.bookID))
+        )
+        totals = dict(
+            db.execute(
+                select(ol.orderID, func.sum(models.Book.price))
+                .join(models.Book, models.Book.bookID == ol.bookID)
+                .where(ol.orderID.in_(ids))
+                .group_by(ol.orderID)
+            ).all()
+        )
+        yield [dict(r._mapping, bookIDs=lines.get(r.orderID, []), total=totals.get(r.orderID) or 0) for r in part]
+
+
+# name -> (partition generator, CSV columns)
+EXPORTS = {
+    "books": (
+        export_books,
+        ["bookID", "categoryID", "category", "title", "isbn", "year", "price", "noPages", "bookDescription", "image", "authors"],
+    ),
+    "customers": (
+        export_customers,
+        ["customerID", "firstName", "lastName", "zipCode", "city", "state", "address", "user"],
+    ),
+    "orders": (export_orders, ["orderID", "customerID", "orderDate", "bookIDs", "total"]),
+}
+
+
+def authorize(kind: str, authorization: str | None):
+    """Refuse an export of PRIVATE data unless the request carries EXPORT_TOKEN."""
+    if kind not in PRIVATE:
+        return
+    if not TOKEN:
+        raise HTTPException(status_code=403, detail=f"The {kind} export is disabled (EXPORT_TOKEN is not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+def _csv_value(v):
+    # lists are ';'-separated, the same convention the bulk import reads
+    if isinstance(v, list):
+        return ";".join(str(x) for x in v)
+    return "" if v is None else v
+
+
+def generate(kind: str, fmt: str, batch_size: int = BATCH_SIZE):
+    """Yield the export of `kind` as text chunks, one per partition.
+
+    Uses a session of its own: the response body is produced after the
+    request's get_db session has already been closed.
+    """
+    produce, columns = EXPORTS[kind]
+    db = SessionLocal()
+    try:
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if fmt == "csv":
+            writer.writerow(columns)
+        for rows in produce(db, batch_size):
+            if fmt == "csv":
+                writer.writerows([_csv_value(row[c]) for c in columns] for row in rows)
+            else:
+                buf.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.getvalue():
+            yield buf.getvalue()  # CSV header of an empty table
+    finally:
+        db.close()
+
+
+async def stream(kind: str, fmt: str, batch_size: int = BATCH_SIZE):
+    """Async body for a StreamingResponse; holds a session slot of the primary pool while it runs."""
+    chunks = generate(kind, fmt, batch_size)
+    # a cancelled request stops waiting for next() without stopping the thread
+    # running it; close() must wait for that thread rather than race it
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            return next(chunks, None)
+
+    def close():
+        with lock:
+            chunks.close()  # closes the export session
+
+    try:
+        async with pool.admission("primary"):
+            while True:
+                chunk = await run_in_threadpool(step)
+                if chunk is None:
+                    break
+                yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(close)
@@ -0,0 +1,73 @@
+"""Opt-in fast response path for catalog routes (FAST_JSON=1).
+
+By default FastAPI validates whatever a route returns against its
+response_model and encodes the result with the stdlib json module. For rows
+the server built itself (crud dicts, ORM rows) the validation is redundant,
+so in fast mode routes hand their content to `respond`. It copies out the
+schema's fields and encodes them with orjson (stdlib json if orjson is not
+installed). The returned Response goes out as is. The routes keep their
+response_model, so the OpenAPI schema does not change.
+
+Book routes given a `fields=` sparse fieldset always answer through
+`respond`, whatever FAST_JSON says: partial rows would fail validation.
+"""
+import json
+import os
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional; the fast path still skips validation without it
+    orjson = None
+
+ENABLED = os.getenv("FAST_JSON", "0").lower() in ("1", "true", "yes")
+
+_fields = {}
+
+
+def field_names(schema) -> tuple:
+    names = _fields.get(schema)
+    if names is None:
+        # pydantic 2 has model_fields, pydantic 1 __fields__
+        names = _fields[schema] = tuple(getattr(schema, "model_fields", None) or schema.__fields__)
+    return names
+
+
+def _project(obj, names: tuple) -> dict:
+    if isinstance(obj, dict):
+        return {n: obj.get(n) for n in names}
+    return {n: getattr(obj, n, None) for n in names}
+
+
+def project(content, names: tuple):
+    """A row, or each row of a list, reduced to `names`."""
+    if isinstance(content, list):
+        return [_project(row, names) for row in content]
+    return _project(content, names)
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=str, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def respond(content, schema, response: Response, fields=None) -> Response:
+    """Encode a row or list of rows as `schema` (or just its `fields`) without validating it.
+
+    Headers already set on the route's `response` (ETag, X-Next-Cursor) are
+    carried over: they are not merged when a route returns its own Response.
+    """
+    out = FastJSONResponse(project(content, tuple(fields) if fields else field_names(schema)))
+    for key, value in response.headers.items():
+        if key not in ("content-length", "content-type"):
+            out.headers[key] = value
+    return out
@@ -0,0 +1,195 @@
+"""Content-addressed store for book cover images.
+
+An upload (PUT /books/{id}/image) is named after the SHA-256 of its bytes,
+`<sha256>.<ext>`, and written once under IMAGE_DIR: uploading the same
+image for another book, or again, stores nothing new. Book.image keeps the
+name. Thumbnails (longest side in IMAGE_THUMB_SIZES) are generated at upload
+time next to the original, `<sha256>-<size>.<ext>`, if Pillow is installed.
+
+Since a name never changes what it points to, GET /images/<name> is served
+with a one-year `immutable` Cache-Control and the hash as ETag, and honours
+Range requests. GET /books/{id}/image only looks the name up (entity cache)
+and redirects there, so once a client or CDN has an image the database is
+not asked again. The file itself goes out through starlette's FileResponse,
+which hands the path to servers that support the ASGI pathsend extension;
+behind nginx, IMAGE_ACCEL_REDIRECT makes the app answer with an
+X-Accel-Redirect header instead and nginx sends the file with sendfile.
+
+Files are never deleted: several books may share one, and a book's old image
+may still be cached by clients.
+
+Settings (all optional):
+
+- IMAGE_DIR              where images are stored (default ./images)
+- IMAGE_THUMB_SIZES      comma-separated thumbnail sizes in pixels (default 160,320,640)
+- IMAGE_MAX_BYTES        largest upload accepted (default 10 MB)
+- IMAGE_ACCEL_REDIRECT   nginx internal location mapped to IMAGE_DIR, e.g. /_images (default off)
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+
+from . import etag
+
+try:
+    from PIL import Image
+except ImportError:  # optional; without it only the original size is served
+    Image = None
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "images")
+THUMB_SIZES = tuple(sorted(int(s) for s in os.getenv("IMAGE_THUMB_SIZES", "160,320,640").split(",") if s.strip()))
+MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+ACCEL_REDIRECT = os.getenv("IMAGE_ACCEL_REDIRECT", "").rstrip("/")
+
+URL_PREFIX = "/images/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# signature -> (extension, Pillow format for thumbnails)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ("jpg", "JPEG")),
+    (b"\x89PNG\r\n\x1a\n", ("png", "PNG")),
+    (b"GIF87a", ("gif", "PNG")),
+    (b"GIF89a", ("gif", "PNG")),
+)
+_MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+# thumbnails of GIFs are PNGs
+_THUMB_EXT = {"jpg": "jpg", "png": "png", "gif": "png", "webp": "webp"}
+_NAME = re.compile(r"^([0-9a-f]{64})(?:-(\d+))?\.(jpg|png|gif|webp)$")
+
+
+def _detect(data: bytes):
+    """(extension, Pillow format) of an image from its first bytes, or None."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp", "WEBP"
+    for signature, kind in _SIGNATURES:
+        if data.startswith(signature):
+            return kind
+    return None
+
+
+def is_stored(image: str | None) -> bool:
+    """True if `image` (a Book.image value) names a file in this store, not a legacy URL."""
+    match = _NAME.match(image or "")
+    return match is not None and match.group(2) is None
+
+
+def path_of(name: str) -> str:
+    # fanned out by the first two hex digits so no directory gets too large
+    return os.path.join(IMAGE_DIR, name[:2], name)
+
+
+def thumbnail_name(name: str, size: int) -> str:
+    digest, ext = name.split(".")
+    return f"{digest}-{size}.{_THUMB_EXT[ext]}"
+
+
+def _write(path: str, data: bytes):
+    # a reader sees the whole file or none: write aside, then rename into place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _thumbnails(name: str, data: bytes, fmt: str):
+    if Image is None:
+        return
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        for size in THUMB_SIZES:
+            if max(original.size) <= size:
+                # no larger than the thumbnail: requests for it get the original
+                continue
+            thumb = original.copy()
+            thumb.thumbnail((size, size))
+            if fmt == "JPEG" and thumb.mode not in ("RGB", "L"):
+                thumb = thumb.convert("RGB")
+            out = io.BytesIO()
+            thumb.save(out, fmt, **({"quality": 85, "optimize": True} if fmt == "JPEG" else {}))
+            _write(path_of(thumbnail_name(name, size)), out.getvalue())
+
+
+def store(data: bytes) -> str:
+    """Store an uploaded image (unless already stored) and its thumbnails; returns its name.
+
+    Raises ValueError if `data` is not a JPEG, PNG, GIF or WebP image.
+    """
+    kind = _detect(data)
+    if kind is None:
+        raise ValueError("Not a JPEG, PNG, GIF or WebP image")
+    ext, fmt = kind
+    name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    path = path_of(name)
+    if os.path.exists(path):
+        return name
+    try:
+        _thumbnails(name, data, fmt)
+    except Exception as error:  # Pillow raises a variety of errors on corrupt input
+        raise ValueError(f"Unreadable image: {error}") from error
+    # the original goes in last, so an existing original means its thumbnails are there too
+    _write(path, data)
+    return name
+
+
+async def read_upload(request: Request) -> bytes:
+    """The raw request body of an upload, refusing anything over IMAGE_MAX_BYTES."""
+    if int(request.headers.get("content-length") or 0) > MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Images are limited to {MAX_BYTES} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Images are limited to {MAX_BYTES} bytes")
+    if not body:
+        raise HTTPException(status_code=400, detail="Empty image")
+    return bytes(body)
+
+
+def redirect(image: str | None, size: int | None) -> Response:
+    """Where GET /books/{id}/image sends the client for the book's `image`."""
+    if size is not None and size not in THUMB_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(map(str, THUMB_SIZES))}")
+    if is_stored(image):
+        name = image
+        if size is not None and os.path.exists(path_of(thumbnail_name(image, size))):
+            name = thumbnail_name(image, size)
+        url = URL_PREFIX + name
+    elif image and image.startswith(("http://", "https://")):
+        # set before the store existed: the image lives elsewhere
+        url = image
+    else:
+        raise HTTPException(status_code=404, detail="Book has no image")
+    # the book may get another image; the file a name points to never changes
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-cache"})
+
+
+def serve(name: str, request: Request) -> Response:
+    """GET /images/<name>: the file, cacheable forever, with Range support."""
+    match = _NAME.match(name)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    tag = f'"{name.rsplit(".", 1)[0]}"'
+    headers = {"Cache-Control": IMMUTABLE, "ETag": tag}
+    if etag.matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    path = path_of(name)
+    media_type = _MEDIA_TYPES[match.group(3)]
+    if ACCEL_REDIRECT:
+        # nginx serves the file (sendfile, Range) from its internal location
+        headers["X-Accel-Redirect"] = f"{ACCEL_REDIRECT}/{name[:2]}/{name}"
+        return Response(headers=headers, media_type=media_type)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
@@ -0,0 +1,342 @@
+"""Streaming bulk import of books (POST /books/bulk).
+
+The request body is NDJSON (one object per line) or CSV with a header row.
+It is read incrementally and handed to `Ingester.process` in fixed-size
+batches, so memory use depends on the batch size and not on the upload.
+Each batch resolves its authors and categories with one IN query per table,
+creates the missing ones, inserts the books and their author links in batched
+statements (COPY on Postgres/psycopg2, executemany elsewhere) and commits.
+Rows that fail validation are reported individually; a batch the database
+rejects is rolled back and reported row by row.
+"""
+import csv
+import io
+import json
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from . import changes, counts, crud, models, schemas, search, snapshot
+
+BATCH_SIZE = 1000
+# only the first errors are returned; the count covers all of them
+MAX_ERRORS = 1000
+
+_BOOK_COLUMNS = ["bookid", "categoryid", "title", "isbn", "year", "price", "nopages", "bookdescription", "updated_at"]
+
+
+def _normalize(raw: dict) -> dict:
+    # CSV gives every field as a string: empty means missing, authors are ';'-separated
+    row = {k: (v if v != "" else None) for k, v in raw.items() if k}
+    authors = row.get("authors")
+    if authors is None:
+        row["authors"] = []
+    elif isinstance(authors, str):
+        row["authors"] = [a.strip() for a in authors.split(";") if a.strip()]
+    return row
+
+
+class BadLine:
+    """Stands in for a line that is not valid UTF-8; the parsers report it as that row's error."""
+
+    def __init__(self, line: bytes, error: UnicodeDecodeError):
+        self.message = f"invalid UTF-8 at byte {error.start}: {error.reason}"
+        # still needed by the CSV parser to find where the record ends
+        self.text = line.decode("utf-8-sig", "replace").rstrip("\r")
+
+
+def _decode(line: bytes):
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError as exc:
+        return BadLine(line, exc)
+
+
+class LineSplitter:
+    """Turn a stream of byte chunks into complete text lines (or BadLine)."""
+
+    def __init__(self):
+        self._buf = b""
+
+    def feed(self, chunk: bytes) -> list:
+        self._buf += chunk
+        *lines, self._buf = self._buf.split(b"\n")
+        return [_decode(line) for line in lines]
+
+    def close(self) -> list:
+        rest, self._buf = self._buf, b""
+        return [_decode(rest)] if rest.strip() else []
+
+
+class NdjsonParser:
+    def __init__(self):
+        self.lineno = 0
+
+    def parse(self, lines: list) -> list:
+        """Return (row number, dict or error message) pairs."""
+        out = []
+        for line in lines:
+            self.lineno += 1
+            if isinstance(line, BadLine):
+                out.append((self.lineno, line.message))
+                continue
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as exc:
+                out.append((self.lineno, f"invalid JSON: {exc}"))
+                continue
+            if not isinstance(obj, dict):
+                out.append((self.lineno, "expected a JSON object"))
+                continue
+            out.append((self.lineno, _normalize(obj)))
+        return out
+
+
+class CsvParser:
+    def __init__(self):
+        self.lineno = 0
+        self.header = None
+        self._pending = []  # lines of a record whose quoted field spans a line break
+        self._bad = None  # error of an undecodable line in the pending record
+
+    def parse(self, lines: list) -> list:
+        out = []
+        for line in lines:
+            self.lineno += 1
+            if isinstance(line, BadLine):
+                self._bad = self._bad or line.message
+                line = line.text
+            self._pending.append(line)
+            joined = "\n".join(self._pending)
+            if joined.count('"') % 2:
+                continue  # still inside a quoted field
+            self._pending = []
+            if self._bad:
+                out.append((self.lineno, self._bad))
+                self._bad = None
+                continue
+            if not joined.strip():
+                continue
+            values = next(csv.reader([joined]))
+            if self.header is None:
+                self.header = [h.strip() for h in values]
+                continue
+            if len(values) != len(self.header):
+                out.append((self.lineno, f"expected {len(self.header)} columns, got {len(values)}"))
+                continue
+            out.append((self.lineno, _normalize(dict(zip(self.header, values)))))
+        return out
+
+
+class Ingester:
+    """Accumulates the outcome of one import; `process` is called once per batch."""
+
+    def __init__(self):
+        self.result = {
+            "rows": 0,
+            "inserted": 0,
+            "authors_created": 0,
+            "categories_created": 0,
+            "error_count": 0,
+            "errors": [],
+        }
+
+    def error(self, row: int, message: str):
+        self.result["error_count"] += 1
+        if len(self.result["errors"]) < MAX_ERRORS:
+            self.result["errors"].append({"row": row, "error": message})
+
+    def process(self, db: Session, parsed: list):
+        """Validate and insert one batch of (row number, dict or error) pairs."""
+        valid = []
+        for row_no, data in parsed:
+            self.result["rows"] += 1
+            if isinstance(data, str):
+                self.error(row_no, data)
+                continue
+            try:
+                item = schemas.BookIngestRow(**data)
+            except ValidationError as exc:
+                self.error(row_no, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+                continue
+            if item.categoryID is None and not item.category:
+                self.error(row_no, "category or categoryID is required")
+                continue
+            valid.append((row_no, item))
+        if not valid:
+            return
+        # what the batch did counts only once it is committed; rows _insert
+        # skipped keep their own error even if the batch is then rejected
+        self._created = dict.fromkeys(("inserted", "authors_created", "categories_created"), 0)
+        self._skipped = {}
+        try:
+            self._insert(db, valid)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            for row_no, _ in valid:
+                self._skipped.setdefault(row_no, f"batch rejected by the database: {exc.__class__.__name__}: {exc}")
+        else:
+            for counter, n in self._created.items():
+                self.result[counter] += n
+            crud.invalidate_book_facets()
+            # new books, and possibly new authors and categories
+            snapshot.catalog.invalidate()
+        for row_no in sorted(self._skipped):
+            self.error(row_no, self._skipped[row_no])
+
+    def _insert(self, db: Session, valid: list):
+        category_ids = self._resolve_categories(db, {i.category for _, i in valid if i.categoryID is None})
+        known = {i.categoryID for _, i in valid if i.categoryID is not None}
+        if known:
+            found = db.execute(select(models.Category.categoryID).where(models.Category.categoryID.in_(known)))
+            known = {r[0] for r in found}
+        author_ids = self._resolve_authors(db, {a for _, i in valid for a in i.authors})
+
+        books, links = [], []
+        for row_no, item in valid:
+            cid = item.categoryID if item.categoryID is not None else category_ids[item.category]
+            if item.categoryID is not None and cid not in known:
+                self._skipped[row_no] = f"unknown categoryID {cid}"
+                continue
+            books.append(
+                {
+                    "categoryid": cid,
+                    "title": item.title,
+                    "isbn": item.isbn,
+                    "year": item.year,
+                    "price": item.price,
+                    "nopages": item.noPages,
+                    "bookdescription": item.bookDescription,
+                    "_authors": list(dict.fromkeys(author_ids[a] for a in item.authors)),
+                }
+            )
+        if not books:
+            return
+        # COPY skips column defaults, so the row version is set explicitly
+        now = models.utcnow()
+        for b in books:
+            b["updated_at"] = now
+
+        if _can_copy(db):
+            book_ids = _copy_books(db, books)
+        else:
+            stmt = insert(models.Book.__table__).returning(models.Book.__table__.c.bookid, sort_by_parameter_order=True)
+            rows = [{k: v for k, v in b.items() if k != "_authors"} for b in books]
+            book_ids = [r[0] for r in db.execute(stmt, rows)]
+
+        for book_id, b in zip(book_ids, books):
+            links.extend({"authorid": a, "bookid": book_id} for a in b["_authors"])
+        if links:
+            if _can_copy(db):
+                _copy(db, "author_book", ["authorid", "bookid"], ([l["authorid"], l["bookid"]] for l in links))
+            else:
+                db.execute(insert(models.author_book), links)
+        search.backend_for(db).reindex(db, book_ids)
+        changes.record(db, "book", book_ids)
+        counts.add(db, "book", len(book_ids))
+        self._created["inserted"] += len(book_ids)
+
+    def _resolve_categories(self, db: Session, names: set) -> dict:
+        return self._resolve(
+            db,
+            names,
+            models.Category,
+            models.Category.categoryID,
+            models.Category.categoryDescription,
+            "categorydescription",
+            "categories_created",
+            "category",
+        )
+
+    def _resolve_authors(self, db: Session, names: set) -> dict:
+        return self._resolve(
+            db,
+            names,
+            models.Author,
+            models.Author.authorID,
+            models.Author.authorName,
+            "authorname",
+            "authors_created",
+            "author",
+        )
+
+    def _resolve(self, db: Session, names: set, model, id_col, name_col, column: str, counter: str, entity: str) -> dict:
+        """Map names to ids, creating the missing rows; the lowest id wins on duplicates."""
+        if not names:
+            return {}
+
+        def lookup():
+            stmt = select(name_col, func.min(id_col)).where(name_col.in_(names)).group_by(name_col)
+            return {name: id_ for name, id_ in db.execute(stmt)}
+
+        ids = lookup()
+        missing = names - ids.keys()
+        if missing:
+            db.execute(insert(model.__table__), [{column: n} for n in sorted(missing)])
+            self._created[counter] += len(missing)
+            ids = lookup()
+            changes.record(db, entity, [ids[n] for n in missing])
+            counts.add(db, entity, len(missing))
+        return ids
+
+
+# Postgres COPY path (psycopg2 only; other drivers use executemany)
+def _can_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def _copy_books(db: Session, books: list) -> list:
+    # COPY cannot return generated keys, so ids are reserved from the sequence first
+    ids = [
+        r[0]
+        for r in db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('book', 'bookid')) FROM generate_series(1, :n)"),
+            {"n": len(books)},
+        )
+    ]
+    _copy(
+        db,
+        "book",
+        _BOOK_COLUMNS,
+        ([book_id] + [b[c] for c in _BOOK_COLUMNS[1:]] for book_id, b in zip(ids, books)),
+    )
+    return ids
+
+
+# COPY's text format escapes with backslashes, so a value that is literally "\N" is not taken for NULL
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy(db: Session, table: str, columns: list, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join("\\N" if v is None else str(v).translate(_COPY_ESCAPES) for v in row) + "\n")
+    buf.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+    finally:
+        cursor.close()
+
+
+async def read_batches(request, batch_size: int = BATCH_SIZE):
+    """Yield lists of parsed rows from the request body, at most `batch_size` each."""
+    content_type = request.headers.get("content-type", "")
+    parser = CsvParser() if "csv" in content_type else NdjsonParser()
+    splitter = LineSplitter()
+    pending = []
+    async for chunk in request.stream():
+        pending.extend(parser.parse(splitter.feed(chunk)))
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    pending.extend(parser.parse(splitter.close()))
+    if isinstance(parser, CsvParser) and parser._pending:
+        pending.append((parser.lineno, "unterminated quoted field"))
+    if pending:
+        yield pending
@@ -1,17 +1,37 @@
+import contextlib
 import os
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+from datetime import date
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 from typing import List
 
-from . import models, schemas, crud
-from .database import engine, Base, get_db
+from . import models, schemas, crud, auth, counts, etag, export, fastjson, images, ingest, metrics, migrations, pagination, pool, replicas, rollup, sales, snapshot
+from .cache import entity_cache
+from .database import engine, get_db, get_read_db, read_replicas
 
 
 
-Base.metadata.create_all(bind=engine)
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing touches the database at import time. Each worker checks the schema
+    # version here (one query, which also opens the first pooled connection);
+    # migrations themselves run as a deploy step, see app.migrations.
+    await run_in_threadpool(migrations.ensure_current, engine)
+    rollup.worker.start(engine)
+    yield
+    rollup.worker.stop()
 
-app = FastAPI(title="Bookstore API")
+
+app = FastAPI(title="Bookstore API", lifespan=lifespan)
+app.add_middleware(snapshot.SnapshotMiddleware, routes=app.routes)
+app.add_middleware(replicas.ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument(engine)
+for replica in read_replicas.replicas:
+    metrics.instrument(replica.engine)
 
 
 @app.get("/", include_in_schema=False)
@@ -19,9 +39,156 @@ def root():
     return RedirectResponse(url="/docs")
 
 
+@app.get("/internal/cache", include_in_schema=False)
+def cache_stats():
+    return entity_cache.stats()
+
+
+@app.get("/internal/pool", include_in_schema=False)
+def pool_stats():
+    return pool.stats()
+
+
+@app.get("/internal/replicas", include_in_schema=False)
+def replica_stats():
+    return read_replicas.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_text():
+    # Prometheus scrape target: per-route latency and SQL work, pool and cache counters
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _decode_cursor(cursor: str | None, types: tuple | None = (int,)):
+    """The key in `cursor`, checked against `types` (one per key column); None means any key."""
+    if cursor is None:
+        return None
+    try:
+        key = pagination.decode_cursor(cursor)
+        if types is not None:
+            pagination.check_key(key, types)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def _parse_ids(ids: str) -> list:
+    # "1,2,3" -> [1, 2, 3] for the batch routes
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No ids given")
+    if len(parsed) > crud.BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {crud.BATCH_MAX_IDS} ids per request")
+    return parsed
+
+
+# ?count=exact|estimate on list routes, see app.counts
+_COUNT = Query(None, pattern="^(exact|estimate)$")
+
+
+def _set_total(response: Response, total: tuple | None) -> str:
+    """Put a (count, kind) total in X-Total-Count; returns the ETag variant for it.
+
+    The total is part of the variant so a 304 never stands for a response
+    with another total, even when the page itself has not changed.
+    """
+    if total is None:
+        return ""
+    n, kind = total
+    response.headers["X-Total-Count"] = str(n)
+    response.headers["X-Total-Count-Kind"] = kind
+    return f";total={n}:{kind}"
+
+
+def _set_next_cursor(response: Response, rows: list, limit: int, key):
+    # a full page means there may be more rows; hand out the key of the last one
+    if rows and len(rows) >= limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(key(rows[-1]))
+
+
+def _parse_fields(fields: str | None, schema, id_field: str) -> list | None:
+    """Sparse fieldset: "title,price" -> [id_field, "title", "price"]; None means every field."""
+    if fields is None:
+        return None
+    allowed = fastjson.field_names(schema)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys([id_field, *requested]))
+
+
+def _render(content, schema, response: Response, fields: list | None = None):
+    # FAST_JSON=1: rows built by crud skip response_model validation (see app.fastjson);
+    # so do sparse fieldsets, which response_model would reject as incomplete
+    if fastjson.ENABLED or fields is not None:
+        return fastjson.respond(content, schema, response, fields)
+    return content
+
+
+def _render_batch(batch: dict, fields: list | None = None):
+    # {"items", "missing"} of a batch route, with the items narrowed to a sparse fieldset
+    if fields is None:
+        return batch
+    return fastjson.FastJSONResponse({"items": fastjson.project(batch["items"], tuple(fields)), "missing": batch["missing"]})
+
+
+def _conditional(request: Request, response: Response, versions, variant: str = "") -> Response | None:
+    """Tag the response with the ETag of `versions` ((id, updatedAt) pairs).
+
+    Returns a bodiless 304 instead when the request's If-None-Match already has
+    that ETag; the caller returns it as is, skipping serialization.
+    """
+    tag = etag.compute(versions, variant)
+    # clients may keep the response but must revalidate, which costs them a 304 at most
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if etag.matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# GET /authors/, /categories/ and /books/ without parameters are served from memory by
+# SnapshotMiddleware; these build the same first page the routes below return
+_FIRST_PAGE = 100  # the routes' default limit
+snapshot.catalog.register(
+    "/authors/", lambda db, limit: crud.get_authors(db, 0, limit), schemas.Author,
+    lambda r: [r.authorID], lambda r: (r.authorID, r.updatedAt), _FIRST_PAGE,
+)
+snapshot.catalog.register(
+    "/categories/", lambda db, limit: crud.get_categories(db, 0, limit), schemas.Category,
+    lambda r: [r.categoryID], lambda r: (r.categoryID, r.updatedAt), _FIRST_PAGE,
+)
+snapshot.catalog.register(
+    "/books/", lambda db, limit: crud.find_books(db, 0, limit), schemas.Book,
+    lambda b: ["bookID", b["bookID"]], lambda b: (b["bookID"], b["updatedAt"]), _FIRST_PAGE,
+)
+
+
 @app.get("/authors/", response_model=List[schemas.Author])
-def list_authors(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_authors(db, skip, limit)
+def list_authors(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: Session = Depends(get_read_db),
+):
+    after = _decode_cursor(cursor)
+    variant = _set_total(response, count and counts.total(db, "author", count))
+    if request.headers.get("if-none-match"):
+        not_modified = _conditional(request, response, crud.get_author_versions(db, skip, limit, after), variant)
+        if not_modified:
+            return not_modified
+    rows = crud.get_authors(db, skip, limit, after=after)
+    _set_next_cursor(response, rows, limit, lambda r: [r.authorID])
+    versions = [(r.authorID, r.updatedAt) for r in rows]
+    return _conditional(request, response, versions, variant) or _render(rows, schemas.Author, response)
 
 
 @app.post("/authors/", response_model=schemas.Author)
@@ -29,12 +196,19 @@ def create_author(author: schemas.AuthorCreate, db: Session = Depends(get_db)):
     return crud.create_author(db, author)
 
 
+@app.get("/authors/batch", response_model=schemas.AuthorBatch)
+def get_authors_batch(ids: str, db: Session = Depends(get_read_db)):
+    # declared before /authors/{author_id} so "batch" is not taken for an id
+    return crud.get_authors_batch(db, _parse_ids(ids))
+
+
 @app.get("/authors/{author_id}", response_model=schemas.Author)
-def get_author(author_id: int, db: Session = Depends(get_db)):
+def get_author(author_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    # served from the entity cache when possible, so a 304 usually costs no query
     db_obj = crud.get_author(db, author_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Author not found")
-    return db_obj
+    return _conditional(request, response, [(author_id, db_obj["updatedAt"])]) or _render(db_obj, schemas.Author, response)
 
 
 @app.put("/authors/{author_id}", response_model=schemas.Author)
@@ -54,8 +228,25 @@ def delete_author(author_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/categories/", response_model=List[schemas.Category])
-def list_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_categories(db, skip, limit)
+def list_categories(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: Session = Depends(get_read_db),
+):
+    after = _decode_cursor(cursor)
+    variant = _set_total(response, count and counts.total(db, "category", count))
+    if request.headers.get("if-none-match"):
+        not_modified = _conditional(request, response, crud.get_category_versions(db, skip, limit, after), variant)
+        if not_modified:
+            return not_modified
+    rows = crud.get_categories(db, skip, limit, after=after)
+    _set_next_cursor(response, rows, limit, lambda r: [r.categoryID])
+    versions = [(r.categoryID, r.updatedAt) for r in rows]
+    return _conditional(request, response, versions, variant) or _render(rows, schemas.Category, response)
 
 
 @app.post("/categories/", response_model=schemas.Category)
@@ -64,11 +255,12 @@ def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_
 
 
 @app.get("/categories/{category_id}", response_model=schemas.Category)
-def get_category(category_id: int, db: Session = Depends(get_db)):
+def get_category(category_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    # served from the entity cache when possible, so a 304 usually costs no query
     db_obj = crud.get_category(db, category_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Category not found")
-    return db_obj
+    return _conditional(request, response, [(category_id, db_obj["updatedAt"])]) or _render(db_obj, schemas.Category, response)
 
 
 @app.put("/categories/{category_id}", response_model=schemas.Category)
@@ -89,6 +281,8 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 
 @app.get("/books/", response_model=List[schemas.Book])
 def list_books(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     author_id: int | None = None,
@@ -97,10 +291,22 @@ def list_books(
     year: int | None = None,
     min_price: int | None = None,
     max_price: int | None = None,
-    db: Session = Depends(get_db),
+    sort: str = "bookID",
+    cursor: str | None = None,
+    fields: str | None = None,
+    count: str | None = _COUNT,
+    db: Session = Depends(get_read_db),
 ):
-    books = crud.find_books(
-        db,
+    # fields=title,price narrows both the query and the response
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    variant = ",".join(selected or ())
+    # book cursors carry the sort they were issued for: [sort, *key]
+    after = _decode_cursor(cursor, types=None)
+    if after is not None:
+        if after[0] != sort:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort")
+        after = after[1:]
+    filters = dict(
         skip=skip,
         limit=limit,
         author_id=author_id,
@@ -109,8 +315,21 @@ def list_books(
         year=year,
         min_price=min_price,
         max_price=max_price,
+        sort=sort,
+        after=after,
     )
-    return books
+    variant += _set_total(response, count and crud.count_books(db, count, author_id, category_id, title, year, min_price, max_price))
+    try:
+        if request.headers.get("if-none-match"):
+            not_modified = _conditional(request, response, crud.find_book_versions(db, **filters), variant)
+            if not_modified:
+                return not_modified
+        books = crud.find_books(db, **filters, fields=selected)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    _set_next_cursor(response, books, limit, lambda b: [sort, *crud.book_sort_key(sort, b)])
+    versions = [(b["bookID"], b["updatedAt"]) for b in books]
+    return _conditional(request, response, versions, variant) or _render(books, schemas.Book, response, selected)
 
 
 @app.post("/books/", response_model=schemas.Book)
@@ -118,17 +337,101 @@ def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
     return crud.create_book(db, book)
 
 
+@app.post("/books/bulk", response_model=schemas.IngestResult)
+async def bulk_ingest_books(
+    request: Request,
+    batch_size: int = Query(ingest.BATCH_SIZE, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    # streamed NDJSON (default) or CSV body; each batch is inserted and committed on its own
+    ingester = ingest.Ingester()
+    async for batch in ingest.read_batches(request, batch_size):
+        await run_in_threadpool(ingester.process, db, batch)
+    return ingester.result
+
+
+@app.get("/books/facets", response_model=schemas.BookFacets)
+def book_facets(
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    top: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    # same filters as GET /books/; all counts come from one query (cached when unfiltered)
+    return crud.book_facets(db, author_id, category_id, title, year, min_price, max_price, top)
+
+
+@app.get("/books/search", response_model=List[schemas.Book])
+def search_books(
+    response: Response,
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    fields: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    # ranked full-text search over title, description and author names
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    return _render(crud.search_books(db, q, skip, limit, selected), schemas.Book, response, selected)
+
+
+@app.get("/books/batch", response_model=schemas.BookBatch)
+def get_books_batch(ids: str, fields: str | None = None, db: Session = Depends(get_read_db)):
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    return _render_batch(crud.get_books_batch(db, _parse_ids(ids)), selected)
+
+
 @app.get("/books/{book_id}", response_model=schemas.Book)
-def get_book(book_id: int, db: Session = Depends(get_db)):
+def get_book(
+    book_id: int,
+    request: Request,
+    response: Response,
+    fields: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    # served from the entity cache when possible, so a 304 usually costs no query;
+    # the cached row is complete, so fields= only narrows the response
+    selected = _parse_fields(fields, schemas.Book, "bookID")
     db_obj = crud.get_book(db, book_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Book not found")
-    return db_obj
+    variant = ",".join(selected or ())
+    return _conditional(request, response, [(book_id, db_obj["updatedAt"])], variant) or _render(db_obj, schemas.Book, response, selected)
 
 
 @app.get("/books/{book_id}/image")
-def serve_book_image(book_id: int, db: Session = Depends(get_db)):
-    raise HTTPException(status_code=404, detail="Image endpoint removed; images are stored as strings/URLs")
+def serve_book_image(book_id: int, size: int | None = None, db: Session = Depends(get_read_db)):
+    # a cached lookup, then a redirect to the immutable /images/ URL
+    return images.redirect(crud.get_book_image(db, book_id), size)
+
+
+@app.put("/books/{book_id}/image", response_model=schemas.BookImage)
+def upload_book_image(book_id: int, data: bytes = Depends(images.read_upload), db: Session = Depends(get_db)):
+    # the raw image is the request body (curl --data-binary @cover.jpg)
+    try:
+        name = images.store(data)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if not crud.set_book_image(db, book_id, name):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"bookID": book_id, "image": name, "url": images.URL_PREFIX + name}
+
+
+@app.delete("/books/{book_id}/image")
+def delete_book_image(book_id: int, db: Session = Depends(get_db)):
+    # the file stays: other books may use it
+    if not crud.set_book_image(db, book_id, None):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"ok": True}
+
+
+@app.get("/images/{name}")
+def serve_image(name: str, request: Request):
+    return images.serve(name, request)
 
 
 @app.put("/books/{book_id}", response_model=schemas.Book)
@@ -150,27 +453,51 @@ def delete_book(book_id: int, db: Session = Depends(get_db)):
  
 
 
-@app.get("/customers/", response_model=List[schemas.Customer])
-def list_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_customers(db, skip, limit)
+@app.get("/customers/", response_model=List[schemas.CustomerOut])
+def list_customers(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: Session = Depends(get_read_db),
+):
+    rows = crud.get_customers(db, skip, limit, after=_decode_cursor(cursor))
+    _set_total(response, count and counts.total(db, "customer", count))
+    _set_next_cursor(response, rows, limit, lambda r: [r.customerID])
+    return rows
+
+
+async def _hash_password(customer: schemas.CustomerCreate) -> schemas.CustomerCreate:
+    # hashing is slow on purpose; do it on auth's own pool, not in a request worker
+    if not customer.password:
+        return customer
+    return customer.copy(update={"password": await auth.hash_password_async(customer.password)})
+
+
+@app.post("/customers/", response_model=schemas.CustomerOut)
+async def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+    customer = await _hash_password(customer)
+    return await run_in_threadpool(crud.create_customer, db, customer)
 
 
-@app.post("/customers/", response_model=schemas.Customer)
-def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    return crud.create_customer(db, customer)
+@app.get("/customers/batch", response_model=schemas.CustomerBatch)
+def get_customers_batch(ids: str, db: Session = Depends(get_read_db)):
+    return crud.get_customers_batch(db, _parse_ids(ids))
 
 
-@app.get("/customers/{customer_id}", response_model=schemas.Customer)
-def get_customer(customer_id: int, db: Session = Depends(get_db)):
+@app.get("/customers/{customer_id}", response_model=schemas.CustomerOut)
+def get_customer(customer_id: int, db: Session = Depends(get_read_db)):
     db_obj = crud.get_customer(db, customer_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_obj
 
 
-@app.put("/customers/{customer_id}", response_model=schemas.Customer)
-def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    db_obj = crud.update_customer(db, customer_id, customer)
+@app.put("/customers/{customer_id}", response_model=schemas.CustomerOut)
+async def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+    customer = await _hash_password(customer)
+    db_obj = await run_in_threadpool(crud.update_customer, db, customer_id, customer)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_obj
@@ -185,17 +512,30 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/orders/", response_model=List[schemas.BookOrder])
-def list_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_orders(db, skip, limit)
+def list_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: Session = Depends(get_read_db),
+):
+    rows = crud.get_orders(db, skip, limit, after=_decode_cursor(cursor))
+    _set_total(response, count and counts.total(db, "order", count))
+    _set_next_cursor(response, rows, limit, lambda r: [r.orderID])
+    return rows
 
 
-@app.post("/orders/", response_model=schemas.BookOrder)
+@app.post("/orders/", response_model=schemas.BookOrderDetail)
 def create_order(order: schemas.BookOrderCreate, db: Session = Depends(get_db)):
-    return crud.create_order(db, order)
+    try:
+        return crud.create_order(db, order)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 @app.get("/orders/{order_id}", response_model=schemas.BookOrder)
-def get_order(order_id: int, db: Session = Depends(get_db)):
+def get_order(order_id: int, db: Session = Depends(get_read_db)):
     db_obj = crud.get_order(db, order_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -219,8 +559,16 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/orderings/", response_model=List[schemas.Ordering])
-def list_orderings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_orderings(db, skip, limit)
+def list_orderings(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    rows = crud.get_orderings(db, skip, limit, after=_decode_cursor(cursor, types=(int, int, int)))
+    _set_next_cursor(response, rows, limit, lambda r: [r.bookID, r.orderID, r.customer_id])
+    return rows
 
 
 @app.post("/orderings/", response_model=schemas.Ordering)
@@ -236,20 +584,134 @@ def delete_ordering(book_id: int, order_id: int, customer_id: int, db: Session =
     return {"ok": True}
 
 
+# Full-table exports for nightly catalog pulls; streamed from a server-side cursor
+@app.get("/export/{kind}")
+async def export_table(
+    kind: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(export.BATCH_SIZE, ge=1, le=10000),
+    authorization: str | None = Header(None),
+):
+    if kind not in export.EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {kind}")
+    export.authorize(kind, authorization)
+    return StreamingResponse(
+        export.stream(kind, format, batch_size),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'},
+    )
+
+
+def _login_response(cust: models.Customer) -> dict:
+    # response_model drops the password column
+    data = {attr.key: getattr(cust, attr.key) for attr in inspect(cust).mapper.column_attrs}
+    data.update(token=auth.tokens.issue(cust.customerID), expires_in=int(auth.tokens.ttl))
+    return data
+
+
 # Login endpoint
-@app.post("/login", response_model=schemas.CustomerOut)
-def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
-    cust = crud.authenticate_customer(db, payload.user, payload.password)
-    if not cust:
+@app.post("/login", response_model=schemas.LoginResponse)
+async def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
+    # one indexed lookup by user; the password check runs on auth's hashing pool
+    cust = await run_in_threadpool(crud.get_customer_by_user, db, payload.user)
+    ok, new_hash = await auth.verify_password_async(payload.password, cust.password if cust else None)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    return cust
+    data = _login_response(cust)
+    if new_hash:
+        await run_in_threadpool(crud.set_customer_password, db, cust.customerID, new_hash)
+    return data
+
+
+@app.post("/logout")
+def logout(token: str = Depends(auth.bearer_token)):
+    auth.tokens.revoke(token)
+    return {"ok": True}
 
 
 # Return orders for a given customer with book title and price
 @app.get("/customers/{customer_id}/orders_info", response_model=List[schemas.CustomerOrder])
-def customer_orders(customer_id: int, db: Session = Depends(get_db)):
-    # verify customer exists
-    cust = crud.get_customer(db, customer_id)
-    if not cust:
+def customer_orders(
+    customer_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    cursor: str | None = None,
+    db: Session = Depends(get_read_db),
+):
+    # newest first; the cursor key is [order date, orderID]
+    try:
+        orders = crud.get_customer_orders(
+            db, customer_id, skip, limit, date_from, date_to, after=_decode_cursor(cursor, types=(str, int))
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # the customer lookup is only needed to tell "no orders" from "no customer"
+    if not orders and not crud.get_customer(db, customer_id):
         raise HTTPException(status_code=404, detail="Customer not found")
-    return crud.get_customer_orders(db, customer_id)
+    _set_next_cursor(response, orders, limit, crud.customer_order_key)
+    return orders
+
+
+@app.get("/me/orders_info", response_model=List[schemas.CustomerOrder])
+def my_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    cursor: str | None = None,
+    customer_id: int = Depends(auth.current_customer_id),
+    db: Session = Depends(get_read_db),
+):
+    # same as /customers/{id}/orders_info for the customer behind the bearer token
+    return customer_orders(customer_id, response, skip, limit, date_from, date_to, cursor, db)
+
+
+# Sales analytics, read from the incrementally maintained aggregates (see app.sales)
+_SALES_BY = Query("units", pattern="^(units|revenue)$")
+_SALES_LIMIT = Query(10, ge=1, le=100)
+
+
+@app.get("/analytics/books", response_model=List[schemas.BookSales])
+def best_selling_books(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: Session = Depends(get_read_db)):
+    return sales.top(db, "book", by, limit)
+
+
+@app.get("/analytics/categories", response_model=List[schemas.CategorySales])
+def best_selling_categories(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: Session = Depends(get_read_db)):
+    return sales.top(db, "category", by, limit)
+
+
+@app.get("/analytics/authors", response_model=List[schemas.AuthorSales])
+def best_selling_authors(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: Session = Depends(get_read_db)):
+    return sales.top(db, "author", by, limit)
+
+
+@app.get("/analytics/days", response_model=List[schemas.DaySales])
+def sales_by_day(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = Query(366, ge=1, le=3660),
+    db: Session = Depends(get_read_db),
+):
+    return sales.by_day(db, date_from, date_to, limit)
+
+
+# Delta sync for offline clients: rows changed since the token (see app.changes).
+# Catalog changes go to everyone; order changes only to the customer behind the bearer token.
+@app.get("/sync", response_model=schemas.SyncResult)
+def sync(
+    since: str | None = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    customer_id: int | None = Depends(auth.optional_customer_id),
+    db: Session = Depends(get_read_db),
+):
+    seq = _decode_cursor(since)
+    # _decode_cursor already refused anything but one int (bool included)
+    if seq is not None and seq[0] < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return crud.sync_changes(db, seq[0] if seq else None, customer_id, limit)
+
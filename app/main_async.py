@@ -0,0 +1,606 @@
+"""Async variant of app.main.
+
+Same routes and responses, but every handler is a coroutine running on an
+AsyncSession, so concurrency is not capped by the threadpool that runs sync
+routes. Select it with APP_MODULE=app.main_async:app (see Dockerfile).
+"""
+import contextlib
+from datetime import date
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from . import schemas, crud, async_crud, auth, export, images, ingest, metrics, migrations, pool, replicas, rollup, snapshot
+from .async_database import async_engine, async_read_replicas, get_async_db, get_async_read_db
+from .cache import entity_cache
+from .database import engine
+from .main import (
+    _SALES_BY,
+    _COUNT,
+    _SALES_LIMIT,
+    _conditional,
+    _decode_cursor,
+    _hash_password,
+    _login_response,
+    _parse_fields,
+    _parse_ids,
+    _render,
+    _render_batch,
+    _set_next_cursor,
+    _set_total,
+)
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # same startup check as app.main (on the sync engine, which exports and bulk imports use
+    # too), then one asyncio connection so the first request does not pay for connecting
+    await run_in_threadpool(migrations.ensure_current, engine)
+    async with async_engine.connect():
+        pass
+    # deltas are folded on the sync engine, in a thread of their own
+    rollup.worker.start(engine)
+    yield
+    rollup.worker.stop()
+
+
+app = FastAPI(title="Bookstore API", lifespan=lifespan)
+# the catalog snapshots are registered by app.main
+app.add_middleware(snapshot.SnapshotMiddleware, routes=app.routes)
+app.add_middleware(replicas.ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+# app.main instruments the sync engine used by exports and bulk imports
+metrics.instrument(async_engine.sync_engine)
+for replica in async_read_replicas.replicas:
+    metrics.instrument(replica.engine.sync_engine)
+
+
+@app.get("/", include_in_schema=False)
+async def root():
+    return RedirectResponse(url="/docs")
+
+
+@app.get("/internal/cache", include_in_schema=False)
+async def cache_stats():
+    return entity_cache.stats()
+
+
+@app.get("/internal/pool", include_in_schema=False)
+async def pool_stats():
+    return pool.stats()
+
+
+@app.get("/internal/replicas", include_in_schema=False)
+async def replica_stats():
+    return async_read_replicas.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_text():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/authors/", response_model=List[schemas.Author])
+async def list_authors(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    after = _decode_cursor(cursor)
+    variant = _set_total(response, count and await async_crud.count_rows(db, "author", count))
+    if request.headers.get("if-none-match"):
+        not_modified = _conditional(request, response, await async_crud.get_author_versions(db, skip, limit, after), variant)
+        if not_modified:
+            return not_modified
+    rows = await async_crud.get_authors(db, skip, limit, after=after)
+    _set_next_cursor(response, rows, limit, lambda r: [r.authorID])
+    versions = [(r.authorID, r.updatedAt) for r in rows]
+    return _conditional(request, response, versions, variant) or _render(rows, schemas.Author, response)
+
+
+@app.post("/authors/", response_model=schemas.Author)
+async def create_author(author: schemas.AuthorCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_author(db, author)
+
+
+@app.get("/authors/batch", response_model=schemas.AuthorBatch)
+async def get_authors_batch(ids: str, db: AsyncSession = Depends(get_async_read_db)):
+    return await async_crud.get_authors_batch(db, _parse_ids(ids))
+
+
+@app.get("/authors/{author_id}", response_model=schemas.Author)
+async def get_author(author_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    # served from the entity cache when possible, so a 304 usually costs no query
+    db_obj = await async_crud.get_author(db, author_id)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Author not found")
+    return _conditional(request, response, [(author_id, db_obj["updatedAt"])]) or _render(db_obj, schemas.Author, response)
+
+
+@app.put("/authors/{author_id}", response_model=schemas.Author)
+async def update_author(author_id: int, author: schemas.AuthorCreate, db: AsyncSession = Depends(get_async_db)):
+    db_obj = await async_crud.update_author(db, author_id, author)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Author not found")
+    return db_obj
+
+
+@app.delete("/authors/{author_id}")
+async def delete_author(author_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_author(db, author_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Author not found")
+    return {"ok": True}
+
+
+@app.get("/categories/", response_model=List[schemas.Category])
+async def list_categories(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    after = _decode_cursor(cursor)
+    variant = _set_total(response, count and await async_crud.count_rows(db, "category", count))
+    if request.headers.get("if-none-match"):
+        not_modified = _conditional(request, response, await async_crud.get_category_versions(db, skip, limit, after), variant)
+        if not_modified:
+            return not_modified
+    rows = await async_crud.get_categories(db, skip, limit, after=after)
+    _set_next_cursor(response, rows, limit, lambda r: [r.categoryID])
+    versions = [(r.categoryID, r.updatedAt) for r in rows]
+    return _conditional(request, response, versions, variant) or _render(rows, schemas.Category, response)
+
+
+@app.post("/categories/", response_model=schemas.Category)
+async def create_category(category: schemas.CategoryCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_category(db, category)
+
+
+@app.get("/categories/{category_id}", response_model=schemas.Category)
+async def get_category(category_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    # served from the entity cache when possible, so a 304 usually costs no query
+    db_obj = await async_crud.get_category(db, category_id)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return _conditional(request, response, [(category_id, db_obj["updatedAt"])]) or _render(db_obj, schemas.Category, response)
+
+
+@app.put("/categories/{category_id}", response_model=schemas.Category)
+async def update_category(category_id: int, category: schemas.CategoryCreate, db: AsyncSession = Depends(get_async_db)):
+    db_obj = await async_crud.update_category(db, category_id, category)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return db_obj
+
+
+@app.delete("/categories/{category_id}")
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_category(db, category_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return {"ok": True}
+
+
+@app.get("/books/", response_model=List[schemas.Book])
+async def list_books(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    sort: str = "bookID",
+    cursor: str | None = None,
+    fields: str | None = None,
+    count: str | None = _COUNT,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # fields=title,price narrows both the query and the response
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    variant = ",".join(selected or ())
+    # book cursors carry the sort they were issued for: [sort, *key]
+    after = _decode_cursor(cursor, types=None)
+    if after is not None:
+        if after[0] != sort:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort")
+        after = after[1:]
+    filters = dict(
+        skip=skip,
+        limit=limit,
+        author_id=author_id,
+        category_id=category_id,
+        title=title,
+        year=year,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        after=after,
+    )
+    variant += _set_total(response, count and await async_crud.count_books(
+        db, count, author_id, category_id, title, year, min_price, max_price,
+    ))
+    try:
+        if request.headers.get("if-none-match"):
+            not_modified = _conditional(request, response, await async_crud.find_book_versions(db, **filters), variant)
+            if not_modified:
+                return not_modified
+        books = await async_crud.find_books(db, **filters, fields=selected)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    _set_next_cursor(response, books, limit, lambda b: [sort, *crud.book_sort_key(sort, b)])
+    versions = [(b["bookID"], b["updatedAt"]) for b in books]
+    return _conditional(request, response, versions, variant) or _render(books, schemas.Book, response, selected)
+
+
+@app.post("/books/", response_model=schemas.Book)
+async def create_book(book: schemas.BookCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_book(db, book)
+
+
+@app.post("/books/bulk", response_model=schemas.IngestResult)
+async def bulk_ingest_books(
+    request: Request,
+    batch_size: int = Query(ingest.BATCH_SIZE, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    ingester = ingest.Ingester()
+    async for batch in ingest.read_batches(request, batch_size):
+        await db.run_sync(ingester.process, batch)
+    return ingester.result
+
+
+@app.get("/books/facets", response_model=schemas.BookFacets)
+async def book_facets(
+    author_id: int | None = None,
+    category_id: int | None = None,
+    title: str | None = None,
+    year: int | None = None,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    top: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await async_crud.book_facets(db, author_id, category_id, title, year, min_price, max_price, top)
+
+
+@app.get("/books/search", response_model=List[schemas.Book])
+async def search_books(
+    response: Response,
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    fields: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # ranked full-text search over title, description and author names
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    return _render(await async_crud.search_books(db, q, skip, limit, selected), schemas.Book, response, selected)
+
+
+@app.get("/books/batch", response_model=schemas.BookBatch)
+async def get_books_batch(ids: str, fields: str | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    return _render_batch(await async_crud.get_books_batch(db, _parse_ids(ids)), selected)
+
+
+@app.get("/books/{book_id}", response_model=schemas.Book)
+async def get_book(
+    book_id: int,
+    request: Request,
+    response: Response,
+    fields: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # served from the entity cache when possible, so a 304 usually costs no query;
+    # the cached row is complete, so fields= only narrows the response
+    selected = _parse_fields(fields, schemas.Book, "bookID")
+    db_obj = await async_crud.get_book(db, book_id)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Book not found")
+    variant = ",".join(selected or ())
+    return _conditional(request, response, [(book_id, db_obj["updatedAt"])], variant) or _render(db_obj, schemas.Book, response, selected)
+
+
+@app.get("/books/{book_id}/image")
+async def serve_book_image(book_id: int, size: int | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    image = await async_crud.get_book_image(db, book_id)
+    # redirect() may stat a thumbnail
+    return await run_in_threadpool(images.redirect, image, size)
+
+
+@app.put("/books/{book_id}/image", response_model=schemas.BookImage)
+async def upload_book_image(book_id: int, data: bytes = Depends(images.read_upload), db: AsyncSession = Depends(get_async_db)):
+    # hashing, thumbnails and file writes stay off the event loop
+    try:
+        name = await run_in_threadpool(images.store, data)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if not await async_crud.set_book_image(db, book_id, name):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"bookID": book_id, "image": name, "url": images.URL_PREFIX + name}
+
+
+@app.delete("/books/{book_id}/image")
+async def delete_book_image(book_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await async_crud.set_book_image(db, book_id, None):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"ok": True}
+
+
+@app.get("/images/{name}")
+async def serve_image(name: str, request: Request):
+    return await run_in_threadpool(images.serve, name, request)
+
+
+@app.put("/books/{book_id}", response_model=schemas.Book)
+async def update_book(book_id: int, book: schemas.BookCreate, db: AsyncSession = Depends(get_async_db)):
+    db_obj = await async_crud.update_book(db, book_id, book)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return db_obj
+
+
+@app.delete("/books/{book_id}")
+async def delete_book(book_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_book(db, book_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"ok": True}
+
+
+@app.get("/customers/", response_model=List[schemas.CustomerOut])
+async def list_customers(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    rows = await async_crud.get_customers(db, skip, limit, after=_decode_cursor(cursor))
+    _set_total(response, count and await async_crud.count_rows(db, "customer", count))
+    _set_next_cursor(response, rows, limit, lambda r: [r.customerID])
+    return rows
+
+
+@app.post("/customers/", response_model=schemas.CustomerOut)
+async def create_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_async_db)):
+    customer = await _hash_password(customer)
+    return await async_crud.create_customer(db, customer)
+
+
+@app.get("/customers/batch", response_model=schemas.CustomerBatch)
+async def get_customers_batch(ids: str, db: AsyncSession = Depends(get_async_read_db)):
+    return await async_crud.get_customers_batch(db, _parse_ids(ids))
+
+
+@app.get("/customers/{customer_id}", response_model=schemas.CustomerOut)
+async def get_customer(customer_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    db_obj = await async_crud.get_customer(db, customer_id)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return db_obj
+
+
+@app.put("/customers/{customer_id}", response_model=schemas.CustomerOut)
+async def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_async_db)):
+    customer = await _hash_password(customer)
+    db_obj = await async_crud.update_customer(db, customer_id, customer)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return db_obj
+
+
+@app.delete("/customers/{customer_id}")
+async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_customer(db, customer_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return {"ok": True}
+
+
+@app.get("/orders/", response_model=List[schemas.BookOrder])
+async def list_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: str | None = _COUNT,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    rows = await async_crud.get_orders(db, skip, limit, after=_decode_cursor(cursor))
+    _set_total(response, count and await async_crud.count_rows(db, "order", count))
+    _set_next_cursor(response, rows, limit, lambda r: [r.orderID])
+    return rows
+
+
+@app.post("/orders/", response_model=schemas.BookOrderDetail)
+async def create_order(order: schemas.BookOrderCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await async_crud.create_order(db, order)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.get("/orders/{order_id}", response_model=schemas.BookOrder)
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    db_obj = await async_crud.get_order(db, order_id)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return db_obj
+
+
+@app.put("/orders/{order_id}", response_model=schemas.BookOrder)
+async def update_order(order_id: int, order: schemas.BookOrderCreate, db: AsyncSession = Depends(get_async_db)):
+    db_obj = await async_crud.update_order(db, order_id, order)
+    if not db_obj:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return db_obj
+
+
+@app.delete("/orders/{order_id}")
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_order(db, order_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return {"ok": True}
+
+
+@app.get("/orderings/", response_model=List[schemas.Ordering])
+async def list_orderings(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    rows = await async_crud.get_orderings(db, skip, limit, after=_decode_cursor(cursor, types=(int, int, int)))
+    _set_next_cursor(response, rows, limit, lambda r: [r.bookID, r.orderID, r.customer_id])
+    return rows
+
+
+@app.post("/orderings/", response_model=schemas.Ordering)
+async def create_ordering(ordering: schemas.OrderingCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_ordering(db, ordering)
+
+
+@app.delete("/orderings/{book_id}/{order_id}/{customer_id}")
+async def delete_ordering(book_id: int, order_id: int, customer_id: int, db: AsyncSession = Depends(get_async_db)):
+    ok = await async_crud.delete_ordering(db, book_id, order_id, customer_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Ordering not found")
+    return {"ok": True}
+
+
+# Full-table exports; app.export streams them from a server-side cursor on the sync engine
+@app.get("/export/{kind}")
+async def export_table(
+    kind: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(export.BATCH_SIZE, ge=1, le=10000),
+    authorization: str | None = Header(None),
+):
+    if kind not in export.EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {kind}")
+    export.authorize(kind, authorization)
+    return StreamingResponse(
+        export.stream(kind, format, batch_size),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'},
+    )
+
+
+# Login endpoint
+@app.post("/login", response_model=schemas.LoginResponse)
+async def login(payload: schemas.LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    # one indexed lookup by user; the password check runs on auth's hashing pool
+    cust = await async_crud.get_customer_by_user(db, payload.user)
+    ok, new_hash = await auth.verify_password_async(payload.password, cust.password if cust else None)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    data = _login_response(cust)
+    if new_hash:
+        await async_crud.set_customer_password(db, cust.customerID, new_hash)
+    return data
+
+
+@app.post("/logout")
+async def logout(token: str = Depends(auth.bearer_token)):
+    auth.tokens.revoke(token)
+    return {"ok": True}
+
+
+# Return orders for a given customer with book title and price
+@app.get("/customers/{customer_id}/orders_info", response_model=List[schemas.CustomerOrder])
+async def customer_orders(
+    customer_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # newest first; the cursor key is [order date, orderID]
+    try:
+        orders = await async_crud.get_customer_orders(
+            db, customer_id, skip, limit, date_from, date_to, after=_decode_cursor(cursor, types=(str, int))
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # the customer lookup is only needed to tell "no orders" from "no customer"
+    if not orders and not await async_crud.get_customer(db, customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    _set_next_cursor(response, orders, limit, crud.customer_order_key)
+    return orders
+
+
+@app.get("/me/orders_info", response_model=List[schemas.CustomerOrder])
+async def my_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    cursor: str | None = None,
+    customer_id: int = Depends(auth.current_customer_id),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    # same as /customers/{id}/orders_info for the customer behind the bearer token
+    return await customer_orders(customer_id, response, skip, limit, date_from, date_to, cursor, db)
+
+
+@app.get("/analytics/books", response_model=List[schemas.BookSales])
+async def best_selling_books(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: AsyncSession = Depends(get_async_read_db)):
+    return await async_crud.top_sales(db, "book", by, limit)
+
+
+@app.get("/analytics/categories", response_model=List[schemas.CategorySales])
+async def best_selling_categories(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: AsyncSession = Depends(get_async_read_db)):
+    return await async_crud.top_sales(db, "category", by, limit)
+
+
+@app.get("/analytics/authors", response_model=List[schemas.AuthorSales])
+async def best_selling_authors(by: str = _SALES_BY, limit: int = _SALES_LIMIT, db: AsyncSession = Depends(get_async_read_db)):
+    return await async_crud.top_sales(db, "author", by, limit)
+
+
+@app.get("/analytics/days", response_model=List[schemas.DaySales])
+async def sales_by_day(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = Query(366, ge=1, le=3660),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await async_crud.sales_by_day(db, date_from, date_to, limit)
+
+
+# Delta sync for offline clients: rows changed since the token (see app.changes).
+# Catalog changes go to everyone; order changes only to the customer behind the bearer token.
+@app.get("/sync", response_model=schemas.SyncResult)
+async def sync(
+    since: str | None = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    customer_id: int | None = Depends(auth.optional_customer_id),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    seq = _decode_cursor(since)
+    # _decode_cursor already refused anything but one int (bool included)
+    if seq is not None and seq[0] < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return await async_crud.sync_changes(db, seq[0] if seq else None, customer_id, limit)
+
@@ -0,0 +1,252 @@
+"""Request and SQL instrumentation, exposed in the Prometheus text format.
+
+MetricsMiddleware times every request and labels it with the route template
+(`/books/{book_id}`, not the concrete path), method and status. Statements
+run on an engine passed to `instrument` are timed as well, and attributed to
+the request that issued them through a context variable, so each request
+also records how many queries it ran, how long it spent in the database and
+how many rows the driver reported (psycopg2 reports rows for SELECTs too;
+SQLite only for writes).
+
+The bookkeeping is a few counters and one short lock per request and per
+statement, cheap enough to leave on. Slow requests and slow statements are
+counted and logged as warnings.
+
+Settings (all optional):
+
+- METRICS_SLOW_REQUEST_MS   requests slower than this are logged (default 1000)
+- METRICS_SLOW_QUERY_MS     statements slower than this are logged (default 200)
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from . import pool
+from .cache import entity_cache
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+# upper bounds of the queries-per-request buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SLOW_REQUEST_S = float(os.getenv("METRICS_SLOW_REQUEST_MS", "1000")) / 1000
+SLOW_QUERY_S = float(os.getenv("METRICS_SLOW_QUERY_MS", "200")) / 1000
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """Database work done on behalf of one request."""
+
+    __slots__ = ("queries", "db_seconds", "rows")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current = contextvars.ContextVar("metrics_request", default=None)
+
+
+class _RouteSeries:
+    """Everything recorded for one (method, route, status)."""
+
+    __slots__ = ("latency", "queries", "db_seconds", "rows", "slow")
+
+    def __init__(self):
+        self.latency = pool.Histogram(LATENCY_BUCKETS_S)
+        self.queries = pool.Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # (method, route, status) -> _RouteSeries
+        self.statements = pool.Histogram(STATEMENT_BUCKETS_S)
+        self.slow_statements = 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            series = self.routes.get((method, route, status))
+            if series is None:
+                series = self.routes[(method, route, status)] = _RouteSeries()
+            series.latency.observe(seconds)
+            series.queries.observe(stats.queries)
+            series.db_seconds += stats.db_seconds
+            series.rows += stats.rows
+            if seconds >= SLOW_REQUEST_S:
+                series.slow += 1
+        if seconds >= SLOW_REQUEST_S:
+            log.warning(
+                "slow request: %s %s -> %s in %.0f ms (%d queries, %.0f ms in the database)",
+                method, route, status, seconds * 1000, stats.queries, stats.db_seconds * 1000,
+            )
+
+    def observe_statement(self, seconds: float, statement: str):
+        slow = seconds >= SLOW_QUERY_S
+        with self._lock:
+            self.statements.observe(seconds)
+            if slow:
+                self.slow_statements += 1
+        if slow:
+            log.warning("slow statement (%.0f ms): %s", seconds * 1000, " ".join(statement.split())[:500])
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no per-request task or body buffering)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            # the router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            registry.observe_request(scope["method"], getattr(route, "path", "unmatched"), status, elapsed, stats)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    registry.observe_statement(elapsed, statement)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+
+
+def instrument(engine):
+    """Time every statement run on `engine` (a sync Engine, or an AsyncEngine's sync_engine)."""
+    if not event.contains(engine, "before_cursor_execute", _before_execute):
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram(lines: list, name: str, hist: pool.Histogram, labels: dict):
+    for bound, count in hist.cumulative():
+        le = bound if bound == "+Inf" else repr(bound)
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.total!r}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+
+def _family(lines: list, name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with registry._lock:
+        # copy under the lock so a scrape sees consistent buckets, sums and counts
+        routes = {
+            key: (series.latency.copy(), series.queries.copy(), series.db_seconds, series.rows, series.slow)
+            for key, series in registry.routes.items()
+        }
+        statements, slow_statements = registry.statements.copy(), registry.slow_statements
+    lines = []
+    keys = sorted(routes)
+
+    _family(lines, "http_request_duration_seconds", "histogram", "Request latency by route template and status.")
+    for method, route, status in keys:
+        _histogram(lines, "http_request_duration_seconds", routes[(method, route, status)][0],
+                   dict(method=method, route=route, status=status))
+    _family(lines, "http_request_db_queries", "histogram", "SQL statements per request.")
+    for method, route, status in keys:
+        _histogram(lines, "http_request_db_queries", routes[(method, route, status)][1],
+                   dict(method=method, route=route, status=status))
+    for name, index, help_text in (
+        ("http_request_db_seconds_total", 2, "Time spent executing SQL statements, summed over requests."),
+        ("http_request_db_rows_total", 3, "Rows reported by the database driver, summed over requests."),
+        ("http_slow_requests_total", 4, f"Requests slower than {SLOW_REQUEST_S * 1000:.0f} ms."),
+    ):
+        _family(lines, name, "counter", help_text)
+        for method, route, status in keys:
+            value = routes[(method, route, status)][index]
+            lines.append(f"{name}{_labels(method=method, route=route, status=status)} {value!r}")
+
+    _family(lines, "db_statement_duration_seconds", "histogram", "SQL statement latency, in and outside requests.")
+    _histogram(lines, "db_statement_duration_seconds", statements, {})
+    _family(lines, "db_slow_statements_total", "counter", f"SQL statements slower than {SLOW_QUERY_S * 1000:.0f} ms.")
+    lines.append(f"db_slow_statements_total {slow_statements}")
+
+    snapshots = {name: stats.snapshot() for name, stats in pool.registry.items()}
+    for name, kind, field, help_text in (
+        ("db_pool_checked_out", "gauge", "checked_out", "Connections currently checked out."),
+        ("db_pool_overflow", "gauge", "overflow", "Connections open beyond the pool size."),
+        ("db_pool_waiting", "gauge", "waiting", "Requests waiting for a session slot."),
+        ("db_pool_timeouts_total", "counter", "timeouts", "Connection checkouts that timed out."),
+    ):
+        _family(lines, name, kind, help_text)
+        for pool_name, snapshot in snapshots.items():
+            if field in snapshot:
+                lines.append(f"{name}{_labels(pool=pool_name)} {snapshot[field]}")
+    for name, field, help_text in (
+        ("db_pool_checkout_wait_seconds", "checkout_wait_ms", "Time waiting for a pooled connection."),
+        ("db_pool_admission_wait_seconds", "admission_wait_ms", "Time waiting for a session slot (see app.pool)."),
+    ):
+        _family(lines, name, "histogram", help_text)
+        for pool_name, snapshot in snapshots.items():
+            # pool histograms are kept in milliseconds
+            labels, hist = dict(pool=pool_name), snapshot[field]
+            for bound, count in hist["buckets"].items():
+                le = bound if bound == "+Inf" else repr(float(bound) / 1000)
+                lines.append(f"{name}_bucket{_labels(**labels, le=le)} {count}")
+            lines.append(f"{name}_sum{_labels(**labels)} {hist['sum_ms'] / 1000!r}")
+            lines.append(f"{name}_count{_labels(**labels)} {hist['count']}")
+
+    cache = entity_cache.stats()
+    _family(lines, "entity_cache_entries", "gauge", "Entries in the entity cache.")
+    lines.append(f"entity_cache_entries {cache['size']}")
+    for field in ("hits", "misses", "evictions"):
+        _family(lines, f"entity_cache_{field}_total", "counter", f"Entity cache {field}.")
+        lines.append(f"entity_cache_{field}_total {cache[field]}")
+    return "\n".join(lines) + "\n"
+
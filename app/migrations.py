@@ -0,0 +1,231 @@
+"""Versioned schema migrations.
+
+Each step in MIGRATIONS runs once per database, in order, and is recorded in
+the `schema_version` table. Steps are also written to be idempotent, because
+databases created before this table existed run all of them once on their
+first upgrade.
+
+Run them as an explicit deploy step before starting the workers:
+
+    python -m app.migrations              # apply pending steps
+    python -m app.migrations --status     # show current / latest version
+    python -m app.migrations --reindex    # rebuild search side tables (SQLite FTS)
+    python -m app.migrations --rebuild-sales  # recompute the sales aggregates
+    python -m app.migrations --rebuild-counts # recount the rows behind ?count=estimate
+
+Workers only compare versions at startup (one small query, see
+`ensure_current`). They apply pending steps themselves only when
+DB_AUTO_MIGRATE is on, which is the default so local runs need no extra
+step.
+"""
+import argparse
+import logging
+import os
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, exc, func, inspect, select, text
+
+from . import counts, models, sales, search
+from .database import Base, engine as _engine
+
+log = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_version = Table(
+    "schema_version",
+    _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime, default=models.utcnow),
+)
+
+
+def _initial_schema(conn):
+    Base.metadata.create_all(conn)
+
+
+def _customer_login(conn):
+    # login looks customers up by `user`
+    for index in models.Customer.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    # password hashes do not fit the original varchar(45); SQLite does not enforce lengths
+    if conn.dialect.name == "postgresql":
+        column = next(c for c in inspect(conn).get_columns("customer") if c["name"] == "password")
+        if (getattr(column["type"], "length", None) or 255) < 255:
+            conn.execute(text("ALTER TABLE customer ALTER COLUMN password TYPE varchar(255)"))
+
+
+def _row_versions(conn):
+    # row versions behind the catalog ETags
+    for model in (models.Author, models.Category, models.Book):
+        table = model.__table__
+        if "updated_at" in {c["name"] for c in inspect(conn).get_columns(table.name)}:
+            continue
+        column_type = table.c.updated_at.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN updated_at {column_type}"))
+        # SQLite cannot add a column with a non-constant default, so existing rows are stamped here
+        conn.execute(table.update().values(updated_at=models.utcnow()))
+
+
+def _search_indexes(conn):
+    search.backend_for(conn).setup(conn)
+
+
+def _book_facet_indexes(conn):
+    # filters and facet counts on /books/ group or filter by these columns
+    for table in (models.Book.__table__, models.author_book):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _sales_aggregates(conn):
+    for table, _ in sales.TABLES.values():
+        table.create(conn, checkfirst=True)
+    # rebuild clears the pending deltas (step 10) and reads ordering.price (step 13)
+    models.sales_delta.create(conn, checkfirst=True)
+    _add_ordering_price(conn)
+    sales.rebuild(conn)
+
+
+def _change_log(conn):
+    # starts empty: clients take their first token from GET /sync after this runs
+    models.change_log.create(conn, checkfirst=True)
+
+
+def _row_counts(conn):
+    models.row_counts.create(conn, checkfirst=True)
+    # rebuild clears the pending deltas (step 11), so their table has to exist already
+    models.row_count_delta.create(conn, checkfirst=True)
+    counts.rebuild(conn)
+
+
+def _order_indexes(conn):
+    # orders_info pages a customer's orders, then joins their lines by orderid
+    for table in (models.BookOrder.__table__, models.Ordering.__table__):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _sales_deltas(conn):
+    models.sales_delta.create(conn, checkfirst=True)
+
+
+def _row_count_deltas(conn):
+    models.row_count_delta.create(conn, checkfirst=True)
+
+
+def _add_ordering_price(conn):
+    table = models.Ordering.__table__
+    if "price" not in {c["name"] for c in inspect(conn).get_columns(table.name)}:
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN price {table.c.price.type.compile(dialect=conn.dialect)}"))
+
+
+def _ordering_price(conn):
+    # sales revenue counts the price a line was sold at; existing lines get the current one
+    _add_ordering_price(conn)
+    table, b = models.Ordering.__table__, models.Book.__table__
+    conn.execute(
+        table.update()
+        .where(table.c.price.is_(None))
+        .values(price=select(b.c.price).where(b.c.bookid == table.c.bookid).scalar_subquery())
+    )
+    # the aggregates were counted at whatever the prices were; recount them at these
+    sales.rebuild(conn)
+
+
+def _search_documents(conn):
+    # Postgres moves to a book_search side table; on SQLite this refills book_fts
+    search.backend_for(conn).setup(conn)
+
+
+# (version, description, step); append only, never renumber
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "customer.user index, room for password hashes", _customer_login),
+    (3, "updated_at on author, category and book", _row_versions),
+    (4, "full-text search indexes", _search_indexes),
+    (5, "indexes for book filters and facets", _book_facet_indexes),
+    (6, "sales aggregate tables", _sales_aggregates),
+    (7, "change log for delta sync", _change_log),
+    (8, "row counts for list totals", _row_counts),
+    (9, "indexes for customer order history", _order_indexes),
+    (10, "sales deltas appended by checkouts", _sales_deltas),
+    (11, "row count deltas", _row_count_deltas),
+    (12, "search documents with author names (Postgres)", _search_documents),
+    (13, "price of each order line", _ordering_price),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade(engine) -> list:
+    """Apply pending migrations; returns the versions applied."""
+    applied = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # several workers or deploy jobs may start at once; one migrates, the rest wait
+            conn.execute(text("SELECT pg_advisory_xact_lock(7351402)"))
+        schema_version.create(conn, checkfirst=True)
+        done = current_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= done:
+                continue
+            log.info("applying migration %s: %s", version, description)
+            step(conn)
+            conn.execute(schema_version.insert().values(version=version, description=description))
+            applied.append(version)
+    return applied
+
+
+def ensure_current(engine):
+    """Startup check: one query when the schema is up to date."""
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except exc.DBAPIError:
+        version = 0  # no schema_version table yet (or no database; upgrade will say so)
+    if version >= LATEST:
+        return
+    if os.getenv("DB_AUTO_MIGRATE", "1").lower() in ("0", "false", "no"):
+        raise RuntimeError(
+            f"database schema is at version {version}, the code needs {LATEST}; run `python -m app.migrations`"
+        )
+    upgrade(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations.")
+    parser.add_argument("--status", action="store_true", help="print the current and latest version and exit")
+    parser.add_argument("--reindex", action="store_true", help="rebuild search side tables after migrating")
+    parser.add_argument("--rebuild-sales", action="store_true", help="recompute the sales aggregates after migrating")
+    parser.add_argument("--rebuild-counts", action="store_true", help="recount the rows of the listed tables after migrating")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        with _engine.connect() as conn:
+            print(f"current: {current_version(conn)}, latest: {LATEST}")
+        return
+    applied = upgrade(_engine)
+    print(f"applied: {applied or 'nothing'}; schema at version {LATEST}")
+    if args.reindex:
+        with _engine.begin() as conn:
+            search.backend_for(conn).rebuild(conn)
+        print("search index rebuilt")
+    if args.rebuild_sales:
+        with _engine.begin() as conn:
+            sales.rebuild(conn)
+        print("sales aggregates rebuilt")
+    if args.rebuild_counts:
+        with _engine.begin() as conn:
+            counts.rebuild(conn)
+        print("row counts rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Table
 from .database import Base
 
 
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _updated_at_column():
+    # row version for ETags; set on every insert and update of the row itself.
+    # crud also touches books when the author names or category they embed change.
+    return Column("updated_at", DateTime, default=utcnow, onupdate=utcnow)
+
+
 class Author(Base):
     __tablename__ = "author"
     authorID = Column("authorid", Integer, primary_key=True, index=True)
     authorName = Column("authorname", String(45), nullable=False)
+    updatedAt = _updated_at_column()
     books = relationship("Book", secondary="author_book", back_populates="authors")
 
 
@@ -16,6 +29,8 @@ author_book = Table(
     Base.metadata,
     Column("authorid", Integer, ForeignKey("author.authorid"), primary_key=True),
     Column("bookid", Integer, ForeignKey("book.bookid"), primary_key=True),
+    # the primary key leads with authorid; book -> authors joins (facets, exports) need this one
+    Index("ix_author_book_bookid", "bookid"),
 )
 
 
@@ -23,21 +38,23 @@ class Category(Base):
     __tablename__ = "category"
     categoryID = Column("categoryid", Integer, primary_key=True, index=True)
     categoryDescription = Column("categorydescription", String(45), nullable=False)
+    updatedAt = _updated_at_column()
     books = relationship("Book", back_populates="category")
 
 
 class Book(Base):
     __tablename__ = "book"
     bookID = Column("bookid", Integer, primary_key=True, index=True)
-    categoryID = Column("categoryid", Integer, ForeignKey("category.categoryid"), nullable=False)
+    categoryID = Column("categoryid", Integer, ForeignKey("category.categoryid"), nullable=False, index=True)
     title = Column(String(45), nullable=False)
     isbn = Column(String(45))
-    year = Column(Integer)
-    price = Column(Integer, nullable=False)
+    year = Column(Integer, index=True)
+    price = Column(Integer, nullable=False, index=True)
     noPages = Column("nopages", Integer)
     bookDescription = Column("bookdescription", String(500))
     # image will be a string (e.g. URL or filename) in the DB
     image = Column("image", String(500))
+    updatedAt = _updated_at_column()
 
     category = relationship("Category", back_populates="books")
     authors = relationship("Author", secondary="author_book", back_populates="books")
@@ -53,8 +70,9 @@ class Customer(Base):
     city = Column("city", String(45))
     state = Column("state", String(45))
     address = Column("address", String(100))
-    user = Column("user", String(45))
-    password = Column("password", String(45))
+    user = Column("user", String(45), index=True)
+    # scrypt hash (see app.auth); long enough for the encoded parameters, salt and digest
+    password = Column("password", String(255))
     orders = relationship("BookOrder", back_populates="customer")
 
 
@@ -63,6 +81,8 @@ class BookOrder(Base):
     orderID = Column("orderid", Integer, primary_key=True, index=True)
     customerID = Column("customerid", Integer, ForeignKey("customer.customerid"), nullable=False)
     orderDate = Column("orderdate", Date)
+    # a customer's orders by date (orders_info); also covers the customer foreign key
+    __table_args__ = (Index("ix_book_order_customerid_orderdate", "customerid", "orderdate"),)
 
     customer = relationship("Customer", back_populates="orders")
     order_items = relationship("Ordering", back_populates="order")
@@ -74,6 +94,83 @@ class Ordering(Base):
     orderID = Column("orderid", Integer, ForeignKey("book_order.orderid"), primary_key=True)
     # map to actual DB column name which uses underscore
     customer_id = Column("customer_id", Integer, primary_key=True)
+    # the book's price when the line was recorded; the sales aggregates count this
+    price = Column("price", Integer)
+    # the primary key leads with bookid; an order's lines (orders_info, order updates and deletes) need this one
+    __table_args__ = (Index("ix_ordering_orderid", "orderid"),)
 
     book = relationship("Book", back_populates="orderings")
     order = relationship("BookOrder", back_populates="order_items")
+
+
+# Sales aggregates, kept up to date by app.sales from the deltas checkouts append to sales_delta.
+# No foreign keys: a row may outlive its book or author until the next rebuild.
+def _sales_table(name: str, key: Column) -> Table:
+    return Table(
+        name,
+        Base.metadata,
+        key,
+        Column("units", Integer, nullable=False, default=0),
+        Column("revenue", BigInteger, nullable=False, default=0),
+        Index(f"ix_{name}_units", "units"),
+        Index(f"ix_{name}_revenue", "revenue"),
+    )
+
+
+sales_by_book = _sales_table("sales_by_book", Column("bookid", Integer, primary_key=True))
+sales_by_category = _sales_table("sales_by_category", Column("categoryid", Integer, primary_key=True))
+sales_by_author = _sales_table("sales_by_author", Column("authorid", Integer, primary_key=True))
+sales_by_day = _sales_table("sales_by_day", Column("day", Date, primary_key=True))
+
+# Changes to the sales aggregates not yet folded in (see app.sales.fold). Checkouts only
+# append here, so they do not queue on the shared rows of sales_by_day and sales_by_category.
+sales_delta = Table(
+    "sales_delta",
+    Base.metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("dimension", String(8), nullable=False),
+    # the book, category or author id; the day for the per-day table
+    Column("entity_id", Integer),
+    Column("day", Date),
+    Column("units", Integer, nullable=False),
+    Column("revenue", BigInteger, nullable=False),
+    Index("ix_sales_delta_dimension_entity_id", "dimension", "entity_id"),
+)
+
+
+# Change log behind GET /sync (see app.changes): one row per changed or deleted row, in seq order.
+# entity_id is the row's id (the bookID for order lines, with order_id); customer_id is set for
+# orders and order lines only.
+change_log = Table(
+    "change_log",
+    Base.metadata,
+    # INTEGER PRIMARY KEY is SQLite's auto-incrementing rowid
+    Column("seq", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("entity", String(16), nullable=False),
+    Column("entity_id", Integer, nullable=False),
+    Column("order_id", Integer),
+    Column("customer_id", Integer),
+    Column("op", String(8), nullable=False),
+    Column("recorded_at", DateTime, nullable=False),
+)
+
+
+# Row counts of the listed tables, kept up to date by app.counts from the deltas crud's inserts
+# and deletes append to row_count_delta; read for ?count=estimate on unfiltered listings.
+row_counts = Table(
+    "row_counts",
+    Base.metadata,
+    Column("entity", String(16), primary_key=True),
+    Column("n", BigInteger, nullable=False, default=0),
+)
+
+# Changes to row_counts not yet folded in (see app.counts.fold): creates and deletes append
+# here, so concurrent checkouts do not queue on the "order" row.
+row_count_delta = Table(
+    "row_count_delta",
+    Base.metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("entity", String(16), nullable=False),
+    Column("delta", Integer, nullable=False),
+    Index("ix_row_count_delta_entity", "entity"),
+)
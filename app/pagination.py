@@ -0,0 +1,58 @@
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(key) -> str:
+    """Encode a row key (list of JSON-serializable values) as an opaque cursor."""
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Inverse of encode_cursor. Raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+    if not isinstance(key, list) or not key:
+        raise ValueError("invalid cursor")
+    return key
+
+
+def check_key(key: list, types) -> list:
+    """`key` if it holds one value of each of `types`, in order; raises ValueError otherwise.
+
+    Cursors come back from clients, so their values are checked before they
+    reach SQL. bool does not count as int, and None matches no type.
+    """
+    if len(key) != len(types) or not all(
+        value is not None and not isinstance(value, bool) and isinstance(value, t) for value, t in zip(key, types)
+    ):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return object
+
+
+def keyset(q, columns, after=None, descending=False):
+    """Order `q` by `columns` and, if `after` is given, keep only rows past that key.
+
+    `columns` must form a unique key (the primary key, or a sort column plus the
+    primary key as tie-breaker) so that pages never overlap or skip rows.
+    """
+    if after is not None:
+        check_key(after, [_python_type(c) for c in columns])
+        if len(columns) == 1:
+            cond = columns[0] < after[0] if descending else columns[0] > after[0]
+        else:
+            cond = tuple_(*columns) < tuple_(*after) if descending else tuple_(*columns) > tuple_(*after)
+        q = q.filter(cond)
+    return q.order_by(*[c.desc() if descending else c for c in columns])
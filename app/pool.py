@@ -0,0 +1,203 @@
+"""Connection pool settings from the environment, plus live pool statistics.
+
+Settings (all optional):
+
+- DB_POOL_SIZE         persistent connections per process (default 10)
+- DB_MAX_OVERFLOW      extra connections allowed during spikes (default 30)
+- DB_POOL_TIMEOUT      seconds to wait for a free connection (default 10)
+- DB_POOL_RECYCLE      seconds before a connection is replaced (default 1800)
+- DB_POOL_PRE_PING     test connections on checkout, "1"/"0" (default 1)
+- DB_STATEMENT_TIMEOUT_MS  per-statement timeout on Postgres, 0 = none (default 0)
+
+get_db admits at most pool_size + max_overflow sessions at a time and
+makes the rest wait on the event loop. Without that, sync routes can
+deadlock under load: every threadpool worker blocks waiting for a
+connection, while the requests holding the connections wait for a worker
+to serialize their response before get_db can release them.
+"""
+import asyncio
+import bisect
+import contextlib
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# upper bounds (ms) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def pool_settings() -> dict:
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 30),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+    }
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus bucket layout; `bounds` are the bucket upper bounds."""
+
+    def __init__(self, bounds=WAIT_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+
+    def cumulative(self) -> list:
+        """(upper bound, observations <= bound) pairs, ending with "+Inf"."""
+        out, running = [], 0
+        for bound, count in zip(list(self.bounds) + ["+Inf"], self.buckets):
+            running += count
+            out.append((bound, running))
+        return out
+
+    def copy(self) -> "Histogram":
+        other = Histogram(self.bounds)
+        other.buckets, other.count, other.total = list(self.buckets), self.count, self.total
+        return other
+
+    def snapshot(self) -> dict:
+        buckets = {str(bound): count for bound, count in self.cumulative()}
+        return {"count": self.count, "sum_ms": round(self.total, 3), "buckets": buckets}
+
+
+class PoolStats:
+    """Live counters for one pool: checkout waits, timeouts and session admission."""
+
+    def __init__(self, capacity: int | None = None):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.checkout_wait = Histogram()
+        self.admission_wait = Histogram()
+        self.timeouts = 0
+        self.waiting = 0
+        self.pool = None
+        self._limiters = weakref.WeakKeyDictionary()
+
+    def observe_checkout(self, wait_ms: float):
+        with self._lock:
+            self.checkout_wait.observe(wait_ms)
+
+    def observe_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    @contextlib.asynccontextmanager
+    async def admission(self):
+        """Hold one of `capacity` session slots for the duration of the block.
+
+        Waiting happens on the event loop, so a request only reaches a worker
+        thread once a connection is guaranteed to be free for it.
+        """
+        if not self.capacity:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = asyncio.Semaphore(self.capacity)
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await limiter.acquire()
+        finally:
+            self.waiting -= 1
+        with self._lock:
+            self.admission_wait.observe((time.perf_counter() - start) * 1000)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {
+                "capacity": self.capacity,
+                "waiting": self.waiting,
+                "timeouts": self.timeouts,
+                "checkout_wait_ms": self.checkout_wait.snapshot(),
+                "admission_wait_ms": self.admission_wait.snapshot(),
+            }
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            data.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return data
+
+
+# one entry per engine built through engine_kwargs ("primary", "async", ...)
+registry = {}
+
+
+def _instrumented(base, stats: PoolStats):
+    # pools rebuilt by engine.dispose() are new instances of this class and keep reporting into `stats`
+    class InstrumentedPool(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.stats = stats
+            stats.pool = self
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except exc.TimeoutError:
+                stats.observe_timeout()
+                raise
+            stats.observe_checkout((time.perf_counter() - start) * 1000)
+            return conn
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def engine_kwargs(url: str, name: str, use_asyncio: bool = False) -> dict:
+    """Keyword arguments for create_engine/create_async_engine for `url`.
+
+    Statistics for the resulting pool are published under `registry[name]`.
+    """
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith("sqlite:")):
+        # in-memory SQLite uses a single shared connection; nothing to size
+        registry.setdefault(name, PoolStats())
+        return {}
+    settings = pool_settings()
+    stats = registry.setdefault(name, PoolStats(settings["pool_size"] + settings["max_overflow"]))
+    pool_cls = _instrumented(AsyncAdaptedQueuePool if use_asyncio else QueuePool, stats)
+    kwargs = dict(settings, poolclass=pool_cls)
+
+    timeout_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+    if timeout_ms and url.startswith("postgres"):
+        if use_asyncio:
+            kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(timeout_ms)}}
+        else:
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+    return kwargs
+
+
+def stats() -> dict:
+    return {name: s.snapshot() for name, s in registry.items()}
+
+
+def admission(name: str):
+    """Async context manager holding a session slot of the pool registered as `name`."""
+    return registry[name].admission()
@@ -0,0 +1,185 @@
+"""Read replicas for GET routes.
+
+Routes that only read take their session from `get_read_db` (or
+`get_async_read_db` in app.main_async), which picks the next healthy replica
+in turn and falls back to the primary when none is configured or available.
+The sync session only connects on its first query, so routes answered from
+the cache take no replica connection.
+
+Read-your-writes: ReadYourWritesMiddleware gives every client that made a
+successful write (POST, PUT, PATCH, DELETE) a short-lived cookie, and while
+it is valid that client's reads go to the primary, so it does not read back
+data the replicas have not replayed yet.
+
+A replica whose connection fails is skipped for DB_REPLICA_RETRY_S seconds.
+On Postgres, DB_REPLICA_MAX_LAG_MS also skips replicas that have fallen
+behind; the lag is checked at most once per DB_REPLICA_CHECK_S per replica.
+
+Settings (all optional):
+
+- DATABASE_REPLICA_URLS   comma-separated replica URLs (default none: all reads use the primary)
+- DB_READ_YOUR_WRITES_S   how long a writer's reads stay on the primary (default 5)
+- DB_REPLICA_RETRY_S      how long a failed replica is skipped (default 30)
+- DB_REPLICA_MAX_LAG_MS   Postgres only; skip replicas further behind than this, 0 = no check (default 0)
+- DB_REPLICA_CHECK_S      how often the lag is checked (default 5)
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+
+log = logging.getLogger(__name__)
+
+URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+READ_YOUR_WRITES_S = float(os.getenv("DB_READ_YOUR_WRITES_S", "5"))
+RETRY_S = float(os.getenv("DB_REPLICA_RETRY_S", "30"))
+MAX_LAG_MS = float(os.getenv("DB_REPLICA_MAX_LAG_MS", "0"))
+CHECK_S = float(os.getenv("DB_REPLICA_CHECK_S", "5"))
+
+COOKIE = "read_primary_until"
+UNSAFE_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+# zero when the replica has replayed everything it received
+_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) * 1000, 0) END"
+)
+
+
+class Replica:
+    """One replica engine and its health: skipped for a while after a failed connection or a lag check."""
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.down_until = 0.0
+        self.lagging = False
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        # AsyncEngine events are registered on the sync engine underneath
+        event.listen(getattr(engine, "sync_engine", engine), "handle_error", self._on_error)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self, reason):
+        self.down_until = time.monotonic() + RETRY_S
+        log.warning("replica %s unavailable for %.0f s: %s", self.name, RETRY_S, reason)
+
+    def _on_error(self, context):
+        # a connection lost mid-request fails that request; later ones go elsewhere
+        if context.is_disconnect:
+            self.mark_down(context.original_exception)
+
+    def _check_due(self) -> bool:
+        if not MAX_LAG_MS or self.engine.dialect.name != "postgresql":
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self.checked_at < CHECK_S:
+                return False
+            self.checked_at = now
+            return True
+
+    def _lag_ok(self, lag_ms) -> bool:
+        self.lagging = lag_ms is not None and lag_ms > MAX_LAG_MS
+        if self.lagging:
+            # skipped until the next check is due
+            self.down_until = time.monotonic() + CHECK_S
+            log.warning("replica %s is %.0f ms behind; skipping it for %.0f s", self.name, lag_ms, CHECK_S)
+        return not self.lagging
+
+    def connect(self):
+        """A checked-out connection (sync engine), or None if the replica is unusable."""
+        try:
+            conn = self.engine.connect()
+        except exc.DBAPIError as error:
+            self.mark_down(error)
+            return None
+        if self._check_due():
+            try:
+                ok = self._lag_ok(conn.exec_driver_sql(_LAG_SQL).scalar())
+                conn.rollback()
+            except exc.DBAPIError as error:
+                ok = False
+                self.mark_down(error)
+            if not ok:
+                conn.close()
+                return None
+        return conn
+
+    async def connect_async(self):
+        """Same as `connect` for an AsyncEngine."""
+        try:
+            conn = await self.engine.connect()
+        except exc.DBAPIError as error:
+            self.mark_down(error)
+            return None
+        if self._check_due():
+            try:
+                ok = self._lag_ok((await conn.exec_driver_sql(_LAG_SQL)).scalar())
+                await conn.rollback()
+            except exc.DBAPIError as error:
+                ok = False
+                self.mark_down(error)
+            if not ok:
+                await conn.close()
+                return None
+        return conn
+
+    def snapshot(self) -> dict:
+        return {
+            "available": self.available(),
+            "lagging": self.lagging,
+            "down_for_s": max(round(self.down_until - time.monotonic(), 1), 0),
+        }
+
+
+class ReplicaSet:
+    def __init__(self, replicas: list):
+        self.replicas = replicas
+        self._turn = itertools.count()
+
+    def candidates(self, request) -> list:
+        """Replicas to try for `request`, in order; empty when it must read from the primary."""
+        if not self.replicas or reads_own_writes(request.cookies):
+            return []
+        start = next(self._turn)
+        n = len(self.replicas)
+        ordered = [self.replicas[(start + i) % n] for i in range(n)]
+        return [r for r in ordered if r.available()]
+
+    def stats(self) -> dict:
+        return {r.name: r.snapshot() for r in self.replicas}
+
+
+def reads_own_writes(cookies: dict) -> bool:
+    """True while the client (given its request cookies) is inside the read-your-writes window of its last write."""
+    try:
+        return float(cookies.get(COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """Plain ASGI middleware setting the read-your-writes cookie on successful writes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not URLS or scope["method"] not in UNSAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + READ_YOUR_WRITES_S
+                cookie = f"{COOKIE}={until:.3f}; Max-Age={int(READ_YOUR_WRITES_S) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,67 @@
+"""Background folding of append-only delta tables.
+
+Some aggregates would otherwise be updated by every write on a hot path:
+each checkout changes today's row in `sales_by_day` and the "order" row
+count. Those writes append a delta row instead (see app.sales and
+app.counts), and a daemon thread in each worker folds the pending deltas
+into the aggregates every ROLLUP_INTERVAL seconds, each fold in its own
+short transaction. Folds from several workers may overlap; each delta is
+still applied once.
+
+Settings (all optional):
+
+- ROLLUP_INTERVAL   seconds between folds (default 5; 0 turns the thread off)
+"""
+import logging
+import os
+import threading
+
+from . import counts, sales
+
+log = logging.getLogger(__name__)
+
+INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "5"))
+
+# each takes a connection inside a transaction and returns how many deltas it folded
+FOLDS = (sales.fold, counts.fold)
+
+
+def fold_all(engine) -> int:
+    folded = 0
+    for fold in FOLDS:
+        with engine.begin() as conn:
+            folded += fold(conn)
+    return folded
+
+
+class Rollup:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def start(self, engine):
+        """Start folding in the background (once per process; later calls do nothing)."""
+        if INTERVAL <= 0:
+            return
+        with self._lock:
+            if self._stop is not None:
+                return
+            self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(engine, self._stop), name="rollup", daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            stop, self._stop = self._stop, None
+        if stop is not None:
+            stop.set()
+
+    def _run(self, engine, stop: threading.Event):
+        while not stop.wait(INTERVAL):
+            try:
+                fold_all(engine)
+            except Exception:
+                # the deltas stay where they are and the next round tries again
+                log.exception("folding deltas failed")
+
+
+worker = Rollup()
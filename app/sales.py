@@ -0,0 +1,232 @@
+"""Sales aggregates: units sold and revenue per book, category, author and day.
+
+The `sales_by_*` tables (see models) are maintained incrementally: crud calls
+`apply` with the order lines it adds or removes, in the same transaction.
+Every checkout would change the same few rows (today's `sales_by_day` row,
+the best-selling categories), so instead of updating them `apply` only
+appends the changes to `sales_delta`, which commits or rolls back with the
+lines and takes no lock another checkout waits for. `fold` adds the pending
+deltas to the aggregates and deletes them; app.rollup runs it every few
+seconds, so analytics lag checkouts by that much. Analytics queries then read
+a few indexed rows from these small tables instead of joining ordering, book
+and author_book on the primary.
+
+Revenue is counted at the price the line was sold at (ordering.price, the
+book's price when the line was recorded), so removing a line later takes
+back exactly what it added, whatever the book costs by then. An author is
+credited with the full units and revenue of each co-written book. `rebuild`
+recomputes everything from the order lines
+(`python -m app.migrations --rebuild-sales`).
+"""
+from collections import defaultdict
+
+from sqlalchemy import func, insert, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+
+TABLES = {
+    "book": (models.sales_by_book, "bookid"),
+    "category": (models.sales_by_category, "categoryid"),
+    "author": (models.sales_by_author, "authorid"),
+    "day": (models.sales_by_day, "day"),
+}
+# top-N sort keys
+METRICS = ("units", "revenue")
+
+
+def apply(db: Session, changes):
+    """Add (+1) or remove (-1) order lines from the aggregates.
+
+    `changes` holds (book_id, order_date, sign, price) tuples, `price` being
+    what the line was sold at (None: the book's current price); lines without
+    a date count everywhere except the per-day table. Does not commit.
+    """
+    changes = [c for c in changes if c[2]]
+    if not changes:
+        return
+    book_ids = {c[0] for c in changes}
+    books = {
+        r.bookID: r
+        for r in db.query(models.Book.bookID, models.Book.price, models.Book.categoryID).filter(
+            models.Book.bookID.in_(book_ids)
+        )
+    }
+    authors = defaultdict(list)
+    ab = models.author_book
+    for book_id, author_id in db.execute(select(ab.c.bookid, ab.c.authorid).where(ab.c.bookid.in_(book_ids))):
+        authors[book_id].append(author_id)
+
+    deltas = {name: defaultdict(lambda: [0, 0]) for name in TABLES}
+
+    def add(name, key, units, revenue):
+        delta = deltas[name][key]
+        delta[0] += units
+        delta[1] += revenue
+
+    for book_id, day, sign, price in changes:
+        book = books.get(book_id)
+        if book is None:
+            continue
+        revenue = sign * (book.price if price is None else price)
+        add("book", book_id, sign, revenue)
+        add("category", book.categoryID, sign, revenue)
+        for author_id in authors[book_id]:
+            add("author", author_id, sign, revenue)
+        if day is not None:
+            add("day", day, sign, revenue)
+    _write(db, deltas)
+
+
+def move_book(db: Session, book_id: int, old_category: int, new_category: int, old_authors, new_authors):
+    """Re-attribute a book's sales after its category or authors changed. Does not commit."""
+    t, d = models.sales_by_book, models.sales_delta
+    # the folded totals plus what is still pending
+    both = union_all(
+        select(t.c.units, t.c.revenue).where(t.c.bookid == book_id),
+        select(d.c.units, d.c.revenue).where(d.c.dimension == "book", d.c.entity_id == book_id),
+    ).subquery()
+    units, revenue = db.execute(
+        select(func.coalesce(func.sum(both.c.units), 0), func.coalesce(func.sum(both.c.revenue), 0))
+    ).one()
+    if units == 0 and revenue == 0:
+        return
+    deltas = {name: {} for name in TABLES}
+    if old_category != new_category:
+        deltas["category"][old_category] = [-units, -revenue]
+        deltas["category"][new_category] = [units, revenue]
+    old_authors, new_authors = set(old_authors), set(new_authors)
+    for author_id in old_authors - new_authors:
+        deltas["author"][author_id] = [-units, -revenue]
+    for author_id in new_authors - old_authors:
+        deltas["author"][author_id] = [units, revenue]
+    _write(db, deltas)
+
+
+def _write(db: Session, deltas: dict):
+    # appended, not added to the aggregates: inserts of new rows do not wait on each other
+    rows = [
+        {
+            "dimension": name,
+            "entity_id": None if name == "day" else k,
+            "day": k if name == "day" else None,
+            "units": units,
+            "revenue": revenue,
+        }
+        for name in TABLES
+        for k, (units, revenue) in deltas[name].items()
+        if units or revenue
+    ]
+    if rows:
+        db.execute(insert(models.sales_delta), rows)
+
+
+def fold(conn: Connection) -> int:
+    """Add the pending deltas to the aggregates and delete them; returns how many were folded.
+
+    Run it in its own transaction (app.rollup does). Concurrent folds are
+    safe on Postgres and SQLite: each delta is deleted, and so counted, by
+    exactly one of them.
+    """
+    d = models.sales_delta
+    columns = (d.c.dimension, d.c.entity_id, d.c.day, d.c.units, d.c.revenue)
+    if conn.dialect.delete_returning:
+        pending = conn.execute(d.delete().returning(*columns)).all()
+    else:
+        last = conn.execute(select(func.max(d.c.id))).scalar()
+        if last is None:
+            return 0
+        pending = conn.execute(select(*columns).where(d.c.id <= last)).all()
+        conn.execute(d.delete().where(d.c.id <= last))
+    deltas = {name: defaultdict(lambda: [0, 0]) for name in TABLES}
+    for dimension, entity_id, day, units, revenue in pending:
+        delta = deltas[dimension][day if dimension == "day" else entity_id]
+        delta[0] += units
+        delta[1] += revenue
+    dialect = conn.dialect.name
+    for name, (table, key) in TABLES.items():
+        # sorted keys: concurrent folds lock the same rows in the same order and cannot deadlock
+        rows = [
+            {key: k, "units": units, "revenue": revenue}
+            for k, (units, revenue) in sorted(deltas[name].items())
+            if units or revenue
+        ]
+        if rows:
+            _upsert_add(conn, dialect, table, key, rows)
+    return len(pending)
+
+
+def _upsert_add(conn: Connection, dialect: str, table, key: str, rows: list):
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={"units": table.c.units + stmt.excluded.units, "revenue": table.c.revenue + stmt.excluded.revenue},
+        )
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = conn.execute(
+            table.update()
+            .where(table.c[key] == row[key])
+            .values(units=table.c.units + row["units"], revenue=table.c.revenue + row["revenue"])
+        )
+        if not updated.rowcount:
+            conn.execute(insert(table), row)
+
+
+def rebuild(conn):
+    """Recompute all aggregates from the order lines."""
+    # the lines already include whatever is pending
+    conn.execute(models.sales_delta.delete())
+    o, b, ab, bo = models.Ordering.__table__, models.Book.__table__, models.author_book, models.BookOrder.__table__
+    # lines recorded before ordering.price existed count at the current price
+    units, revenue = func.count().label("units"), func.sum(func.coalesce(o.c.price, b.c.price)).label("revenue")
+    lines = o.join(b, b.c.bookid == o.c.bookid)
+    sources = {
+        "book": select(o.c.bookid, units, revenue).select_from(lines).group_by(o.c.bookid),
+        "category": select(b.c.categoryid, units, revenue).select_from(lines).group_by(b.c.categoryid),
+        "author": select(ab.c.authorid, units, revenue)
+        .select_from(lines.join(ab, ab.c.bookid == o.c.bookid))
+        .group_by(ab.c.authorid),
+        "day": select(bo.c.orderdate, units, revenue)
+        .select_from(lines.join(bo, bo.c.orderid == o.c.orderid))
+        .where(bo.c.orderdate.is_not(None))
+        .group_by(bo.c.orderdate),
+    }
+    for name, (table, key) in TABLES.items():
+        conn.execute(table.delete())
+        conn.execute(insert(table).from_select([key, "units", "revenue"], sources[name]))
+
+
+def top(db: Session, dimension: str, by: str = "units", limit: int = 10) -> list:
+    """Best sellers for "book", "category" or "author": one index scan plus `limit` name lookups."""
+    table, key = TABLES[dimension]
+    model, id_attr, name_attr = {
+        "book": (models.Book, "bookID", "title"),
+        "category": (models.Category, "categoryID", "categoryDescription"),
+        "author": (models.Author, "authorID", "authorName"),
+    }[dimension]
+    metric = table.c[by]
+    rows = db.execute(
+        select(getattr(model, id_attr), getattr(model, name_attr), table.c.units, table.c.revenue)
+        .join_from(table, model, getattr(model, id_attr) == table.c[key])
+        .where(table.c.units > 0)
+        .order_by(metric.desc(), table.c[key])
+        .limit(limit)
+    )
+    return [{id_attr: r[0], name_attr: r[1], "units": r[2], "revenue": r[3]} for r in rows]
+
+
+def by_day(db: Session, date_from=None, date_to=None, limit: int = 366) -> list:
+    """Units and revenue per day (newest first), optionally within [date_from, date_to]."""
+    t = models.sales_by_day
+    q = select(t.c.day, t.c.units, t.c.revenue)
+    if date_from is not None:
+        q = q.where(t.c.day >= date_from)
+    if date_to is not None:
+        q = q.where(t.c.day <= date_to)
+    rows = db.execute(q.order_by(t.c.day.desc()).limit(limit))
+    return [{"day": r.day, "units": r.units, "revenue": r.revenue} for r in rows]
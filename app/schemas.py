@@ -1,6 +1,6 @@
 from typing import List, Optional
 from datetime import date
-from pydantic import BaseModel
+from pydantic import BaseModel, constr
 
 
 # Author
@@ -19,6 +19,11 @@ class Author(AuthorBase):
         orm_mode = True
 
 
+class AuthorBatch(BaseModel):
+    items: List[Author]
+    missing: List[int]
+
+
 # Category
 class CategoryBase(BaseModel):
     categoryDescription: str
@@ -61,6 +66,65 @@ class Book(BookBase):
         orm_mode = True
 
 
+# One row of a bulk book import (POST /books/bulk). The category is given either
+# by id or by description and authors by name; unknown names are created.
+# Lengths are those of the columns, so an over-long value fails its own row
+# instead of the whole batch at insert time.
+class BookIngestRow(BookBase):
+    categoryID: Optional[int] = None
+    title: constr(max_length=45)
+    isbn: Optional[constr(max_length=45)] = None
+    bookDescription: Optional[constr(max_length=500)] = None
+    category: Optional[constr(max_length=45)] = None
+    authors: List[constr(max_length=45)] = []
+
+
+class IngestError(BaseModel):
+    row: int
+    error: str
+
+
+class IngestResult(BaseModel):
+    rows: int
+    inserted: int
+    authors_created: int
+    categories_created: int
+    error_count: int
+    # capped; error_count has the full number
+    errors: List[IngestError]
+
+
+# Facet counts for a /books/ filter set (GET /books/facets)
+class FacetCount(BaseModel):
+    value: int
+    # category description, author name or price band ("500-999"); none for years
+    label: Optional[str] = None
+    count: int
+
+
+class BookFacets(BaseModel):
+    # number of books matching the filters
+    total: int
+    category: List[FacetCount]
+    author: List[FacetCount]
+    year: List[FacetCount]
+    price: List[FacetCount]
+
+
+# GET /books/batch: books in the order their ids were requested; unknown ids in `missing`
+class BookBatch(BaseModel):
+    items: List[Book]
+    missing: List[int]
+
+
+# PUT /books/{id}/image
+class BookImage(BaseModel):
+    bookID: int
+    # content-addressed name in the image store
+    image: str
+    url: str
+
+
 # Customer
 class CustomerBase(BaseModel):
     firstName: str
@@ -77,14 +141,7 @@ class CustomerCreate(CustomerBase):
     pass
 
 
-class Customer(CustomerBase):
-    customerID: int
-
-    class Config:
-        orm_mode = True
-
-
-# Customer output (excludes password)
+# Customer output, for every customer route: the password hash never leaves the server
 class CustomerOut(BaseModel):
     customerID: int
     firstName: str
@@ -99,6 +156,20 @@ class CustomerOut(BaseModel):
         orm_mode = True
 
 
+# GET /customers/batch
+class CustomerBatch(BaseModel):
+    items: List[CustomerOut]
+    missing: List[int]
+
+
+# Login response: the customer plus a bearer token for later requests
+class LoginResponse(CustomerOut):
+    token: str
+    token_type: str = "bearer"
+    # seconds
+    expires_in: int
+
+
 # BookOrder
 class BookOrderBase(BaseModel):
     customerID: int
@@ -122,9 +193,22 @@ class OrderItem(BaseModel):
     price: int
 
 
+class OrderLine(OrderItem):
+    bookID: int
+
+
+# Order as returned by POST /orders/: header plus its lines and total
+class BookOrderDetail(BookOrder):
+    items: List[OrderLine]
+    total: int
+
+
 class CustomerOrder(BaseModel):
     orderID: int
+    orderDate: Optional[date] = None
     items: List[OrderItem]
+    # sum of the item prices
+    total: int = 0
 
     class Config:
         orm_mode = True
@@ -151,3 +235,50 @@ class OrderingCreate(OrderingBase):
 class Ordering(OrderingBase):
     class Config:
         orm_mode = True
+
+
+# Delta sync (GET /sync): rows changed since the token, and the ids of deleted ones
+class SyncDeleted(BaseModel):
+    authors: List[int]
+    categories: List[int]
+    books: List[int]
+    orders: List[int]
+    orderings: List[OrderingBase]
+
+
+class SyncResult(BaseModel):
+    # pass back as ?since= on the next sync
+    token: str
+    # true if this page was full; sync again right away
+    more: bool
+    authors: List[Author]
+    categories: List[Category]
+    books: List[Book]
+    orders: List[BookOrder]
+    orderings: List[OrderingBase]
+    deleted: SyncDeleted
+
+
+# Sales analytics (GET /analytics/...)
+class SalesFigures(BaseModel):
+    units: int
+    revenue: int
+
+
+class BookSales(SalesFigures):
+    bookID: int
+    title: str
+
+
+class CategorySales(SalesFigures):
+    categoryID: int
+    categoryDescription: str
+
+
+class AuthorSales(SalesFigures):
+    authorID: int
+    authorName: str
+
+
+class DaySales(SalesFigures):
+    day: date
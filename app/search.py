@@ -0,0 +1,207 @@
+"""Full-text book search over titles, descriptions and author names.
+
+The backend is picked from the session's dialect: Postgres uses a GIN-indexed
+tsvector side table (plus a trigram index so the `title` substring filter on
+/books/ is index-assisted too), SQLite uses an FTS5 table; both hold one
+document per book, author names included, and are kept in sync from the crud
+write paths. Anything else falls back to LIKE scans.
+Indexes and side tables are created by a migration (app.migrations).
+Other backends can be plugged in with `register_backend`.
+"""
+import logging
+import re
+
+from sqlalchemy import bindparam, exc, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+log = logging.getLogger(__name__)
+
+
+def _terms(q: str) -> list:
+    return re.findall(r"\w+", (q or "").lower())
+
+
+class SearchBackend:
+    """Interface every search backend implements."""
+
+    def setup(self, conn):
+        """Create whatever indexes or side tables the backend needs (run by app.migrations)."""
+
+    def rebuild(self, conn):
+        """Re-fill side tables from scratch, e.g. after rows were loaded without going through crud."""
+
+    def search(self, db: Session, q: str, skip: int = 0, limit: int = 100) -> list:
+        """Return book ids matching `q`, best match first."""
+        raise NotImplementedError
+
+    def reindex(self, db: Session, book_ids):
+        """Refresh the index entries of the given books (inside the caller's transaction)."""
+
+    def remove(self, db: Session, book_ids):
+        """Drop the index entries of the given books."""
+
+
+class LikeSearchBackend(SearchBackend):
+    # no index support; only meant for dialects without a better option
+    def search(self, db, q, skip=0, limit=100):
+        terms = _terms(q)
+        if not terms:
+            return []
+        qry = db.query(models.Book.bookID).outerjoin(models.Book.authors)
+        for t in terms:
+            pattern = f"%{t}%"
+            qry = qry.filter(
+                models.Book.title.ilike(pattern)
+                | models.Book.bookDescription.ilike(pattern)
+                | models.Author.authorName.ilike(pattern)
+            )
+        qry = qry.distinct().order_by(models.Book.bookID)
+        return [r[0] for r in qry.offset(skip).limit(limit)]
+
+
+class PostgresSearchBackend(SearchBackend):
+    # One tsvector per book in `book_search`, with the author names folded in,
+    # so a query can match title words and author words together ("tolkien
+    # hobbit"), as it does in SQLite's FTS table. Kept in sync from the crud
+    # write paths like book_fts; titles weigh most, then authors, then descriptions.
+    _SOURCE = """
+        SELECT b.bookid,
+               setweight(to_tsvector('simple', coalesce(b.title, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce((SELECT string_agg(a.authorname, ' ')
+                                                         FROM author_book ab JOIN author a ON a.authorid = ab.authorid
+                                                         WHERE ab.bookid = b.bookid), '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(b.bookdescription, '')), 'C')
+        FROM book b
+    """
+
+    def setup(self, conn):
+        conn.execute(text("CREATE TABLE IF NOT EXISTS book_search (bookid integer PRIMARY KEY, document tsvector NOT NULL)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_book_search_document ON book_search USING gin (document)"))
+        # expression indexes of the earlier per-table search, which matched books and authors separately
+        conn.execute(text("DROP INDEX IF EXISTS ix_book_search"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_author_search"))
+        self.rebuild(conn)
+        # pg_trgm only speeds up the /books/?title= substring filter; search works without it
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_book_title_trgm ON book USING gin (title gin_trgm_ops)"))
+        except exc.DBAPIError as error:
+            log.warning("no trigram index on book.title, /books/?title= will scan the table: %s", error.orig)
+
+    def rebuild(self, conn):
+        conn.execute(text("DELETE FROM book_search"))
+        conn.execute(text(f"INSERT INTO book_search(bookid, document) {self._SOURCE}"))
+
+    def search(self, db, q, skip=0, limit=100):
+        terms = _terms(q)
+        if not terms:
+            return []
+        # prefix match on every term so results follow the user as they type
+        tsq = " & ".join(f"{t}:*" for t in terms)
+        sql = text(
+            """
+            SELECT s.bookid
+            FROM book_search s, to_tsquery('simple', :tsq) AS q
+            WHERE s.document @@ q
+            ORDER BY ts_rank(s.document, q) DESC, s.bookid
+            LIMIT :limit OFFSET :skip
+            """
+        )
+        return [r[0] for r in db.execute(sql, {"tsq": tsq, "limit": limit, "skip": skip})]
+
+    def reindex(self, db, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        self.remove(db, book_ids)
+        sql = text(
+            f"INSERT INTO book_search(bookid, document) {self._SOURCE} WHERE b.bookid IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        db.execute(sql, {"ids": book_ids})
+
+    def remove(self, db, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        sql = text("DELETE FROM book_search WHERE bookid IN :ids").bindparams(bindparam("ids", expanding=True))
+        db.execute(sql, {"ids": book_ids})
+
+
+class SqliteFtsBackend(SearchBackend):
+    # rowid of book_fts is the book id
+    _SOURCE = """
+        SELECT b.bookid, b.title, coalesce(b.bookdescription, ''),
+               coalesce((SELECT group_concat(a.authorname, ' ')
+                         FROM author_book ab JOIN author a ON a.authorid = ab.authorid
+                         WHERE ab.bookid = b.bookid), '')
+        FROM book b
+    """
+
+    def setup(self, conn):
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+                "title, description, authors, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        )
+        self.rebuild(conn)
+
+    def rebuild(self, conn):
+        conn.execute(text("DELETE FROM book_fts"))
+        conn.execute(text(f"INSERT INTO book_fts(rowid, title, description, authors) {self._SOURCE}"))
+
+    def search(self, db, q, skip=0, limit=100):
+        terms = _terms(q)
+        if not terms:
+            return []
+        match = " ".join(f'"{t}"*' for t in terms)
+        # bm25 is lower-is-better; titles weigh most, then authors, then description
+        sql = text(
+            "SELECT rowid FROM book_fts WHERE book_fts MATCH :match "
+            "ORDER BY bm25(book_fts, 10.0, 1.0, 5.0), rowid LIMIT :limit OFFSET :skip"
+        )
+        return [r[0] for r in db.execute(sql, {"match": match, "limit": limit, "skip": skip})]
+
+    def reindex(self, db, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        self.remove(db, book_ids)
+        sql = text(
+            f"INSERT INTO book_fts(rowid, title, description, authors) {self._SOURCE} WHERE b.bookid IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        db.execute(sql, {"ids": book_ids})
+
+    def remove(self, db, book_ids):
+        book_ids = list(book_ids)
+        if not book_ids:
+            return
+        sql = text("DELETE FROM book_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True))
+        db.execute(sql, {"ids": book_ids})
+
+
+_registry = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SqliteFtsBackend,
+}
+_instances = {}
+
+
+def register_backend(dialect: str, backend_cls):
+    """Use `backend_cls` for engines of the given dialect name."""
+    _registry[dialect] = backend_cls
+    _instances.pop(dialect, None)
+
+
+def backend_for(bind) -> SearchBackend:
+    """Backend for a Session, Engine or Connection."""
+    if isinstance(bind, Session):
+        bind = bind.get_bind()
+    name = bind.dialect.name
+    if name not in _instances:
+        _instances[name] = _registry.get(name, LikeSearchBackend)()
+    return _instances[name]
+
@@ -0,0 +1,207 @@
+"""In-memory snapshots of the unparameterized catalog pages.
+
+`GET /books/`, `/authors/` and `/categories/` without query parameters
+return the same first page to every client until something in the catalog
+changes. SnapshotMiddleware answers those requests from bytes encoded (and
+gzipped) ahead of time: no session, no query, no serialization. Anything
+with a query string goes through the route as usual.
+
+A snapshot is rebuilt in a background thread, from the primary, when it is
+first asked for and after crud invalidates it (any create, update or delete
+of a book, author or category, and every bulk import batch). Until the new
+one is ready those requests go through the route. Like the entity cache,
+snapshots are per process; CATALOG_SNAPSHOT_TTL bounds how long a worker
+serves a page that another worker's write has changed.
+
+Settings (all optional):
+
+- CATALOG_SNAPSHOT       "0" turns snapshots off (default 1)
+- CATALOG_SNAPSHOT_TTL   seconds before a snapshot is rebuilt anyway (default 30)
+"""
+import gzip
+import logging
+import os
+import threading
+import time
+
+from starlette.requests import cookie_parser
+
+from . import etag, fastjson, pagination, replicas
+from .database import SessionLocal
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CATALOG_SNAPSHOT", "1").lower() not in ("0", "false", "no")
+TTL = float(os.getenv("CATALOG_SNAPSHOT_TTL", "30"))
+
+
+class Snapshot:
+    __slots__ = ("body", "gzipped", "etag", "next_cursor", "expires_at")
+
+    def __init__(self, body: bytes, tag: str, next_cursor: str | None):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.etag = tag
+        self.next_cursor = next_cursor
+        self.expires_at = time.monotonic() + TTL
+
+
+class _Page:
+    """How to build one page: `load(db, limit)` returns its rows, encoded as `schema`."""
+
+    def __init__(self, load, schema, key, version, limit):
+        self.load = load
+        self.schema = schema
+        self.key = key  # row -> cursor key, as the route's X-Next-Cursor
+        self.version = version  # row -> (id, updatedAt), as the route's ETag
+        self.limit = limit
+        self.snapshot = None
+        self.generation = 0
+        self.building = False
+        self.retry_at = 0.0
+
+
+class SnapshotStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}  # path -> _Page
+
+    def register(self, path: str, load, schema, key, version, limit: int):
+        self._pages[path] = _Page(load, schema, key, version, limit)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._pages
+
+    def get(self, path: str) -> Snapshot | None:
+        """The current snapshot of `path`, or None (and a rebuild is started) if there is none."""
+        page = self._pages.get(path)
+        if page is None:
+            return None
+        snapshot = page.snapshot
+        if snapshot is not None and snapshot.expires_at > time.monotonic():
+            return snapshot
+        self._schedule(path, page)
+        return None
+
+    def invalidate(self, *paths: str):
+        """Drop the snapshots of `paths` (all of them if none are given) and rebuild them."""
+        for path in paths or list(self._pages):
+            page = self._pages.get(path)
+            if page is None:
+                continue
+            with self._lock:
+                page.generation += 1
+                page.snapshot = None
+            self._schedule(path, page)
+
+    def _schedule(self, path: str, page: _Page):
+        if not ENABLED:
+            return
+        with self._lock:
+            if page.building or time.monotonic() < page.retry_at:
+                return
+            page.building = True
+        threading.Thread(target=self._build, args=(path, page), name=f"snapshot {path}", daemon=True).start()
+
+    def _build(self, path: str, page: _Page):
+        while True:
+            generation = page.generation
+            try:
+                snapshot = self._encode(page)
+            except Exception:
+                log.exception("catalog snapshot of %s failed", path)
+                snapshot = None
+                # requests keep going through the route; try again in a few seconds
+                page.retry_at = time.monotonic() + min(TTL, 5)
+            with self._lock:
+                if page.generation == generation:
+                    # nothing was invalidated while this one was being built
+                    page.snapshot = snapshot
+                    page.building = False
+                    return
+
+    def _encode(self, page: _Page) -> Snapshot:
+        db = SessionLocal()
+        try:
+            rows = page.load(db, page.limit)
+            body = fastjson.dumps(fastjson.project(rows, fastjson.field_names(page.schema)))
+            tag = etag.compute([page.version(r) for r in rows])
+            next_cursor = pagination.encode_cursor(page.key(rows[-1])) if rows and len(rows) >= page.limit else None
+        finally:
+            db.close()
+        return Snapshot(body, tag, next_cursor)
+
+
+# the pages are registered by app.main
+catalog = SnapshotStore()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            try:
+                return not (q.startswith("q=") and float(q[2:]) == 0)
+            except ValueError:
+                return False
+    return False
+
+
+class SnapshotMiddleware:
+    """Plain ASGI middleware serving the snapshots of `catalog`.
+
+    `routes` is the app's route list; the matching route is put in the scope,
+    as the router would, so metrics label these requests like the others.
+    """
+
+    def __init__(self, app, routes, store: SnapshotStore = catalog):
+        self.app = app
+        self.routes = routes
+        self.store = store
+        self._route_for = {}
+
+    def _route(self, path: str):
+        route = self._route_for.get(path)
+        if route is None:
+            route = next((r for r in self.routes if getattr(r, "path", None) == path and "GET" in r.methods), None)
+            self._route_for[path] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not ENABLED
+            or scope["type"] != "http"
+            or scope["method"] != "GET"
+            or scope["query_string"]
+            or scope["path"] not in self.store
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        # a client in its read-your-writes window may have written through another worker
+        if replicas.COOKIE in headers.get("cookie", "") and replicas.reads_own_writes(cookie_parser(headers["cookie"])):
+            await self.app(scope, receive, send)
+            return
+        snapshot = self.store.get(scope["path"])
+        if snapshot is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope["path"])
+        if route is not None:
+            scope["route"] = route
+        out = [(b"etag", snapshot.etag.encode()), (b"cache-control", b"no-cache"), (b"vary", b"Accept-Encoding")]
+        if etag.matches(headers.get("if-none-match"), snapshot.etag):
+            await send({"type": "http.response.start", "status": 304, "headers": out})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = snapshot.body
+        if _accepts_gzip(headers.get("accept-encoding", "")):
+            body = snapshot.gzipped
+            out.append((b"content-encoding", b"gzip"))
+        if snapshot.next_cursor:
+            out.append((b"x-next-cursor", snapshot.next_cursor.encode()))
+        out += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": out})
+        await send({"type": "http.response.body", "body": body})
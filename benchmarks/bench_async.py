@@ -0,0 +1,89 @@
+"""Throughput of the sync (app.main) vs async (app.main_async) app under load.
+
+Starts each app with uvicorn against the same database and drives it with
+`--concurrency` concurrent clients (httpx) for `--duration` seconds:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_async --concurrency 500
+
+Against SQLite the difference is small because SQLite serializes access;
+the comparison is meant for Postgres.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.common import SessionLocal, percentiles, serve, setup_schema
+from app import models
+
+
+def seed(n_books: int):
+    db = SessionLocal()
+    try:
+        if db.query(models.Book).count() >= n_books:
+            return
+        db.execute(models.Category.__table__.insert(), [{"categorydescription": f"Category {i}"} for i in range(20)])
+        db.execute(models.Author.__table__.insert(), [{"authorname": f"Author {i}"} for i in range(200)])
+        db.execute(
+            models.Book.__table__.insert(),
+            [{"categoryid": i % 20 + 1, "title": f"Book {i}", "price": 100 + i % 900} for i in range(n_books)],
+        )
+        db.execute(
+            models.author_book.insert(),
+            [{"authorid": i % 200 + 1, "bookid": i + 1} for i in range(n_books)],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def drive(base_url: str, concurrency: int, duration: float, n_books: int) -> dict:
+    latencies, errors = [], 0
+    stop = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop:
+                if random.random() < 0.5:
+                    url = f"/books/{random.randint(1, n_books)}"
+                else:
+                    url = f"/books/?limit=20&min_price={random.randint(100, 900)}"
+                start = time.perf_counter()
+                try:
+                    r = await client.get(url)
+                    if r.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / duration, 1), **percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_schema()
+    seed(args.books)
+    results = {}
+    for name, module in (("sync", "app.main:app"), ("async", "app.main_async:app")):
+        with serve(module, args.port) as url:
+            results[name] = asyncio.run(drive(url, args.concurrency, args.duration, args.books))
+    print(json.dumps({"concurrency": args.concurrency, "duration_s": args.duration, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Default vs fast (FAST_JSON) response path for a page of books.
+
+Measures the serialization step on its own (response_model validation plus
+stdlib json vs field projection plus orjson) and whole GET /books/ requests
+through the ASGI app with each mode:
+
+    python -m benchmarks.bench_json --rows 100
+
+Needs pydantic 2 (the default path is reproduced with TypeAdapter).
+"""
+import argparse
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from benchmarks.common import SessionLocal, setup_schema, timed
+from app import crud, fastjson, models, schemas
+
+
+def seed(n_books: int):
+    db = SessionLocal()
+    try:
+        if db.query(models.Book).count() >= n_books:
+            return
+        db.execute(models.Category.__table__.insert(), [{"categorydescription": f"Category {i}"} for i in range(20)])
+        db.execute(models.Author.__table__.insert(), [{"authorname": f"Author {i}"} for i in range(200)])
+        db.execute(
+            models.Book.__table__.insert(),
+            [
+                {
+                    "categoryid": i % 20 + 1,
+                    "title": f"Book {i}",
+                    "isbn": f"978-{i:010d}",
+                    "year": 1950 + i % 70,
+                    "price": 100 + i % 900,
+                    "nopages": 100 + i % 500,
+                    "bookdescription": "A book about things. " * 10,
+                }
+                for i in range(n_books)
+            ],
+        )
+        db.execute(
+            models.author_book.insert(),
+            [{"authorid": i % 200 + 1, "bookid": i + 1} for i in range(n_books)]
+            + [{"authorid": (i + 7) % 200 + 1, "bookid": i + 1} for i in range(n_books)],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_schema()
+    seed(max(args.rows, 1000))
+    db = SessionLocal()
+    try:
+        rows = crud.find_books(db, limit=args.rows)
+    finally:
+        db.close()
+
+    # what FastAPI does with a returned list: validate against response_model, then json-encode
+    adapter = TypeAdapter(list[schemas.Book])
+
+    def default_path():
+        json.dumps(jsonable_encoder(adapter.validate_python(rows, from_attributes=True))).encode()
+
+    def fast_path():
+        fastjson.dumps([fastjson._project(r, fastjson._field_names(schemas.Book)) for r in rows])
+
+    from app.main import app
+
+    client = TestClient(app)
+    results = {"serialize": {}, "request": {}}
+    results["serialize"]["default"] = timed(default_path, args.repeat)
+    results["serialize"]["fast"] = timed(fast_path, args.repeat)
+    for mode in ("default", "fast"):
+        fastjson.ENABLED = mode == "fast"
+        url = f"/books/?limit={args.rows}"
+        assert client.get(url).status_code == 200
+        results["request"][mode] = timed(lambda: client.get(url), args.repeat)
+    fastjson.ENABLED = False
+    print(json.dumps({"rows": args.rows, "orjson": fastjson.orjson is not None, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
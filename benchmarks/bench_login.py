@@ -0,0 +1,97 @@
+"""Login storm: /login throughput and latency while password hashing is saturated.
+
+Starts the app with uvicorn and runs `--concurrency` clients that log in
+over and over, plus a few clients reading /categories/ at the same time. The
+second group shows whether a login storm slows down the rest of the API.
+Since hashing runs on its own small thread pool, it should not.
+
+    python -m benchmarks.bench_login --concurrency 200 --app app.main_async:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.common import SessionLocal, percentiles, serve, setup_schema
+from app import auth, models
+
+
+def seed(n_users: int):
+    db = SessionLocal()
+    try:
+        if db.query(models.Customer).filter(models.Customer.user.like("bench%")).count() >= n_users:
+            return
+        # one hash for everybody keeps seeding fast; verification cost is the same
+        password_hash = auth.hash_password("secret")
+        db.execute(
+            models.Customer.__table__.insert(),
+            [
+                {"firstname": "Bench", "lastname": str(i), "user": f"bench{i}", "password": password_hash}
+                for i in range(n_users)
+            ],
+        )
+        if not db.query(models.Category).first():
+            db.add(models.Category(categoryDescription="Bench"))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def drive(base_url: str, concurrency: int, readers: int, duration: float, n_users: int) -> dict:
+    logins, reads, errors = [], [], 0
+    stop = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency + readers, max_keepalive_connections=concurrency + readers)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+
+        async def request(samples, method, url, **kwargs):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                if r.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            samples.append((time.perf_counter() - start) * 1000)
+
+        async def login_worker():
+            while time.perf_counter() < stop:
+                user = f"bench{random.randrange(n_users)}"
+                await request(logins, "POST", "/login", json={"user": user, "password": "secret"})
+
+        async def read_worker():
+            while time.perf_counter() < stop:
+                await request(reads, "GET", "/categories/?limit=10")
+
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)), *(read_worker() for _ in range(readers)))
+
+    return {
+        "errors": errors,
+        "login": {"requests": len(logins), "per_s": round(len(logins) / duration, 1), **percentiles(logins)},
+        "reads_during_storm": {"requests": len(reads), "per_s": round(len(reads) / duration, 1), **percentiles(reads)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    setup_schema()
+    seed(args.users)
+    with serve(args.app, args.port) as url:
+        result = asyncio.run(drive(url, args.concurrency, args.readers, args.duration, args.users))
+    print(json.dumps({"app": args.app, "concurrency": args.concurrency, "duration_s": args.duration, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Orders per second through crud.create_order with 1, 10 and 100 lines per order.
+
+    python -m benchmarks.bench_orders --seconds 5
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import SessionLocal, setup_schema
+from app import crud, models, schemas
+
+
+def seed(n_books: int) -> int:
+    db = SessionLocal()
+    try:
+        if db.query(models.Book).count() < n_books:
+            db.execute(models.Category.__table__.insert(), [{"categorydescription": "Bench"}])
+            cid = db.query(models.Category.categoryID).first()[0]
+            db.execute(
+                models.Book.__table__.insert(),
+                [{"categoryid": cid, "title": f"Book {i}", "price": 100 + i} for i in range(n_books)],
+            )
+        customer = db.query(models.Customer).first()
+        if customer is None:
+            customer = models.Customer(firstName="Bench", lastName="Customer")
+            db.add(customer)
+        db.commit()
+        return customer.customerID
+    finally:
+        db.close()
+
+
+def run(customer_id: int, book_ids: list, lines: int, seconds: float) -> dict:
+    db = SessionLocal()
+    orders = 0
+    try:
+        stop = time.perf_counter() + seconds
+        start = time.perf_counter()
+        while time.perf_counter() < stop:
+            order = schemas.BookOrderCreate(customerID=customer_id, bookIDs=random.sample(book_ids, lines))
+            crud.create_order(db, order)
+            orders += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    return {"orders": orders, "orders_per_s": round(orders / elapsed, 1), "lines_per_s": round(orders * lines / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--books", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_schema()
+    customer_id = seed(args.books)
+    db = SessionLocal()
+    book_ids = [r[0] for r in db.query(models.Book.bookID)]
+    db.close()
+    results = {f"{n}_lines": run(customer_id, book_ids, n, args.seconds) for n in (1, 10, 100)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare offset and keyset (cursor) pagination on shallow and deep pages.
+
+Two listings: authors by id, and books through find_books sorted by price
+(a non-unique column, so the cursor carries the bookID tie-breaker).
+
+    python -m benchmarks.bench_pagination --page-size 20 --pages 10000
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import SessionLocal, setup_schema, timed
+from app import crud, models
+
+
+def seed_authors(n: int):
+    db = SessionLocal()
+    try:
+        have = db.query(models.Author).count()
+        if have < n:
+            db.execute(
+                models.Author.__table__.insert(),
+                [{"authorname": f"Author {i}"} for i in range(have, n)],
+            )
+            db.commit()
+    finally:
+        db.close()
+
+
+def seed_books(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        if not db.query(models.Category).count():
+            db.execute(models.Category.__table__.insert(), [{"categorydescription": "Bench"}])
+        category_id = db.query(models.Category.categoryID).first()[0]
+        have = db.query(models.Book).count()
+        if have < n:
+            # few distinct prices, so many books share one and the tie-breaker matters
+            db.execute(
+                models.Book.__table__.insert(),
+                [
+                    {"categoryid": category_id, "title": f"Book {i}", "price": rng.randint(1, 500) * 100}
+                    for i in range(have, n)
+                ],
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def compare(pages: int, page_size: int, repeat: int, keys: list, fetch) -> dict:
+    """Timings of `fetch(skip, after)` on page 1 and page `pages`, by offset and by cursor.
+
+    `keys` are the keyset values of every row in listing order.
+    """
+    results = {}
+    for page in (1, pages):
+        skip = (page - 1) * page_size
+        # the cursor a client would hold after reading the previous page
+        after = keys[skip - 1] if skip else None
+        results[f"page_{page}"] = {
+            "offset": timed(lambda: fetch(skip, None), repeat),
+            "cursor": timed(lambda: fetch(0, after), repeat),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_schema()
+    n = args.page_size * args.pages
+    seed_authors(n)
+    seed_books(n)
+
+    db = SessionLocal()
+    try:
+        author_keys = [[r[0]] for r in db.query(models.Author.authorID).order_by(models.Author.authorID)]
+        by_price = db.query(models.Book.price, models.Book.bookID).order_by(models.Book.price, models.Book.bookID)
+        book_keys = [list(r) for r in by_price]
+        results = {
+            "authors": compare(
+                args.pages, args.page_size, args.repeat, author_keys,
+                lambda skip, after: crud.get_authors(db, skip, args.page_size, after=after),
+            ),
+            "books_by_price": compare(
+                args.pages, args.page_size, args.repeat, book_keys,
+                lambda skip, after: crud.find_books(db, skip, args.page_size, sort="price", after=after),
+            ),
+        }
+    finally:
+        db.close()
+    rows = {"authors": len(author_keys), "books": len(book_keys)}
+    print(json.dumps({"page_size": args.page_size, "rows": rows, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Worker startup time: module import time and time until the first response.
+
+The schema is migrated first (as the deploy step would), then for each round a
+fresh interpreter imports the app, and a fresh uvicorn process is started and
+polled until GET /categories/ answers:
+
+    python -m benchmarks.bench_startup --app app.main:app --rounds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.common import setup_schema
+
+
+def import_time(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=dict(os.environ), capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+def first_response(app_module: str, port: int) -> float:
+    url = f"http://127.0.0.1:{port}/categories/?limit=1"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_module, "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ),
+    )
+    try:
+        while time.perf_counter() - start < 30:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except Exception:
+                time.sleep(0.01)
+        raise RuntimeError(f"{app_module} did not answer within 30s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def summary(samples: list) -> dict:
+    return {"median_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    setup_schema()
+    module = args.app.split(":")[0]
+    imports = [import_time(module) for _ in range(args.rounds)]
+    ready = [first_response(args.app, args.port) for _ in range(args.rounds)]
+    print(
+        json.dumps(
+            {"app": args.app, "rounds": args.rounds, "import": summary(imports), "first_response": summary(ready)},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
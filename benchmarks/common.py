@@ -0,0 +1,77 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against DATABASE_URL when it is set, otherwise against a
+throwaway SQLite file. Import this module before anything from `app`.
+"""
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = os.path.join(tempfile.mkdtemp(prefix="bookstore-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}"
+
+from app import migrations  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+
+
+def setup_schema():
+    migrations.upgrade(engine)
+
+
+def timed(fn, repeat: int = 20) -> dict:
+    """Run `fn` `repeat` times and return latency stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pick(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))], 3)
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+@contextlib.contextmanager
+def serve(app_module: str, port: int, workers: int = 1):
+    """Run `uvicorn <app_module>` in a subprocess until the block exits."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_module, "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ),
+    )
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/docs", timeout=1)
+                break
+            except Exception:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError(f"{app_module} did not start")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
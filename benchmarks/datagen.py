@@ -0,0 +1,187 @@
+"""Seeded synthetic bookstore dataset.
+
+The same seed and sizes always produce the same rows, so runs on different
+commits (or against SQLite and Postgres) see identical data:
+
+    python -m benchmarks.datagen --books 100000 --customers 20000 --orders 50000 --seed 1
+    python -m benchmarks.datagen --scale 10 --reset
+
+Rows get explicit ids 1..n; the database must be empty (or pass --reset,
+which deletes all rows first). Every customer can log in as
+`user<customerID>` with password `secret`.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, text
+
+from benchmarks.common import engine, setup_schema
+from app import auth, models, sales, search
+from app import counts as row_counts
+
+# sizes at --scale 1
+DEFAULTS = {
+    "authors": 2000,
+    "categories": 50,
+    "books": 10000,
+    "customers": 2000,
+    "orders": 10000,
+}
+MAX_AUTHORS_PER_BOOK = 3
+MAX_LINES_PER_ORDER = 5
+PASSWORD = "secret"
+BATCH_SIZE = 5000
+
+_WORDS = (
+    "night garden shadow winter empire glass silent river storm golden city letters house mountain "
+    "secret ocean last broken paper iron forest stars long road song fire quiet north summer island"
+).split()
+_FIRST = "Ana Luis Marta Jorge Elena Pablo Lucia Diego Sara Tomas Irene Hugo Clara Mateo Noa Ivan".split()
+_LAST = "Garcia Lopez Martin Sanchez Perez Gomez Ruiz Diaz Moreno Alvarez Romero Navarro Torres Gil".split()
+_CITIES = [("Madrid", "MD"), ("Barcelona", "CT"), ("Sevilla", "AN"), ("Valencia", "VC"), ("Bilbao", "PV")]
+
+# child tables first
+_TABLES = [models.Ordering.__table__, models.BookOrder.__table__, models.Customer.__table__,
+           models.author_book, models.Book.__table__, models.Author.__table__, models.Category.__table__]
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Dataset options, shared with the load driver."""
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every default size")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name}", type=int, default=None, help=f"default {default} x scale")
+
+
+def sizes_from_args(args) -> dict:
+    return {name: getattr(args, name) or max(1, int(default * args.scale)) for name, default in DEFAULTS.items()}
+
+
+def _title(rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 4))).capitalize()[:45]
+
+
+def _insert(conn, table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def counts(conn) -> dict:
+    return {table.name: conn.execute(select(func.count()).select_from(table)).scalar() for table in reversed(_TABLES)}
+
+
+def reset(conn):
+    for table in _TABLES:
+        conn.execute(table.delete())
+    # sync tokens issued for the old dataset mean nothing now
+    conn.execute(models.change_log.delete())
+    row_counts.rebuild(conn)
+
+
+def generate(conn, sizes: dict, seed: int = 1):
+    """Insert a dataset of the given sizes on an empty schema."""
+    rng = random.Random(seed)
+    n_authors, n_categories, n_books = sizes["authors"], sizes["categories"], sizes["books"]
+    n_customers, n_orders = sizes["customers"], sizes["orders"]
+
+    _insert(conn, models.Category.__table__, [
+        {"categoryid": i, "categorydescription": f"{_title(rng)} {i}"[:45]} for i in range(1, n_categories + 1)
+    ])
+    _insert(conn, models.Author.__table__, [
+        {"authorid": i, "authorname": f"{rng.choice(_FIRST)} {rng.choice(_LAST)} {i}"} for i in range(1, n_authors + 1)
+    ])
+    books, links = [], []
+    for i in range(1, n_books + 1):
+        books.append({
+            "bookid": i,
+            # a few large categories and a long tail, like a real catalog
+            "categoryid": min(n_categories, int(rng.paretovariate(1.2))),
+            "title": _title(rng),
+            "isbn": f"978-{rng.randrange(10**10):010d}",
+            "year": rng.randint(1900, 2024),
+            "price": rng.randint(300, 6000),
+            "nopages": rng.randint(60, 1200),
+            "bookdescription": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(10, 60))),
+        })
+        for author_id in rng.sample(range(1, n_authors + 1), min(n_authors, rng.randint(1, MAX_AUTHORS_PER_BOOK))):
+            links.append({"authorid": author_id, "bookid": i})
+    _insert(conn, models.Book.__table__, books)
+    _insert(conn, models.author_book, links)
+
+    # hashing is slow on purpose; one hash shared by everybody costs the same to verify
+    password_hash = auth.hash_password(PASSWORD)
+    customers = []
+    for i in range(1, n_customers + 1):
+        city, state = rng.choice(_CITIES)
+        customers.append({
+            "customerid": i,
+            "firstname": rng.choice(_FIRST),
+            "lastname": rng.choice(_LAST),
+            "zipcode": f"{rng.randrange(1000, 52999):05d}",
+            "city": city,
+            "state": state,
+            "address": f"Calle {rng.choice(_WORDS).capitalize()} {rng.randint(1, 200)}",
+            "user": f"user{i}",
+            "password": password_hash,
+        })
+    _insert(conn, models.Customer.__table__, customers)
+
+    orders, lines = [], []
+    first_day = date(2015, 1, 1)
+    span = (date(2024, 12, 31) - first_day).days
+    for i in range(1, n_orders + 1):
+        customer_id = rng.randint(1, n_customers)
+        orders.append({"orderid": i, "customerid": customer_id, "orderdate": first_day + timedelta(days=rng.randrange(span))})
+        for book_id in rng.sample(range(1, n_books + 1), min(n_books, rng.randint(1, MAX_LINES_PER_ORDER))):
+            lines.append({"bookid": book_id, "orderid": i, "customer_id": customer_id, "price": books[book_id - 1]["price"]})
+    _insert(conn, models.BookOrder.__table__, orders)
+    _insert(conn, models.Ordering.__table__, lines)
+
+    if conn.dialect.name == "postgresql":
+        # explicit ids leave the serial sequences behind; move them past the generated rows
+        for table, column in (("category", "categoryid"), ("author", "authorid"), ("book", "bookid"),
+                              ("customer", "customerid"), ("book_order", "orderid")):
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                              f"(SELECT coalesce(max({column}), 1) FROM {table}))"))
+    # bulk inserts bypass crud, which keeps the search side tables, sales aggregates and row counts up to date
+    search.backend_for(conn).rebuild(conn)
+    sales.rebuild(conn)
+    row_counts.rebuild(conn)
+
+
+def ensure(sizes: dict, seed: int = 1) -> dict:
+    """Migrate, then generate the dataset unless the database already has rows.
+
+    Returns the row counts per table.
+    """
+    setup_schema()
+    with engine.begin() as conn:
+        existing = counts(conn)
+        if any(existing.values()):
+            return existing
+        generate(conn, sizes, seed)
+        return counts(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--reset", action="store_true", help="delete all rows before generating")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    setup_schema()
+    with engine.begin() as conn:
+        if args.reset:
+            reset(conn)
+        elif any(counts(conn).values()):
+            parser.error("the database already has data; pass --reset to replace it")
+    result = ensure(sizes_from_args(args), args.seed)
+    print(json.dumps({"seed": args.seed, "rows": result, "seconds": round(time.perf_counter() - start, 1)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
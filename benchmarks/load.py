@@ -0,0 +1,459 @@
+"""Load driver: every route of the API at a fixed concurrency, one route at a time.
+
+Generates the dataset from `benchmarks.datagen` when the database is empty,
+then sends `--requests` requests to each route (fewer to the expensive ones,
+see `share` below) with `--concurrency` in flight. For each route it reports
+throughput, p50/p95/p99 latency, status codes and database queries per
+request, as JSON that can be saved and compared against another run:
+
+    python -m benchmarks.load --concurrency 20 --output before.json
+    git checkout my-branch
+    python -m benchmarks.load --concurrency 20 --baseline before.json
+
+By default the app runs in-process (httpx over ASGI), which is what makes the
+query counts possible. `--url` drives an already running server instead (for
+Postgres, several workers, a real network); that server's database must hold
+the same generated dataset, and queries are not counted. Reads run first,
+then writes in create / update / delete order, so every run sees the same
+catalog: the rows the writes create are deleted again, through the API or,
+for /books/bulk, directly at the end of the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import struct
+import subprocess
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from importlib import import_module
+from typing import Callable, Optional
+
+import httpx
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks import datagen
+from benchmarks.common import SessionLocal, percentiles
+from app import counts, models, pagination, search
+
+
+@dataclass
+class Scenario:
+    method: str
+    path: str  # route path as declared in app.main, also the key in the report
+    build: Callable  # (ctx, i) -> request dict for httpx, or None when there is nothing to send
+    record: Optional[Callable] = None  # (ctx, request, response), e.g. to remember created ids
+    share: float = 1.0  # fraction of --requests sent to this route
+
+    @property
+    def key(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+class Context:
+    """Random source, dataset sizes and the rows created during the run."""
+
+    def __init__(self, rows: dict, seed: int):
+        self.rng = random.Random(seed)
+        self.n = {
+            "author": rows["author"], "category": rows["category"], "book": rows["book"],
+            "customer": rows["customer"], "order": rows["book_order"],
+        }
+        self.created = {"author": [], "category": [], "book": [], "customer": [], "order": [], "ordering": [], "image": []}
+        self.tokens = []
+
+    def pick(self, kind: str) -> int:
+        # datagen ids are 1..n
+        return self.rng.randint(1, max(1, self.n[kind]))
+
+    def take(self, kind: str, i: int):
+        created = self.created[kind]
+        return created[i % len(created)] if created else None
+
+    def pop(self, kind: str):
+        created = self.created[kind]
+        return created.pop() if created else None
+
+
+_EXPORT_AUTH = {"Authorization": f"Bearer {os.getenv('EXPORT_TOKEN', '')}"}
+
+
+def _get(url: str, **kwargs) -> dict:
+    return {"method": "GET", "url": url, **kwargs}
+
+
+def _book_body(ctx: Context, i: int) -> dict:
+    return {
+        "categoryID": ctx.pick("category"),
+        "title": f"Load book {i}",
+        "isbn": f"979-{i:010d}",
+        "year": 2000 + i % 25,
+        "price": 500 + i % 1000,
+        "noPages": 100 + i % 400,
+        "bookDescription": "written by the load driver",
+        "authorIDs": [ctx.pick("author") for _ in range(1 + i % 2)],
+    }
+
+
+def _customer_body(i: int) -> dict:
+    return {"firstName": "Load", "lastName": str(i), "city": "Madrid", "user": f"load{i}", "password": "secret"}
+
+
+def _book_listing(ctx: Context, i: int) -> dict:
+    # the filters and sorts a catalog page actually uses, in rotation
+    variants = [
+        {},
+        {"category_id": ctx.pick("category")},
+        {"author_id": ctx.pick("author")},
+        {"min_price": 1000, "max_price": 2000, "sort": "price"},
+        {"title": datagen._WORDS[i % len(datagen._WORDS)]},
+        {"year": 1900 + i % 125, "sort": "-price"},
+        {"sort": "title"},
+        {"category_id": ctx.pick("category"), "count": "estimate"},
+    ]
+    return _get("/books/", params={"limit": 20, **variants[i % len(variants)]})
+
+
+def _remember(kind: str, id_field: str):
+    def record(ctx, request, response):
+        if response.status_code == 200:
+            ctx.created[kind].append(response.json()[id_field])
+    return record
+
+
+def _remember_order(ctx, request, response):
+    if response.status_code == 200:
+        body = response.json()
+        ctx.created["order"].append((body["orderID"], body["customerID"], {line["bookID"] for line in body["items"]}))
+
+
+def _update_order(ctx, i):
+    order = ctx.take("order", i)
+    if order is None:
+        return None
+    return {"method": "PUT", "url": f"/orders/{order[0]}", "json": {"customerID": order[1], "orderDate": date.today().isoformat()}}
+
+
+def _delete_order(ctx, i):
+    order = ctx.pop("order")
+    return order and {"method": "DELETE", "url": f"/orders/{order[0]}"}
+
+
+def _new_ordering(ctx, i):
+    order = ctx.take("order", i)
+    if order is None:
+        return None
+    order_id, customer_id, books = order
+    book_id = ctx.pick("book")
+    while book_id in books:
+        book_id = ctx.pick("book")
+    books.add(book_id)
+    return {"method": "POST", "url": "/orderings/", "json": {"bookID": book_id, "orderID": order_id, "customerid": customer_id}}
+
+
+def _remember_ordering(ctx, request, response):
+    if response.status_code == 200:
+        body = request["json"]
+        ctx.created["ordering"].append((body["bookID"], body["orderID"], body["customerid"]))
+
+
+def _remember_token(ctx, request, response):
+    if response.status_code == 200:
+        ctx.tokens.append(response.json()["token"])
+
+
+def _with_token(path: str, method: str = "GET"):
+    def build(ctx, i):
+        if not ctx.tokens:
+            return None
+        token = ctx.tokens[i % len(ctx.tokens)]
+        return {"method": method, "url": path, "headers": {"Authorization": f"Bearer {token}"}}
+    return build
+
+
+def _on_created(kind: str, method: str, url: str, body=None):
+    def build(ctx, i):
+        created = ctx.pop(kind) if method == "DELETE" else ctx.take(kind, i)
+        if created is None:
+            return None
+        request = {"method": method, "url": url.format(*created if isinstance(created, tuple) else (created,))}
+        if body:
+            request["json"] = body(ctx, i)
+        return request
+    return build
+
+
+def _png(i: int) -> bytes:
+    # a 1x1 PNG whose colour depends on i: a few distinct images, the rest deduplicated
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixel = zlib.compress(b"\0" + bytes((i % 8 * 32, 0, 0)))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)) + chunk(b"IDAT", pixel) + chunk(b"IEND", b"")
+
+
+def _upload_image(ctx, i):
+    # onto books the run created (and deletes later), so the catalog stays as generated
+    book = ctx.take("book", i)
+    if book is None:
+        return None
+    return {"method": "PUT", "url": f"/books/{book}/image", "content": _png(i), "headers": {"content-type": "image/png"}}
+
+
+def _remember_image(ctx, request, response):
+    if response.status_code == 200:
+        ctx.created["image"].append(response.json()["url"])
+
+
+def _ids(ctx, kind: str, n: int) -> dict:
+    # an order screen's worth of ids for the batch routes
+    return {"ids": ",".join(str(ctx.pick(kind)) for _ in range(n))}
+
+
+def _bulk_body(ctx, i):
+    lines = [json.dumps({**_book_body(ctx, i * 100 + n), "title": f"Bulk book {i}-{n}"}) for n in range(100)]
+    return {"method": "POST", "url": "/books/bulk", "content": "\n".join(lines).encode(),
+            "headers": {"Content-Type": "application/x-ndjson"}}
+
+
+SCENARIOS = [
+    # reads
+    Scenario("GET", "/authors/", lambda ctx, i: _get("/authors/", params={"limit": 20, "skip": ctx.rng.randrange(ctx.n["author"])})),
+    Scenario("GET", "/authors/{author_id}", lambda ctx, i: _get(f"/authors/{ctx.pick('author')}")),
+    Scenario("GET", "/authors/batch", lambda ctx, i: _get("/authors/batch", params=_ids(ctx, "author", 20))),
+    Scenario("GET", "/categories/", lambda ctx, i: _get("/categories/", params={"limit": 20})),
+    Scenario("GET", "/categories/{category_id}", lambda ctx, i: _get(f"/categories/{ctx.pick('category')}")),
+    Scenario("GET", "/books/", _book_listing),
+    Scenario("GET", "/books/facets", lambda ctx, i: _get("/books/facets", params=(
+        {}, {"category_id": ctx.pick("category")}, {"min_price": 1000, "max_price": 2000})[i % 3])),
+    Scenario("GET", "/books/search", lambda ctx, i: _get("/books/search", params={"q": ctx.rng.choice(datagen._WORDS)})),
+    Scenario("GET", "/books/{book_id}", lambda ctx, i: _get(f"/books/{ctx.pick('book')}")),
+    Scenario("GET", "/books/batch", lambda ctx, i: _get("/books/batch", params=_ids(ctx, "book", 30))),
+    Scenario("GET", "/books/{book_id}/image", lambda ctx, i: _get(f"/books/{ctx.pick('book')}/image"), share=0.1),
+    Scenario("GET", "/customers/", lambda ctx, i: _get("/customers/", params={"limit": 20, "skip": ctx.rng.randrange(ctx.n["customer"])})),
+    Scenario("GET", "/customers/{customer_id}", lambda ctx, i: _get(f"/customers/{ctx.pick('customer')}")),
+    Scenario("GET", "/customers/batch", lambda ctx, i: _get("/customers/batch", params=_ids(ctx, "customer", 20))),
+    Scenario("GET", "/customers/{customer_id}/orders_info", lambda ctx, i: _get(f"/customers/{ctx.pick('customer')}/orders_info")),
+    Scenario("GET", "/orders/", lambda ctx, i: _get("/orders/", params={"limit": 20, "skip": ctx.rng.randrange(ctx.n["order"])})),
+    Scenario("GET", "/orders/{order_id}", lambda ctx, i: _get(f"/orders/{ctx.pick('order')}")),
+    Scenario("GET", "/orderings/", lambda ctx, i: _get("/orderings/", params={"limit": 20})),
+    Scenario("GET", "/analytics/books", lambda ctx, i: _get("/analytics/books", params={"by": ("units", "revenue")[i % 2]})),
+    Scenario("GET", "/analytics/categories", lambda ctx, i: _get("/analytics/categories")),
+    Scenario("GET", "/analytics/authors", lambda ctx, i: _get("/analytics/authors", params={"limit": 20})),
+    Scenario("GET", "/analytics/days", lambda ctx, i: _get("/analytics/days", params={"date_from": "2024-01-01"})),
+    Scenario("GET", "/sync", lambda ctx, i: _get("/sync", params={"since": pagination.encode_cursor([0]), "limit": 200})),
+    # customers and orders need EXPORT_TOKEN, set for the server and this driver alike
+    Scenario("GET", "/export/{kind}", lambda ctx, i: _get(f"/export/{('books', 'customers', 'orders')[i % 3]}", headers=_EXPORT_AUTH), share=0.02),
+    # sessions
+    Scenario("POST", "/login", lambda ctx, i: {"method": "POST", "url": "/login",
+                                               "json": {"user": f"user{ctx.pick('customer')}", "password": datagen.PASSWORD}},
+             record=_remember_token, share=0.25),
+    Scenario("GET", "/me/orders_info", _with_token("/me/orders_info")),
+    Scenario("POST", "/logout", _with_token("/logout", "POST"), share=0.25),
+    # writes: create, update, delete what was created
+    Scenario("POST", "/authors/", lambda ctx, i: {"method": "POST", "url": "/authors/", "json": {"authorName": f"Load author {i}"}},
+             record=_remember("author", "authorID")),
+    Scenario("PUT", "/authors/{author_id}", _on_created("author", "PUT", "/authors/{}", lambda ctx, i: {"authorName": f"Load author {i}b"})),
+    Scenario("POST", "/categories/", lambda ctx, i: {"method": "POST", "url": "/categories/", "json": {"categoryDescription": f"Load {i}"}},
+             record=_remember("category", "categoryID")),
+    Scenario("PUT", "/categories/{category_id}", _on_created("category", "PUT", "/categories/{}", lambda ctx, i: {"categoryDescription": f"Load {i}b"})),
+    Scenario("POST", "/books/", lambda ctx, i: {"method": "POST", "url": "/books/", "json": _book_body(ctx, i)},
+             record=_remember("book", "bookID")),
+    Scenario("PUT", "/books/{book_id}", _on_created("book", "PUT", "/books/{}", _book_body)),
+    Scenario("PUT", "/books/{book_id}/image", _upload_image, record=_remember_image, share=0.1),
+    Scenario("GET", "/images/{name}", lambda ctx, i: ctx.created["image"] and _get(ctx.take("image", i)), share=0.1),
+    Scenario("DELETE", "/books/{book_id}/image", lambda ctx, i: ctx.created["book"] and {
+        "method": "DELETE", "url": f"/books/{ctx.take('book', i)}/image"}, share=0.1),
+    Scenario("POST", "/books/bulk", _bulk_body, share=0.05),
+    Scenario("POST", "/customers/", lambda ctx, i: {"method": "POST", "url": "/customers/", "json": _customer_body(i)},
+             record=_remember("customer", "customerID"), share=0.25),
+    Scenario("PUT", "/customers/{customer_id}", _on_created("customer", "PUT", "/customers/{}", lambda ctx, i: _customer_body(i)), share=0.25),
+    Scenario("POST", "/orders/", lambda ctx, i: {"method": "POST", "url": "/orders/", "json": {
+        "customerID": ctx.pick("customer"), "orderDate": date.today().isoformat(),
+        "bookIDs": sorted({ctx.pick("book") for _ in range(1 + i % 3)})}}, record=_remember_order),
+    Scenario("PUT", "/orders/{order_id}", _update_order),
+    Scenario("POST", "/orderings/", _new_ordering, record=_remember_ordering),
+    Scenario("DELETE", "/orderings/{book_id}/{order_id}/{customer_id}", _on_created("ordering", "DELETE", "/orderings/{}/{}/{}")),
+    Scenario("DELETE", "/orders/{order_id}", _delete_order),
+    Scenario("DELETE", "/books/{book_id}", _on_created("book", "DELETE", "/books/{}")),
+    Scenario("DELETE", "/customers/{customer_id}", _on_created("customer", "DELETE", "/customers/{}"), share=0.25),
+    Scenario("DELETE", "/authors/{author_id}", _on_created("author", "DELETE", "/authors/{}")),
+    Scenario("DELETE", "/categories/{category_id}", _on_created("category", "DELETE", "/categories/{}")),
+]
+
+
+class QueryCounter:
+    """Counts statements sent to any engine in this process."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+async def run_scenario(client, scenario: Scenario, ctx: Context, n: int, concurrency: int, counter) -> dict:
+    requests = [r for r in (scenario.build(ctx, i) for i in range(max(1, int(n * scenario.share)))) if r]
+    if not requests:
+        return {"requests": 0, "skipped": "nothing to send"}
+    samples, statuses, errors = [], {}, 0
+    queue = iter(requests)
+    queries_before = counter.count if counter else 0
+
+    async def worker():
+        nonlocal errors
+        for request in queue:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                errors += 1
+            if scenario.record:
+                scenario.record(ctx, request, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(requests)))))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(requests),
+        "errors": errors,
+        "status": {str(code): count for code, count in sorted(statuses.items())},
+        "per_s": round(len(requests) / elapsed, 1),
+        **percentiles(samples),
+        "queries_per_request": round((counter.count - queries_before) / len(requests), 2) if counter else None,
+    }
+
+
+async def drive(app, url, ctx: Context, n: int, concurrency: int, pattern) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    counter = None
+    if url:
+        client = httpx.AsyncClient(base_url=url, limits=limits, timeout=120)
+    else:
+        counter = QueryCounter()
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120)
+    results = {}
+    async with client:
+        for scenario in SCENARIOS:
+            if pattern and not pattern.search(scenario.key):
+                continue
+            results[scenario.key] = await run_scenario(client, scenario, ctx, n, concurrency, counter)
+    return results
+
+
+async def drive_in_process(app, ctx, n, concurrency, pattern) -> dict:
+    # the app's lifespan runs the startup checks (migrations, pool warm-up) as uvicorn would
+    async with app.router.lifespan_context(app):
+        return await drive(app, None, ctx, n, concurrency, pattern)
+
+
+def remove_bulk_books():
+    # /books/bulk does not return ids, so its books are found by title
+    db = SessionLocal()
+    try:
+        ids = [book_id for (book_id,) in db.query(models.Book.bookID).filter(models.Book.title.like("Bulk book %"))]
+        if ids:
+            db.execute(models.author_book.delete().where(models.author_book.c.bookid.in_(ids)))
+            db.query(models.Book).filter(models.Book.bookID.in_(ids)).delete(synchronize_session=False)
+            search.backend_for(db).remove(db, ids)
+            counts.add(db, "book", -len(ids))
+            db.commit()
+    finally:
+        db.close()
+
+
+def uncovered(app) -> list:
+    """Routes of the app that no scenario exercises."""
+    covered = {s.key for s in SCENARIOS}
+    return sorted(
+        f"{method} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.include_in_schema
+        for method in route.methods
+        if f"{method} {route.path}" not in covered
+    )
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """Per route: this run's throughput and p95 relative to the baseline (1.0 = unchanged)."""
+    out = {}
+    for key, now in results.items():
+        before = baseline.get("routes", {}).get(key)
+        if not before or not now.get("requests") or not before.get("requests"):
+            continue
+        out[key] = {
+            "per_s": round(now["per_s"] / before["per_s"], 2),
+            "p95": round(now["p95_ms"] / before["p95_ms"], 2) if before.get("p95_ms") else None,
+            "queries_per_request": [before.get("queries_per_request"), now.get("queries_per_request")],
+        }
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--url", help="drive a running server at this base URL instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route (scaled down for expensive routes)")
+    parser.add_argument("--routes", help="only routes whose 'METHOD /path' matches this regex")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    datagen.add_arguments(parser)
+    args = parser.parse_args()
+
+    module, _, attr = args.app.partition(":")
+    app = getattr(import_module(module), attr or "app")
+    rows = datagen.ensure(datagen.sizes_from_args(args), args.seed)
+    ctx = Context(rows, args.seed)
+    pattern = re.compile(args.routes) if args.routes else None
+
+    start = time.perf_counter()
+    if args.url:
+        results = asyncio.run(drive(None, args.url, ctx, args.requests, args.concurrency, pattern))
+    else:
+        results = asyncio.run(drive_in_process(app, ctx, args.requests, args.concurrency, pattern))
+    remove_bulk_books()
+    report = {
+        "commit": git_commit(),
+        "app": args.url or args.app,
+        "concurrency": args.concurrency,
+        "requests_per_route": args.requests,
+        "seed": args.seed,
+        "dataset": rows,
+        "seconds": round(time.perf_counter() - start, 1),
+        "errors": sum(r.get("errors", 0) for r in results.values()),
+        "uncovered": uncovered(app),
+        "routes": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(results, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Statements per request on the book read path.
+
+Book reads load authors and category eagerly, so a page costs the same
+number of statements whatever its size or filters; a lazy load creeping back
+in shows up here as a count that grows with the page.
+
+    python -m pytest tests
+"""
+import os
+import tempfile
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bookstore-test-'), 'test.db')}"
+# served from memory otherwise, without reaching the database at all
+os.environ["CATALOG_SNAPSHOT"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.cache import entity_cache  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+SIZES = {"authors": 40, "categories": 5, "books": 200, "customers": 5, "orders": 5}
+
+
+@pytest.fixture(scope="module")
+def client():
+    datagen.ensure(SIZES)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def statements():
+    seen = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    entity_cache.clear()
+    event.listen(engine, "before_cursor_execute", count)
+    yield seen
+    event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.mark.parametrize("limit", [1, 10, 100])
+def test_book_list(client, statements, limit):
+    r = client.get("/books/", params={"limit": limit})
+    assert r.status_code == 200 and len(r.json()) == limit
+    # the page, then the authors of all its books
+    assert len(statements) == 2, statements
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"category_id": 1}, {"author_id": 1}, {"title": "night"}, {"min_price": 0, "max_price": 100000, "sort": "price"}],
+)
+def test_filtered_book_list(client, statements, params):
+    r = client.get("/books/", params={**params, "limit": 50})
+    assert r.status_code == 200 and r.json()
+    assert len(statements) == 2, statements
+
+
+def test_book(client, statements):
+    r = client.get("/books/1")
+    assert r.status_code == 200
+    assert len(statements) == 2, statements
+    # cached now
+    statements.clear()
+    assert client.get("/books/1").status_code == 200
+    assert statements == []
@@ -0,0 +1,138 @@
+"""Read routing between the primary and read replicas.
+
+The replica is a second SQLite file, copied from the primary and then given
+a different author name, so a response shows which database served it.
+
+    python -m pytest tests
+"""
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bookstore-test-'), 'test.db')}"
+# served from memory otherwise, without reaching the database at all
+os.environ["CATALOG_SNAPSHOT"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+
+from app import database, pool, replicas  # noqa: E402
+from app.cache import MISSING, entity_cache  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+
+SIZES = {"authors": 40, "categories": 5, "books": 200, "customers": 5, "orders": 5}
+AUTHOR_ID = 1
+ON_REPLICA = "Replica Name"
+
+
+@pytest.fixture(scope="module")
+def client():
+    datagen.ensure(SIZES)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def replica_url(client):
+    path = os.path.join(tempfile.mkdtemp(prefix="bookstore-replica-"), "replica.db")
+    source, target = sqlite3.connect(engine.url.database), sqlite3.connect(path)
+    source.backup(target)
+    target.execute("UPDATE author SET authorName = ? WHERE authorID = ?", (ON_REPLICA, AUTHOR_ID))
+    target.commit()
+    source.close()
+    target.close()
+    return f"sqlite:///{path}"
+
+
+def _replica(name, url):
+    # built like app.database's, so the pool is registered for admission
+    return replicas.Replica(name, create_engine(url, **pool.engine_kwargs(url, name)))
+
+
+def _use_replicas(monkeypatch, *replica_list):
+    monkeypatch.setattr(database, "read_replicas", replicas.ReplicaSet(list(replica_list)))
+    # the middleware only sets the read-your-writes cookie when replicas are configured
+    monkeypatch.setattr(replicas, "URLS", [r.name for r in replica_list])
+
+
+@pytest.fixture
+def replica(monkeypatch, client, replica_url):
+    r = _replica("test_replica", replica_url)
+    _use_replicas(monkeypatch, r)
+    client.cookies.clear()
+    entity_cache.clear()
+    # nothing was invalidated recently, so replica reads may fill the cache
+    monkeypatch.setattr(entity_cache, "invalidated_at", float("-inf"))
+    yield r
+    r.engine.dispose()
+
+
+def _author_name(client):
+    r = client.get(f"/authors/{AUTHOR_ID}")
+    assert r.status_code == 200, r.text
+    return r.json()["authorName"]
+
+
+def test_reads_go_to_the_replica(client, replica):
+    assert _author_name(client) == ON_REPLICA
+
+
+def test_marked_down_replica_falls_back_to_primary(client, replica):
+    replica.mark_down("test")
+    assert _author_name(client) != ON_REPLICA
+
+
+def test_unreachable_replica_falls_back_to_primary(client, monkeypatch):
+    missing = os.path.join(tempfile.mkdtemp(prefix="bookstore-replica-"), "no", "such", "dir.db")
+    down = _replica("down_replica", f"sqlite:///{missing}")
+    _use_replicas(monkeypatch, down)
+    client.cookies.clear()
+    entity_cache.clear()
+    assert _author_name(client) != ON_REPLICA
+    # skipped from now on rather than tried on every request
+    assert not down.available()
+
+
+def test_cached_route_opens_no_replica_connection(client, replica):
+    _author_name(client)
+    connects = []
+
+    def count(conn):
+        connects.append(conn)
+
+    event.listen(replica.engine, "engine_connect", count)
+    try:
+        assert _author_name(client) == ON_REPLICA
+    finally:
+        event.remove(replica.engine, "engine_connect", count)
+    assert connects == []
+
+
+def test_writer_reads_from_primary(client, replica):
+    r = client.put(f"/authors/{AUTHOR_ID + 1}", json={"authorName": "Written Name"})
+    assert r.status_code == 200, r.text
+    assert replicas.COOKIE in client.cookies
+    # the replica still has the old row; the writer must not see it
+    r = client.get(f"/authors/{AUTHOR_ID + 1}")
+    assert r.json()["authorName"] == "Written Name"
+    assert _author_name(client) != ON_REPLICA
+
+    # other clients keep reading from the replica (once the primary's answer is out of the cache)
+    client.cookies.clear()
+    entity_cache.clear()
+    assert _author_name(client) == ON_REPLICA
+
+
+def test_no_cache_fill_from_replica_after_invalidation(client, replica):
+    _author_name(client)
+    assert entity_cache.get(("author", AUTHOR_ID)) is not MISSING
+
+    # as after a local write: the replica may not have replayed it yet
+    entity_cache.invalidate(("author", AUTHOR_ID))
+    assert _author_name(client) == ON_REPLICA
+    assert entity_cache.get(("author", AUTHOR_ID)) is MISSING